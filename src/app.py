@@ -1,15 +1,19 @@
-from time import sleep
+from time import sleep, time
 from datetime import datetime, timedelta
 import atexit
 import logging
 from queue import Queue
+from typing import Any, Optional
 
 from .loader import load_validate_options
 from .options import AppOptions
 from .client import Client
+from .retry import RetryPolicy
 from .implemented_servers import ServerTypes
 from .server import Server
+from .enums import PollClass
 from .modbus_mqtt import MqttClient
+from .publish_filter import PublishFilter
 from paho.mqtt.enums import MQTTErrorCode
 from paho.mqtt.client import MQTTMessage
 
@@ -52,19 +56,29 @@ def test_different_batch_sizes(client0: Client):
     logger.info(f"done. elapsed time: {time.time()-start},\n{result.registers}\n")
 
 class App:
-    def __init__(self, client_instantiator_callback, server_instantiator_callback, options_rel_path=None) -> None:
+    def __init__(self, client_instantiator_callback, server_instantiator_callback, options_rel_path=None,
+                 options: Optional[AppOptions] = None) -> None:
         self.OPTIONS: AppOptions
-        # Read configuration
-        if options_rel_path:
+        # Read configuration, unless already loaded
+        if options is not None:
+            self.OPTIONS = options
+        elif options_rel_path:
             self.OPTIONS = load_validate_options(options_rel_path)
         else:
             self.OPTIONS = load_validate_options()
 
         self.midnight_sleep_enabled, self.minutes_wakeup_after = self.OPTIONS.midnight_sleep_enabled, self.OPTIONS.midnight_sleep_wakeup_after
         self.pause_interval = self.OPTIONS.pause_interval_seconds
+        self.poll_periods: dict[PollClass, float | None] = {
+            PollClass.REALTIME: 0,
+            PollClass.SLOW: self.OPTIONS.slow_poll_interval_seconds,
+            PollClass.STATIC: None,  # once after connect
+        }
         # midnight_sleep_enabled=True, minutes_wakeup_after=5
 
         self.disconnect_stack = []
+        self.active_faults: dict[str, set[str]] = {}  # per server name, as last published to the fault binary sensors
+        self.publish_filter = PublishFilter(self.OPTIONS.publish_heartbeat_seconds, self.OPTIONS.publish_on_change)
 
         # Setup callbacks
         self.client_instantiator_callback = client_instantiator_callback
@@ -134,11 +148,30 @@ class App:
 
         self.mqtt_client.ensure_connected(self.OPTIONS.mqtt_reconnect_attempts)
 
-        # Publish Discovery Topics
+        self.publish_discovery()
+
+        if self.OPTIONS.gateway_enabled:
+            from .gateway import Gateway
+            self.gateway = Gateway(self.servers + self.disconnected_servers, lambda server: server in self.servers)
+            self.gateway.start(self.OPTIONS.gateway_host, self.OPTIONS.gateway_port)
+
+    def publish_discovery(self) -> None:
+        """Publish the discovery configs of the connected servers, and clear those of removed entities."""
         for server in self.servers:
             self.mqtt_client.publish_discovery_topics(server)
             if server._fault_alarm_bits:
                 self.mqtt_client.publish_fault_discovery(server)
+                if self.OPTIONS.fault_binary_sensors:
+                    self.mqtt_client.publish_fault_binary_discovery(server, server.fault_keys)
+        self.mqtt_client.finish_discovery([server.name for server in self.servers + self.disconnected_servers])
+
+    def republish_discovery(self) -> None:
+        """After Home Assistant came online, publish the discovery configs missing on the broker. Called by the
+        polling thread at the start of a cycle, so servers do not change meanwhile."""
+        if not self.mqtt_client.discovery_check_due():
+            return
+        if self.mqtt_client.forget_missing_discovery():
+            self.publish_discovery()
 
     def loop(self, loop_once=False) -> None:
         if not self.servers or not self.clients:
@@ -148,38 +181,21 @@ class App:
 
         # every read_interval seconds, read the registers and publish to mqtt
         while True:
+            self.republish_discovery()
             for server in self.servers:
                 self.mqtt_client.ensure_connected(self.OPTIONS.mqtt_reconnect_attempts)
                 try:
-                    server.read_batches()
-
-                    for register_name in server.write_parameters:
-                        value = server.read_from_state(register_name)
-                        self.mqtt_client.publish_to_ha(
-                            register_name, value, server)
-                    logger.info(f"Published all Write parameter values for {server.name}")
-                    sleep(READ_INTERVAL)
-
-                    for register_name in server.parameters:
-                        value = server.read_from_state(register_name)
-                        self.mqtt_client.publish_to_ha(
-                            register_name, value, server)
-                    logger.info(f"Published all Read parameter values for {server.name}")
-
-                    if server._fault_alarm_bits:
-                        active, inactive = server.decode_faults()
-                        self.mqtt_client.publish_faults(active, inactive, server)
-                        logger.info(f"Published decoded faults for {server.name}: {len(active)} active, {len(inactive)} inactive")
+                    self.poll_server(server)
                 except Exception as e:
                     logger.error(f"Error reading from {server.name}: {e}")
                     self.disconnect_stack.append(server)
                     continue
             logger.info("")
+            for client in self.clients:
+                self.log_retry_metrics(client)
 
             for disconn_server in self.disconnect_stack:
-                self.servers.remove(disconn_server)
-                self.disconnected_servers.append(disconn_server)
-                self.mqtt_client.publish_availability(False, disconn_server)
+                self.mark_disconnected(disconn_server)
             self.disconnect_stack = []
 
             if loop_once:
@@ -188,18 +204,108 @@ class App:
             sleep(self.pause_interval)
 
             for server in reversed(self.disconnected_servers):
-                logger.info("Retrying connection to %s" % server.name)
-                try:
-                    server.connect()
-                    logger.info("Successfully reconnected to %s" % server.name)
-                    self.servers.append(server)
-                    self.disconnected_servers.remove(server)
-                    self.mqtt_client.publish_availability(True, server)
-                except ConnectionError:
-                    logger.error("Error connecting to server %s. Disable reading until next loop" % server.name)
+                self.reconnect(server)
 
             self.sleep_if_midnight()
 
+    def poll_server(self, server: Server) -> None:
+        """Read the poll classes of _server_ that are due, and publish their values."""
+        poll_classes = server.poll_due(self.poll_periods)
+        server.read_batches(poll_classes)
+        self.publish_server(server, poll_classes)
+
+    def publish_server(self, server: Server, poll_classes: list[PollClass]) -> None:
+        """Publish values of the parameters in _poll_classes_, and decoded faults, from the server's state."""
+        values, faults, sampled_at = self.decode_server(server, poll_classes)
+        self.publish_decoded(server, values, faults, sampled_at)
+
+    def decode_server(
+        self, server: Server, poll_classes: list[PollClass]
+    ) -> tuple[list[tuple[str, Any]], Optional[tuple[list[str], list[str]]], float]:
+        """
+            Decode the parameters in _poll_classes_ from the server's state, write parameters first.
+            Called right after reading them.
+
+            Returns (register name, value) pairs that changed beyond their deadband or are due for a heartbeat,
+            (active, inactive) faults if they were read and changed, and the unix time the values were read.
+        """
+        sampled_at = time()
+        decoded = server.decode_all()
+        values = self.publish_filter.filter(server, [
+            (register_name, decoded[register_name])
+            for register_name in list(server.write_parameters) + list(server.parameters)
+            if server.poll_classes[register_name] in poll_classes
+        ])
+        faults = None
+        if server._fault_alarm_bits and PollClass.REALTIME in poll_classes:
+            faults = server.decode_fault_changes()
+        return values, faults, sampled_at
+
+    def publish_decoded(
+        self,
+        server: Server,
+        values: list[tuple[str, Any]],
+        faults: Optional[tuple[list[str], list[str]]],
+        sampled_at: Optional[float] = None,
+    ) -> None:
+        """Publish values and faults returned by decode_server, read at unix time _sampled_at_ (default now)."""
+        if self.OPTIONS.mqtt_aggregate_state:
+            if values:
+                self.mqtt_client.publish_state_document(values, server, sampled_at)
+        else:
+            for register_name, value in values:
+                self.mqtt_client.publish_to_ha(
+                    register_name, value, server, sampled_at)
+        logger.info(f"Published {len(values)} parameter values for {server.name}")
+
+        if faults is not None:
+            active, inactive = faults
+            self.mqtt_client.publish_faults(active, inactive, server, sampled_at=sampled_at)
+            logger.info(f"Published decoded faults for {server.name}: {len(active)} active, {len(inactive)} inactive")
+            if self.OPTIONS.fault_binary_sensors:
+                self.publish_fault_transitions(server, set(active), set(inactive), sampled_at)
+
+    def publish_fault_transitions(
+        self, server: Server, active: set[str], inactive: set[str], sampled_at: Optional[float] = None
+    ) -> None:
+        """Publish the fault binary sensors of _server_ whose state changed since they were last published."""
+        previous = self.active_faults.get(server.name)
+        changed = {
+            key: key in active
+            for key in active | inactive
+            if previous is None or (key in active) != (key in previous)
+        }
+        self.active_faults[server.name] = active
+        self.mqtt_client.publish_fault_states(changed, server, sampled_at)
+        if changed:
+            logger.info(f"Published {len(changed)} fault transitions for {server.name}")
+
+    def mark_disconnected(self, server: Server) -> None:
+        """Stop reading _server_ until it reconnects, and publish it as unavailable."""
+        self.servers.remove(server)
+        self.disconnected_servers.append(server)
+        self.publish_filter.reset(server)
+        self.mqtt_client.publish_availability(False, server)
+        self.log_retry_metrics(server.connected_client)
+
+    def log_retry_metrics(self, client: Client) -> None:
+        """Log the retry counters of _client_. Logged every cycle, so a flaky bus shows before a server is lost."""
+        logger.info(f"Client {client} retry metrics: {client.retry_metrics.as_dict()}")
+
+    def reconnect(self, server: Server) -> bool:
+        """Try to reconnect a disconnected server. Returns True on success."""
+        logger.info("Retrying connection to %s" % server.name)
+        try:
+            server.connect()
+        except ConnectionError:
+            logger.error("Error connecting to server %s. Disable reading until next loop" % server.name)
+            return False
+        logger.info("Successfully reconnected to %s" % server.name)
+        self.servers.append(server)
+        self.disconnected_servers.remove(server)
+        self.mqtt_client.publish_availability(True, server)
+        return True
+
     def sleep_if_midnight(self) -> None:
         """
         Sleeps if the current time is within 3 minutes before or 5 minutes after midnight.
@@ -232,7 +338,16 @@ class App:
 
 
 def instantiate_clients(OPTIONS: AppOptions) -> list[Client]:
-    return [Client(cl_options) for cl_options in OPTIONS.clients]
+    retry_policy = RetryPolicy.from_app_options(OPTIONS)
+    return record_clients(OPTIONS, [Client(cl_options, retry_policy) for cl_options in OPTIONS.clients])
+
+
+def record_clients(OPTIONS: AppOptions, clients: list) -> list:
+    """Wrap _clients_ in RecordingClients if modbus_record_dir is set."""
+    if not OPTIONS.modbus_record_dir:
+        return clients
+    from .recording import RecordingClient, recording_path
+    return [RecordingClient(client, recording_path(OPTIONS.modbus_record_dir, str(client))) for client in clients]
 
 
 def instantiate_servers(OPTIONS: AppOptions, clients: list[Client]) -> list[Server]:
@@ -244,7 +359,21 @@ def instantiate_servers(OPTIONS: AppOptions, clients: list[Client]) -> list[Serv
 
 if __name__ == "__main__":
     if len(sys.argv) <= 1:  # deployed on homeassistant
-        app = App(instantiate_clients, instantiate_servers)
+        options = load_validate_options()
+        client_instantiator = instantiate_clients
+        if options.modbus_replay_dir:
+            from .recording import instantiate_replay_clients
+            client_instantiator = instantiate_replay_clients
+        if options.engine == "async":
+            from .async_app import AsyncApp, instantiate_async_clients
+            app = AsyncApp(
+                instantiate_replay_clients if options.modbus_replay_dir else instantiate_async_clients,
+                instantiate_servers, options=options)
+        elif options.engine == "threaded":
+            from .threaded_app import ThreadedApp
+            app = ThreadedApp(client_instantiator, instantiate_servers, options=options)
+        else:
+            app = App(client_instantiator, instantiate_servers, options=options)
         app.setup()
         app.connect()
         app.loop()
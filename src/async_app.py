@@ -0,0 +1,227 @@
+"""Asyncio polling engine.
+
+Selected with ``engine: async`` in the add-on options. Every client is polled by
+its own task on a single event loop, using pymodbus' async clients, so a slow
+TCP gateway no longer stalls servers on other clients. Servers sharing a
+client are still polled one after the other, and requests from MQTT writes
+are arbitrated with polling by an ``AsyncTransactionScheduler``.
+
+The event loop runs on a background thread. Code that is not part of the hot
+polling path (server connect and model detection, MQTT writes from paho's
+network thread) keeps calling the blocking ``read``/``write`` interface of
+``AsyncClient``, which schedules the request on the event loop and waits for it.
+"""
+
+import asyncio
+import logging
+import threading
+from time import monotonic
+from typing import Any, Coroutine, Optional
+
+from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusIOException
+
+from .app import App, record_clients
+from .batch_planner import BusTiming
+from .bus_scheduler import AsyncTransactionScheduler, Priority
+from .client import Client
+from .enums import RegisterTypes
+from .options import AppOptions, ModbusRTUOptions, ModbusTCPOptions
+from .retry import RetryMetrics, RetryPolicy
+from .server import Server
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncClient:
+    """
+    Modbus client representation on pymodbus' asyncio clients.
+
+    Provides coroutine read_async/ write_async/ connect_async for the event loop, and the blocking
+    Client interface (read/ write/ connect/ close) for other threads.
+    """
+
+    def __init__(self, cl_options: ModbusTCPOptions | ModbusRTUOptions, retry_policy: RetryPolicy = RetryPolicy()):
+        self.name = cl_options.name
+        self.client: AsyncModbusSerialClient | AsyncModbusTcpClient
+        self.timing: BusTiming = BusTiming.from_client_options(cl_options)
+        self.event_loop: Optional[asyncio.AbstractEventLoop] = None  # set by AsyncApp
+        self.scheduler = AsyncTransactionScheduler()  # all bus access goes through a transaction
+        self.retry_policy = retry_policy
+        self.retry_metrics = RetryMetrics()
+
+        # retried by self.retry_policy only, so an attempt is one request on the bus
+        if isinstance(cl_options, ModbusTCPOptions):
+            self.client = AsyncModbusTcpClient(
+                host=cl_options.host, port=cl_options.port, retries=0)
+        elif isinstance(cl_options, ModbusRTUOptions):
+            self.client = AsyncModbusSerialClient(port=cl_options.port, baudrate=cl_options.baudrate,
+                                                  bytesize=cl_options.bytesize, parity='Y' if cl_options.parity else 'N',
+                                                  stopbits=cl_options.stopbits, retries=0)
+        self.request_timeout: float = self.client.comm_params.timeout_connect  # of one attempt
+
+    async def read_async(self, address, count, slave_id, register_type):
+        """
+            Calls the appropriate read function, based on the register type (input / holding).
+
+            On ModbusIOException: retry according to self.retry_policy without blocking other clients, then raise
+        """
+        logger.debug(f"Reading param from {address=}, {count=} on {slave_id=}, {register_type=}")
+
+        self.retry_metrics.requests += 1
+        start = monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self.scheduler.transaction(Priority.READ):
+                    with self.attempt_timeout(monotonic() - start):
+                        if register_type == RegisterTypes.HOLDING_REGISTER:
+                            return await self.client.read_holding_registers(address=address-1,
+                                                                            count=count,
+                                                                            device_id=slave_id)
+                        elif register_type == RegisterTypes.INPUT_REGISTER:
+                            return await self.client.read_input_registers(address=address-1,
+                                                                          count=count,
+                                                                          device_id=slave_id)
+                        else:
+                            logger.info(f"unsupported register type {register_type}")
+                            raise ValueError(f"unsupported register type {register_type}")
+            except ModbusIOException as e:
+                self.retry_metrics.io_errors += 1
+                delay = self.retry_policy.next_delay(attempt, monotonic() - start)
+                if delay is None:
+                    self.retry_metrics.exhausted += 1
+                    logger.error(f"{self}: giving up reading {address=}, {count=} on {slave_id=} after {attempt} attempts: {e}")
+                    raise
+                self.retry_metrics.retries += 1
+                self.retry_metrics.wait_seconds += delay
+                logger.info(f"{self}: {e}. Retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def write_async(self, values: list[int], address: int, slave_id: int, register_type):
+        """See Client.write"""
+        if not register_type == RegisterTypes.HOLDING_REGISTER:
+            logger.info(f"unsupported write register type {register_type}")
+            raise ValueError(f"unsupported register type {register_type}")
+
+        async with self.scheduler.transaction(Priority.WRITE):
+            return await self.client.write_registers(address=address-1,
+                                                     values=values,
+                                                     device_id=slave_id)
+
+    async def connect_async(self, num_retries=2, sleep_interval=3) -> None:
+        logger.info(f"Connecting to client {self}")
+
+        connected = False
+        for i in range(num_retries):
+            async with self.scheduler.transaction():
+                connected = await self.client.connect()
+            if connected:
+                break
+
+            logger.info(f"Couldn't connect to {self}. Retrying")
+            await asyncio.sleep(sleep_interval)
+
+        if not connected:
+            logger.error(
+                f"Client Connection Issue after {num_retries} attempts.")
+            raise ConnectionError(f"Client {self} Connection Issue")
+
+        logger.info(f"Sucessfully connected to {self}")
+
+    def _run(self, coroutine: Coroutine) -> Any:
+        """Run _coroutine_ on the event loop from another thread, and wait for its result."""
+        if self.event_loop is None:
+            raise RuntimeError(f"Client {self} has no event loop")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.event_loop).result()
+
+    def read(self, address, count, slave_id, register_type):
+        return self._run(self.read_async(address, count, slave_id, register_type))
+
+    def write(self, values: list[int], address: int, slave_id: int, register_type):
+        return self._run(self.write_async(values, address, slave_id, register_type))
+
+    def connect(self, num_retries=2, sleep_interval=3) -> None:
+        self._run(self.connect_async(num_retries, sleep_interval))
+
+    def close(self):
+        logger.info(f"Closing connection to {self}")
+        self.client.close()
+
+    def __str__(self):
+        return f"{self.name}"
+
+    _handle_error_response = Client._handle_error_response
+    attempt_timeout = Client.attempt_timeout
+
+
+class AsyncApp(App):
+    """App polling every client concurrently on an asyncio event loop."""
+
+    def setup(self) -> None:
+        self.event_loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self.event_loop.run_forever, name="modbus-asyncio", daemon=True)
+        self._loop_thread.start()
+
+        # pymodbus' async clients bind to the running event loop, so they are created on it
+        client_instantiator = self.client_instantiator_callback
+
+        async def instantiate_on_loop(options: AppOptions) -> list:
+            return client_instantiator(options)
+
+        self.client_instantiator_callback = lambda options: asyncio.run_coroutine_threadsafe(
+            instantiate_on_loop(options), self.event_loop).result()
+        try:
+            super().setup()
+        finally:
+            self.client_instantiator_callback = client_instantiator
+        for client in self.clients:
+            client.event_loop = self.event_loop
+
+    def loop(self, loop_once=False) -> None:
+        if not self.servers or not self.clients:
+            logger.info(f"In loop but app servers or clients not setup up")
+            raise ValueError(
+                f"In loop but app servers or clients not setup up")
+
+        asyncio.run_coroutine_threadsafe(self._poll_clients(loop_once), self.event_loop).result()
+
+    async def _poll_clients(self, loop_once: bool) -> None:
+        await asyncio.gather(*(self._poll_client(client, loop_once) for client in self.clients))
+
+    async def _poll_client(self, client: AsyncClient, loop_once: bool) -> None:
+        """Poll the servers connected to _client_, in turn, every pause_interval."""
+        while True:
+            await asyncio.to_thread(self.mqtt_client.ensure_connected, self.OPTIONS.mqtt_reconnect_attempts)
+            self.republish_discovery()  # on the event loop, between polls of the other clients
+            for server in [s for s in self.servers if s.connected_client is client]:
+                try:
+                    await self.poll_server_async(server)
+                except Exception as e:
+                    logger.error(f"Error reading from {server.name}: {e}")
+                    self.mark_disconnected(server)
+            logger.info("")
+            self.log_retry_metrics(client)
+
+            if loop_once:
+                break
+
+            await asyncio.sleep(self.pause_interval)
+
+            for server in [s for s in reversed(self.disconnected_servers) if s.connected_client is client]:
+                # connect reads the model through the blocking client interface
+                await asyncio.to_thread(self.reconnect, server)
+
+            await asyncio.to_thread(self.sleep_if_midnight)
+
+    async def poll_server_async(self, server: Server) -> None:
+        poll_classes = server.poll_due(self.poll_periods)
+        await server.read_batches_async(poll_classes)
+        self.publish_server(server, poll_classes)
+
+
+def instantiate_async_clients(OPTIONS: AppOptions) -> list[AsyncClient]:
+    retry_policy = RetryPolicy.from_app_options(OPTIONS)
+    return record_clients(OPTIONS, [AsyncClient(cl_options, retry_policy) for cl_options in OPTIONS.clients])
@@ -1,14 +1,15 @@
-from typing import final, Literal
+from typing import Optional, final
 from .server import Server
-import struct
 import logging
-from .enums import DataType
-from .atess_registers_v2 import PBD_FAULT_ALARM_BITS, PCS_FAULT_ALARM_BITS, ParamRegistry, decode_fault_alarms, atess_param_registry, basic_params, model_code_to_name
+from .codec import decode_registers, encode_value
+from .enums import RegisterTypes
+from .atess_registers_v2 import PBD_FAULT_ALARM_BITS, PCS_FAULT_ALARM_BITS, FaultMasks, ParamRegistry, compile_fault_masks, decode_fault_words, fault_words, atess_param_registry, basic_params, model_code_to_name
 from .custom_sensors import load_custom_params
-from pymodbus.client import ModbusSerialClient
+from .plan_cache import registry_hash
 
 logger = logging.getLogger(__name__)
 
+
 @final
 class AtessInverter(Server):
     # RS485 address is 1-32
@@ -23,6 +24,7 @@ class AtessInverter(Server):
         self._write_parameters = {}
         self._fault_alarm_bits: dict[int, dict[int, str]] = {}
         self._fault_reg_base: int = 181
+        self._fault_masks: FaultMasks = ()  # compiled from the fault bits with the register map
 
     @property
     def manufacturer(self):
@@ -72,116 +74,107 @@ class AtessInverter(Server):
 
         return model_name
     
-    def setup_valid_registers_for_model(self):
-        logger.info(f"{self.model}")
+    def model_group(self) -> str:
+        """Device group of self.model."""
         if "PCS" in self.model:
-            group = "PCS"
-            self._fault_alarm_bits = PCS_FAULT_ALARM_BITS
-            self._fault_reg_base = 181
+            return "PCS"
         elif "PBD" in self.model:
-            group = "PBD"
-            self._fault_alarm_bits = PBD_FAULT_ALARM_BITS
-            self._fault_reg_base = 207
+            return "PBD"
         elif "HPS" in self.model and "HPSTL" not in self.model:
-            group = "HPS"
-            self._fault_alarm_bits = PCS_FAULT_ALARM_BITS
-            self._fault_reg_base = 181
+            return "HPS"
         elif "HPSTL" in self.model:
-            group = "HPSTL"
-        else: 
-            raise ValueError(f"Model {self.model} not in implemented groups [PCS, PBD, HPS, HPSTL]")
+            return "HPSTL"
+        raise ValueError(f"Model {self.model} not in implemented groups [PCS, PBD, HPS, HPSTL]")
+
+    def fault_map(self) -> tuple[dict[int, dict[int, str]], int]:
+        """Fault alarm bits and first fault alarm register of the model's group, ({}, 0) if it has none."""
+        group = self.model_group()
+        if group in ("PCS", "HPS"):
+            return PCS_FAULT_ALARM_BITS, 181
+        if group == "PBD":
+            return PBD_FAULT_ALARM_BITS, 207
+        return {}, 0
+
+    def setup_valid_registers_for_model(self):
+        logger.info(f"{self.model}")
+        group = self.model_group()
+        self._fault_alarm_bits, self._fault_reg_base = self.fault_map()
 
         custom_params = load_custom_params()
         registry = ParamRegistry(registry=atess_param_registry.registry + custom_params)
         self._parameters = registry.build_map(group, is_write_map=False)
         self._write_parameters = registry.build_map(group, is_write_map=True)
+        self._fault_masks = compile_fault_masks(self._fault_alarm_bits, self._fault_reg_base)
         logger.info(f"Built register map for device group {group} ({len(custom_params)} custom).")
 
+    def registry_hash(self):
+        return registry_hash(atess_param_registry.registry + load_custom_params())
+
+    def plan_inputs(self):
+        inputs = super().plan_inputs()
+        inputs["fault_map"] = self.fault_map()  # fault_alarm_bits, fault_reg_base and required_addresses
+        return inputs
+
+    def plan_state(self):
+        state = super().plan_state()
+        state["fault_alarm_bits"] = self._fault_alarm_bits
+        state["fault_reg_base"] = self._fault_reg_base
+        return state
+
+    def restore_plan_state(self, state):
+        self._parameters = state["parameters"]
+        self._write_parameters = state["write_parameters"]
+        self._fault_alarm_bits = state["fault_alarm_bits"]
+        self._fault_reg_base = state["fault_reg_base"]
+        self._fault_masks = compile_fault_masks(self._fault_alarm_bits, self._fault_reg_base)
+        super().restore_plan_state(state)
+
+    def required_addresses(self, register_type):
+        """Fault alarm words are decoded from input state, so they are read even if no parameter covers them."""
+        if register_type != RegisterTypes.INPUT_REGISTER:
+            return []
+        return [self._fault_reg_base + group_num for group_num in self._fault_alarm_bits]
+
+    def fault_words(self) -> tuple[Optional[int], ...]:
+        """Raw fault alarm registers from self.input_state, None where not read."""
+        return fault_words(self.input_state, self.input_addr_extent[0], self._fault_masks)
+
     def decode_faults(self) -> tuple[list[str], list[str]]:
         """Decode fault alarm registers into (active, inactive) fault-key lists.
 
         Reads from self.input_state (populated by read_batches).
         Returns ([], []) if no fault bit map is configured for this model.
         """
-        if not self._fault_alarm_bits or not self.input_state:
+        if not self._fault_masks or not self.input_state:
             return [], []
-        return decode_fault_alarms(self.input_state, self.input_addr_extent[0], self._fault_alarm_bits, self._fault_reg_base)
-
-    def _decoded(cls, registers, dtype):
-        def _decode_u8(registers, low_or_high:Literal["low", "high"]):
-            """ 16-bit register to unsigned 8bit low or high word """
-            if low_or_high == "low":
-                extracted = registers[0] & 0x00FF
-            elif low_or_high == "high":
-                extracted = (registers[0] & 0xFF00) >> 8
-            else:
-                raise ValueError(f"Invalid 8-bit type")
-
-            return extracted
-        
-        def _decode_i8(registers, low_or_high=Literal["low", "high"]):
-            """ Unsigned 32-bit big-endian to int """
-            if low_or_high == "low":
-                extracted = registers[0] & 0x00FF
-            elif low_or_high == "high":
-                extracted = (registers[0] & 0xFF00) >> 8
+        return decode_fault_words(self.fault_words(), self._fault_masks)
 
-            else:
-                raise ValueError(f"Invalid 8-bit type")
+    @property
+    def fault_keys(self) -> list[str]:
+        """Fault keys of all fault alarm bits, in decoding order."""
+        return list(dict.fromkeys(key for _, bits in self._fault_masks for _, key in bits))
 
-            # Convert to signed 8-bit integer
-            if extracted & 0x80:  # Check sign bit
-                extracted -= 0x100  # Convert to negative
+    def decode_fault_changes(self) -> Optional[tuple[list[str], list[str]]]:
+        """decode_faults, or None while the fault alarm registers are unchanged since the last call.
+        The first call after connecting always decodes."""
+        if not self._fault_masks or not self.input_state:
+            return None
+        words = self.fault_words()
+        if words == self._fault_words:
+            return None
+        self._fault_words = words
+        return decode_fault_words(words, self._fault_masks)
+
+    def _decoded(self, registers, dtype):
+        return decode_registers(registers, dtype, self.word_order)
+
+    def _encoded(self, value, dtype):
+        return encode_value(value, dtype, self.word_order)
 
-            return extracted
 
-        def _decode_u16(registers):
-            """ Unsigned 16-bit big-endian to int """
-            return registers[0]
-        
-        def _decode_u32(registers):
-            """ Unsigned 32-bit big-endian to int """
-            low = registers[1]
-            high = registers[0]
-            packed = struct.pack('>HH', high, low)
-            return struct.unpack('>I', packed)[0]
-        
-        def _decode_i16(registers):
-            """ Signed 16-bit big-endian to int """
-            return struct.unpack('>h', struct.pack('>H', registers[0]))[0]
-        
-        def _decode_utf8(registers): # TODO
-            """ Two ASCII chars per 16-bit register """
-            
-            return ModbusSerialClient.convert_from_registers(registers=registers, data_type=ModbusSerialClient.DATATYPE.STRING)   
-
-        if dtype == DataType.U16: return _decode_u16(registers)
-        elif dtype == DataType.I16: return _decode_i16(registers)
-        elif dtype == DataType.I8L: return _decode_i8(registers, "low")
-        elif dtype == DataType.I8H: return _decode_i8(registers, "high")
-        elif dtype == DataType.U8L: return _decode_u8(registers, "low")
-        elif dtype == DataType.U8H: return _decode_u8(registers, "high")
-        elif dtype == DataType.U32: return _decode_u32(registers)
-        elif dtype == DataType.UTF8: return _decode_utf8(registers)
-        else: raise NotImplementedError(f"Data type {dtype} decoding not implemented")
-
-    def _encoded(cls, value, dtype):
-        def _encode_u16(value):
-            """ Unsigned 16-bit big-endian to int """
-            U16_MAX = 2**16-1
-
-            if value > U16_MAX: raise ValueError(f"Cannot write {value=} to U16 register.")
-            elif value < 0:     raise ValueError(f"Cannot write negative {value=} to U16 register.")
-
-            if isinstance(value, float):
-                value = int(value)
-                
-            return [value]
-
-        if dtype==DataType.U16: return _encode_u16(value)
-   
 if __name__ == "__main__":
-    inv = AtessInverter("", "", "", "")
+    from .client import SpoofClient
+    inv = AtessInverter("", "", "", SpoofClient())
     inv.model = "PBD250"
     inv.setup_valid_registers_for_model()
     inv.find_register_extent()
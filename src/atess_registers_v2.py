@@ -27,13 +27,14 @@ registers 56-58 is "HPS/PCS" only).
 """
 
 from dataclasses import dataclass
-from typing import Literal, Set, overload
+from typing import Literal, Optional, Sequence, Set, overload
 
 from .enums import (
     DataType,
     DeviceClass,
     HAEntityType,
     Parameter,
+    PollClass,
     RegisterTypes,
     WriteParameter,
     WriteSelectParameter,
@@ -77,6 +78,9 @@ class ParamWrapped:
     param: Parameter | WriteParameter | WriteSelectParameter
     included_groups: Set[ATESS_DEVICE_GROUP] | None  # None = applicable to all groups
     is_write_param: bool
+    poll_class: PollClass | None = None  # None = default_poll_class(is_write_param)
+    qos: int | None = None  # MQTT QoS of the state, None = the PublishPolicy default of its kind
+    retain: bool | None = None
 
 
 @dataclass
@@ -98,7 +102,14 @@ class ParamRegistry:
             device_in_group = r.included_groups is None or group in r.included_groups
             should_include = (is_write_map == r.is_write_param) and device_in_group
             if should_include:
-                m = m | {r.param_name: r.param}
+                param = r.param
+                if r.poll_class is not None:
+                    param = param | {"poll_class": r.poll_class}  # type: ignore
+                if r.qos is not None:
+                    param = param | {"qos": r.qos}  # type: ignore
+                if r.retain is not None:
+                    param = param | {"retain": r.retain}  # type: ignore
+                m = m | {r.param_name: param}
         return m
 
 
@@ -210,6 +221,7 @@ read_params: list[ParamWrapped] = [
         },
         None,
         False,
+        poll_class=PollClass.STATIC,
     ),
     # --- Holding register 43: DTC (protocol) / Device Type Code --- "all model"
     ParamWrapped(
@@ -225,6 +237,7 @@ read_params: list[ParamWrapped] = [
         },
         None,
         False,
+        poll_class=PollClass.STATIC,
     ),
     # --- Holding register 0: on/off --- "all model"
     ParamWrapped(
@@ -255,6 +268,7 @@ read_params: list[ParamWrapped] = [
         },
         None,
         False,
+        poll_class=PollClass.SLOW,
     ),
     # --- Holding register 83: PV current (calibration) --- "All mode"
     ParamWrapped(
@@ -270,6 +284,7 @@ read_params: list[ParamWrapped] = [
         },
         None,
         False,
+        poll_class=PollClass.SLOW,
     ),
     # --- Input register 17: Battery power --- "all model"
     ParamWrapped(
@@ -316,6 +331,7 @@ read_params: list[ParamWrapped] = [
         },
         None,
         False,
+        poll_class=PollClass.STATIC,
     ),
     # --- Input register 1: Battery voltage --- "all model"
     ParamWrapped(
@@ -498,6 +514,7 @@ read_params: list[ParamWrapped] = [
         },
         None,
         False,
+        poll_class=PollClass.SLOW,
     ),
     # --- Holding register 163: Float charge current limit point setting --- "All mode"
     ParamWrapped(
@@ -513,6 +530,7 @@ read_params: list[ParamWrapped] = [
         },
         None,
         False,
+        poll_class=PollClass.SLOW,
     ),
     # --- Holding register 161: Single PV to off-grid --- "All mode"
     ParamWrapped(
@@ -528,6 +546,7 @@ read_params: list[ParamWrapped] = [
         },
         None,
         False,
+        poll_class=PollClass.SLOW,
     ),
     # --- Input register 162: system battery current --- "PCS"
     ParamWrapped(
@@ -604,6 +623,7 @@ read_params: list[ParamWrapped] = [
         },
         PCS_ONLY,
         False,
+        poll_class=PollClass.SLOW,
     ),
     # --- Input register 22: Power factor symbol --- "HPS/PCS/HPSTL"
     ParamWrapped(
@@ -649,6 +669,7 @@ read_params: list[ParamWrapped] = [
         },
         HPS_PCS,
         False,
+        poll_class=PollClass.SLOW,
     ),
     # --- Input register 4-6: Output voltage UV/VW/WU --- "HPS/PCS/HPSTL"
     ParamWrapped(
@@ -3075,45 +3096,77 @@ PBD_FAULT_ALARM_BITS: dict[int, dict[int, str]] = {
 PCS_FAULT_ALARM_ADDRS = [(181 + 1 + i) for i in range(8)]
 
 
-def decode_fault_alarms(
-    state: list[int],
-    base_addr: int,
-    fault_bits: dict[int, dict[int, str]],
-    fault_reg_base: int = 181,
-) -> tuple[list[str], list[str]]:
-    """Decode fault alarm registers into (active, inactive) fault-key lists.
+# Per fault register: its 1-indexed address and the (mask, fault key) of each named bit.
+FaultMasks = tuple[tuple[int, tuple[tuple[int, str], ...]], ...]
+
+
+def compile_fault_masks(fault_bits: dict[int, dict[int, str]], fault_reg_base: int = 181) -> FaultMasks:
+    """Mask table of _fault_bits_, built once per model.
+
+    The protocol swaps high and low bytes of each fault register, so bit n of the
+    map is tested on the raw register with the mask 1 << ((n + 8) % 16).
+    Fault keys are coerced to the canonical fault-name-key schema here, not per cycle.
+    """
+    return tuple(
+        (
+            fault_reg_base + group_num,
+            tuple(
+                (1 << ((bit_num + 8) % 16), coerce_fault_name_key(fault_name))
+                for bit_num, fault_name in sorted(bit_map.items())
+                if fault_name
+            ),
+        )
+        for group_num, bit_map in fault_bits.items()
+    )
+
+
+def fault_words(state: Sequence[int], base_addr: int, masks: FaultMasks) -> tuple[Optional[int], ...]:
+    """Raw fault registers of _masks_ from register _state_ starting at _base_addr_. None where not read."""
+    words: list[Optional[int]] = []
+    for addr, _ in masks:
+        idx = addr - base_addr
+        if 0 <= idx < len(state):
+            words.append(state[idx])
+        else:
+            logger.warning("Illegal address calculated during fault decoding: %s", idx)
+            words.append(None)
+    return tuple(words)
+
+
+def decode_fault_words(words: Sequence[Optional[int]], masks: FaultMasks) -> tuple[list[str], list[str]]:
+    """Decode raw fault registers into (active, inactive) fault-key lists.
 
-    Swaps high and low bytes of each 16-bit register before decoding.
-    Fault keys are coerced to the canonical fault-name-key schema (no GxDy prefix).
     If a register cannot be read, its bits are treated as inactive so the attribute
     array remains complete.
     """
     active_faults: list[str] = []
     inactive_faults: list[str] = []
-    for group_num, bit_map in fault_bits.items():
-        addr = fault_reg_base + group_num  # 1-indexed address
-        idx = addr - base_addr
-        readable = 0 <= idx < len(state)
-        if not readable:
-            logger.warning("Illegal address calculated during fault decoding: %s", idx)
-            for fault_name in bit_map.values():
-                if fault_name:
-                    inactive_faults.append(coerce_fault_name_key(fault_name))
+    for word, (_, bits) in zip(words, masks):
+        if word is None:
+            inactive_faults.extend(key for _, key in bits)
             continue
-        raw = state[idx]
-        swapped = ((raw & 0xFF) << 8) | ((raw >> 8) & 0xFF)
-        for bit_num in range(16):
-            fault_name = bit_map.get(bit_num)
-            if not fault_name:
-                continue
-            key = coerce_fault_name_key(fault_name)
-            if swapped & (1 << bit_num):
+        for mask, key in bits:
+            if word & mask:
                 active_faults.append(key)
             else:
                 inactive_faults.append(key)
     return active_faults, inactive_faults
 
 
+def decode_fault_alarms(
+    state: Sequence[int],
+    base_addr: int,
+    fault_bits: dict[int, dict[int, str]],
+    fault_reg_base: int = 181,
+) -> tuple[list[str], list[str]]:
+    """Decode fault alarm registers into (active, inactive) fault-key lists.
+
+    Compiles the mask table on every call: servers keep theirs, see compile_fault_masks.
+    """
+    masks = compile_fault_masks(fault_bits, fault_reg_base)
+    return decode_fault_words(fault_words(state, base_addr, masks), masks)
+
+
 # Atess Modbus RTU v3.22 p127 fig 4.1.2 — register 43 (DTC / Device Type Code)
 # maps to a model name string.
 model_code_to_name: dict[int, str] = {
@@ -0,0 +1,188 @@
+"""Gap-aware planning of Modbus read batches.
+
+Instead of reading every register between the lowest and highest parameter
+address, batches are built from the sorted addresses that are actually used.
+A batch is split wherever the unused registers in a gap would take longer on
+the wire than the fixed cost of issuing another request, and no batch exceeds
+the 125-register PDU limit.
+"""
+
+from dataclasses import dataclass
+from typing import Collection, Iterable, Optional
+
+from .enums import RegisterTypes
+from .options import ModbusRTUOptions, ModbusTCPOptions
+
+MAX_READ_COUNT = 125  # registers per read request (Modbus PDU limit)
+
+# Typical slave turnaround between end of request and start of response.
+DEFAULT_TURNAROUND_S = 0.02
+
+# Fixed frame sizes in bytes (excluding the 2 bytes per register of payload)
+RTU_REQUEST_BYTES = 8  # slave id, function code, start addr (2), count (2), crc (2)
+RTU_RESPONSE_BYTES = 5  # slave id, function code, byte count, crc (2)
+TCP_REQUEST_BYTES = 12  # MBAP header (7) + function code, start addr, count
+TCP_RESPONSE_BYTES = 9  # MBAP header (7) + function code, byte count
+
+
+@dataclass(frozen=True)
+class BusTiming:
+    """Cost model for a single read request on a Modbus bus.
+
+    byte_time:      seconds to transmit one byte on the wire
+    frame_overhead: fixed seconds per request (header/crc bytes, inter-frame silence, slave turnaround)
+    """
+
+    byte_time: float
+    frame_overhead: float
+
+    @classmethod
+    def rtu(
+        cls,
+        baudrate: int,
+        bytesize: int = 8,
+        parity: bool = False,
+        stopbits: int = 1,
+        turnaround: float = DEFAULT_TURNAROUND_S,
+    ) -> "BusTiming":
+        """Timing for an RTU line: start bit + data bits + parity bit + stop bits per byte."""
+        bits_per_char = 1 + bytesize + (1 if parity else 0) + stopbits
+        byte_time = bits_per_char / baudrate
+        # t3.5 silence between frames, fixed at 1.75ms above 19200 baud by the spec
+        silence = 3.5 * byte_time if baudrate <= 19200 else 0.00175
+        overhead = (
+            (RTU_REQUEST_BYTES + RTU_RESPONSE_BYTES) * byte_time
+            + 2 * silence
+            + turnaround
+        )
+        return cls(byte_time=byte_time, frame_overhead=overhead)
+
+    @classmethod
+    def tcp(cls, turnaround: float = DEFAULT_TURNAROUND_S) -> "BusTiming":
+        """Timing for Modbus TCP. Bytes are free compared to the round-trip, so gaps never split a batch."""
+        return cls(byte_time=0.0, frame_overhead=turnaround)
+
+    @classmethod
+    def from_client_options(
+        cls, opts: ModbusRTUOptions | ModbusTCPOptions
+    ) -> "BusTiming":
+        if isinstance(opts, ModbusRTUOptions):
+            return cls.rtu(opts.baudrate, opts.bytesize, opts.parity, opts.stopbits)
+        return cls.tcp()
+
+    @property
+    def gap_threshold(self) -> int:
+        """Largest number of unused registers that is cheaper to read than to skip with a new request."""
+        if self.byte_time == 0:
+            return MAX_READ_COUNT
+        return int(self.frame_overhead // (2 * self.byte_time))
+
+    def read_time(self, count: int) -> float:
+        """Estimated wire time of one read request for _count_ registers."""
+        return self.frame_overhead + 2 * count * self.byte_time
+
+
+# 9600 8N1, the most common Atess RS485 setting. Used when a client does not specify timing.
+DEFAULT_TIMING = BusTiming.rtu(9600)
+
+
+def register_spans(
+    parameters: dict,
+    register_type: RegisterTypes,
+    extra_addrs: Iterable[int] = (),
+    holes: Collection[int] = (),
+) -> list[tuple[int, int]]:
+    """Sorted, merged (first, last) address spans covered by parameters of one register type.
+
+    extra_addrs are single registers that must be read even though no parameter refers to them (e.g. fault words).
+    holes are addresses that cannot be read; they are cut out of the spans.
+    """
+    spans = [
+        (p["addr"], p["addr"] + p["count"] - 1)
+        for p in parameters.values()
+        if p["register_type"] == register_type
+    ]
+    spans.extend((a, a) for a in extra_addrs)
+    spans.sort()
+
+    merged: list[tuple[int, int]] = []
+    for first, last in spans:
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+
+    if not holes:
+        return merged
+    cut: list[tuple[int, int]] = []
+    for first, last in merged:
+        start = first
+        for a in range(first, last + 1):
+            if a in holes:
+                if start < a:
+                    cut.append((start, a - 1))
+                start = a + 1
+        if start <= last:
+            cut.append((start, last))
+    return cut
+
+
+def plan_batches(
+    spans: list[tuple[int, int]],
+    timing: Optional[BusTiming] = None,
+    max_count: int = MAX_READ_COUNT,
+    holes: Collection[int] = (),
+    breaks: Collection[int] = (),
+) -> tuple[range, ...]:
+    """Group sorted address spans into read batches.
+
+    A new batch is started when the gap to the next span exceeds timing.gap_threshold, when the gap
+    contains an address in _holes_, or when extending the batch would exceed max_count registers.
+    Spans longer than max_count are split over several batches. No batch reads across an address in
+    _breaks_: a batch reading one starts at it.
+    """
+    if timing is None:
+        timing = DEFAULT_TIMING
+    threshold = timing.gap_threshold
+    if breaks:
+        spans = split_spans(spans, breaks)
+
+    batches: list[range] = []
+    start: Optional[int] = None
+    end = 0
+    for first, last in spans:
+        if start is not None:
+            gap = first - end - 1
+            if (
+                gap <= threshold
+                and last - start + 1 <= max_count
+                and not any(a in holes for a in range(end + 1, first))
+                and not any(a in breaks for a in range(end + 1, first + 1))
+            ):
+                end = last
+                continue
+            batches.append(range(start, end + 1))
+        start, end = first, last
+        while end - start + 1 > max_count:
+            batches.append(range(start, start + max_count))
+            start += max_count
+    if start is not None:
+        batches.append(range(start, end + 1))
+    return tuple(batches)
+
+
+def split_spans(spans: list[tuple[int, int]], breaks: Collection[int]) -> list[tuple[int, int]]:
+    """Split sorted address spans so that every address in _breaks_ starts a span."""
+    split: list[tuple[int, int]] = []
+    for first, last in spans:
+        for b in sorted(b for b in breaks if first < b <= last):
+            split.append((first, b - 1))
+            first = b
+        split.append((first, last))
+    return split
+
+
+def wasted_registers(batches: Iterable[range], spans: list[tuple[int, int]]) -> int:
+    """Number of registers read by _batches_ that lie outside every span."""
+    used = {a for first, last in spans for a in range(first, last + 1)}
+    return sum(1 for b in batches for a in b if a not in used)
@@ -0,0 +1,93 @@
+"""Arbitration of Modbus transactions on one client.
+
+The poll loop reads batches while paho's network thread handles command
+messages by writing (and reading back) registers on the same client. A
+``TransactionScheduler`` makes every request on a client a transaction that
+holds the bus alone, so RTU frames of two requests never interleave. Waiting
+writes are let onto the bus before waiting reads: a write issued during a poll
+goes out after the batch in flight, not after the rest of the cycle.
+
+``AsyncTransactionScheduler`` does the same for the tasks of the asyncio engine.
+"""
+
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    WRITE = 0
+    READ = 1
+
+
+class TransactionScheduler:
+    """One transaction on the bus at a time. Waiting writes go first."""
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._busy = False
+        self._waiting_writes = 0
+
+    @contextmanager
+    def transaction(self, priority: Priority = Priority.READ) -> Iterator[None]:
+        """Hold the bus for the duration of the with block."""
+        with self._condition:
+            if priority == Priority.WRITE:
+                self._waiting_writes += 1
+            try:
+                while self._busy or (priority == Priority.READ and self._waiting_writes):
+                    self._condition.wait()
+            finally:
+                if priority == Priority.WRITE:
+                    self._waiting_writes -= 1
+            self._busy = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+    @property
+    def waiting_writes(self) -> int:
+        return self._waiting_writes
+
+
+class AsyncTransactionScheduler:
+    """TransactionScheduler for coroutines on one event loop."""
+
+    def __init__(self) -> None:
+        self._condition: Optional[asyncio.Condition] = None  # created on the event loop
+        self._busy = False
+        self._waiting_writes = 0
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @asynccontextmanager
+    async def transaction(self, priority: Priority = Priority.READ) -> AsyncIterator[None]:
+        """Hold the bus for the duration of the async with block."""
+        async with self.condition:
+            if priority == Priority.WRITE:
+                self._waiting_writes += 1
+            try:
+                await self.condition.wait_for(
+                    lambda: not self._busy and (priority == Priority.WRITE or not self._waiting_writes))
+            finally:
+                if priority == Priority.WRITE:
+                    self._waiting_writes -= 1
+            self._busy = True
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self._busy = False
+                self.condition.notify_all()
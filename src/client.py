@@ -1,12 +1,16 @@
-from typing import Optional
+from contextlib import contextmanager
+from typing import Iterator, Optional
 from .enums import RegisterTypes
+from .batch_planner import BusTiming, DEFAULT_TIMING
+from .bus_scheduler import Priority, TransactionScheduler
+from .retry import RetryMetrics, RetryPolicy
 from .options import ModbusTCPOptions, ModbusRTUOptions
 from pymodbus.client import ModbusSerialClient, ModbusTcpClient
 from pymodbus.pdu import ExceptionResponse, ModbusPDU
 from pymodbus.exceptions import ModbusIOException
 import logging
 from .options import ModbusTCPOptions, ModbusRTUOptions
-from time import sleep
+from time import monotonic, sleep
 logger = logging.getLogger(__name__)
 
 # Enable pymodbus logging
@@ -25,60 +29,82 @@ class Client:
         fan out dictionary information, and decode/ encode register values when reading/ writing/
     """
 
-    def __init__(self, cl_options: ModbusTCPOptions | ModbusRTUOptions):
+    def __init__(self, cl_options: ModbusTCPOptions | ModbusRTUOptions, retry_policy: RetryPolicy = RetryPolicy()):
         """
             Initialised from modbus_mqtt.loader.ClientOptions object
 
             Parameters:
             -----------
                 - cl_options: modbus_mqtt.loader.ClientOptions - options as read from config json
+                - retry_policy: RetryPolicy - retries of reads failing with ModbusIOException
 
             TODO move to classmethod, to separate home-assistant dependency out
         """
         self.name = cl_options.name
         self.client: ModbusSerialClient | ModbusTcpClient
+        self.timing: BusTiming = BusTiming.from_client_options(cl_options)  # used for planning read batches
+        self.scheduler = TransactionScheduler()  # all bus access goes through a transaction
+        self.retry_policy = retry_policy
+        self.retry_metrics = RetryMetrics()
 
+        # retried by self.retry_policy only, so an attempt is one request on the bus
         if isinstance(cl_options, ModbusTCPOptions):
             self.client = ModbusTcpClient(
-                host=cl_options.host, port=cl_options.port)
+                host=cl_options.host, port=cl_options.port, retries=0)
         elif isinstance(cl_options, ModbusRTUOptions):
             self.client = ModbusSerialClient(port=cl_options.port, baudrate=cl_options.baudrate,
                                              bytesize=cl_options.bytesize, parity='Y' if cl_options.parity else 'N',
-                                             stopbits=cl_options.stopbits)
+                                             stopbits=cl_options.stopbits, retries=0)
+        self.request_timeout: float = self.client.comm_params.timeout_connect  # of one attempt
 
     def read(self, address, count, slave_id, register_type):
         """
             Calls the appropriate read function, based on the register type (input / holding).
 
-            On ModbusIOException: wait 20s and retry
+            On ModbusIOException: retry according to self.retry_policy, then raise to the caller
         """
         logger.debug(f"Reading param from {address=}, {count=} on {slave_id=}, {register_type=}")
 
-        need_result = True
-        while need_result:
+        self.retry_metrics.requests += 1
+        start = monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
             try:
-                if register_type == RegisterTypes.HOLDING_REGISTER:
-                    result = self.client.read_holding_registers(address=address-1,
+                with self.scheduler.transaction(Priority.READ), self.attempt_timeout(monotonic() - start):
+                    if register_type == RegisterTypes.HOLDING_REGISTER:
+                        return self.client.read_holding_registers(address=address-1,
+                                                                  count=count,
+                                                                  device_id=slave_id)
+                    elif register_type == RegisterTypes.INPUT_REGISTER:
+                        return self.client.read_input_registers(address=address-1,
                                                                 count=count,
                                                                 device_id=slave_id)
-                elif register_type == RegisterTypes.INPUT_REGISTER:
-                    result = self.client.read_input_registers(address=address-1,
-                                                            count=count,
-                                                            device_id=slave_id)
-                else:
-                    logger.info(f"unsupported register type {register_type}")
-                    raise ValueError(f"unsupported register type {register_type}")
-                
-                # no IOexception:
-                need_result = False
+                    else:
+                        logger.info(f"unsupported register type {register_type}")
+                        raise ValueError(f"unsupported register type {register_type}")
             except ModbusIOException as e:
-                need_result = True
-                logger.info(str(e))
-                logger.info(f"Sleep 20s and retry")
-                sleep(20)
+                self.retry_metrics.io_errors += 1
+                delay = self.retry_policy.next_delay(attempt, monotonic() - start)
+                if delay is None:
+                    self.retry_metrics.exhausted += 1
+                    logger.error(f"{self}: giving up reading {address=}, {count=} on {slave_id=} after {attempt} attempts: {e}")
+                    raise
+                self.retry_metrics.retries += 1
+                self.retry_metrics.wait_seconds += delay
+                logger.info(f"{self}: {e}. Retry {attempt} in {delay:.2f}s")
+                sleep(delay)
+
+    @contextmanager
+    def attempt_timeout(self, elapsed: float) -> Iterator[None]:
+        """Cut the response timeout of the pymodbus client to the retry budget left, _elapsed_ seconds into a
+        request. Hold the bus while in it."""
+        self.client.comm_params.timeout_connect = self.retry_policy.attempt_timeout(self.request_timeout, elapsed)
+        try:
+            yield
+        finally:
+            self.client.comm_params.timeout_connect = self.request_timeout
 
-        return result
-    
     def write(self, values: list[int], address: int, slave_id: int, register_type):
         """Writes a list of encoded ints to 16-bit registers, 
         starting at the 1-indexed address specified
@@ -99,16 +125,19 @@ class Client:
             logger.info(f"unsupported write register type {register_type}")
             raise ValueError(f"unsupported register type {register_type}")
         
-        result = self.client.write_registers(address=address-1,
-                                            values=values,
-                                            device_id=slave_id)
+        # queued ahead of waiting reads, so it goes out after the batch in flight
+        with self.scheduler.transaction(Priority.WRITE):
+            result = self.client.write_registers(address=address-1,
+                                                values=values,
+                                                device_id=slave_id)
         return result
 
     def connect(self, num_retries=2, sleep_interval=3) -> None:
         logger.info(f"Connecting to client {self}")
 
         for i in range(num_retries):
-            connected: bool = self.client.connect()
+            with self.scheduler.transaction():
+                connected: bool = self.client.connect()
             if connected:
                 break
 
@@ -132,7 +161,8 @@ class Client:
         """
         return f"{self.name}"
 
-    def _handle_error_response(self, result):
+    def _handle_error_response(self, result) -> Optional[int]:
+        """Log the modbus exception in _result_. Returns its exception code, or None for non-standard errors."""
         if isinstance(result, ExceptionResponse):
             exception_code = result.exception_code
 
@@ -154,9 +184,11 @@ class Client:
                 exception_code, "Unknown Exception")
             logger.error(
                 f"Modbus Exception Code {exception_code}: {error_message}")
+            return exception_code
         else:
             logger.error(
                 f"Non Standard Modbus Exception. Cannot Decode Response")
+            return None
 
 
 class SpoofClient:
@@ -174,6 +206,8 @@ class SpoofClient:
 
     def __init__(self):
         self.name = "client1"
+        self.timing: BusTiming = DEFAULT_TIMING
+        self.retry_metrics = RetryMetrics()
 
     def read(self, address, count, slave_id, register_type):
         logger.debug(f"SPOOFING READ")
@@ -0,0 +1,114 @@
+"""Encoding and decoding of values in 16-bit Modbus registers.
+
+Every fixed size DataType maps to a ``struct`` code. Bytes within a register
+are always big endian. The word order of values spanning several registers
+is configured per server:
+
+- ``big``: most significant register first (the Modbus convention, and the
+  Atess default)
+- ``little``: least significant register first
+
+With little word order, the registers laid out little endian in memory hold the
+value little endian as well, so both orders decode with a single ``struct``
+format over a byte view of the registers: ``>`` over a big-endian view, ``<``
+over a little-endian view. 8-bit values sit in the high or low byte of their
+register, whose offset depends on the view.
+"""
+
+import struct
+import sys
+from array import array
+from typing import Literal, Mapping, Optional, Sequence, Union
+
+from .enums import DataType
+
+WordOrder = Literal["big", "little"]
+WORD_ORDERS: tuple[WordOrder, ...] = ("big", "little")
+
+# struct code, byte offset within the parameter's first register of a big-endian view
+STRUCT_CODES: dict[DataType, tuple[str, int]] = {
+    DataType.U8H: ("B", 0),
+    DataType.U8L: ("B", 1),
+    DataType.I8H: ("b", 0),
+    DataType.I8L: ("b", 1),
+    DataType.U16: ("H", 0),
+    DataType.I16: ("h", 0),
+    DataType.U32: ("I", 0),
+    DataType.I32: ("i", 0),
+    DataType.U64: ("Q", 0),
+    DataType.I64: ("q", 0),
+    DataType.F32: ("f", 0),
+    DataType.F64: ("d", 0),
+}
+FLOAT_CODES = frozenset("fd")
+
+
+def byte_order(word_order: WordOrder) -> str:
+    """struct byte order prefix of a register view for _word_order_."""
+    if word_order not in WORD_ORDERS:
+        raise ValueError(f"Unknown word order {word_order!r}, expected one of {WORD_ORDERS}")
+    return ">" if word_order == "big" else "<"
+
+
+def struct_code(
+    dtype: DataType, word_order: WordOrder = "big", codes: Mapping[DataType, tuple[str, int]] = STRUCT_CODES
+) -> tuple[str, int]:
+    """struct code of _dtype_ in _codes_ and its byte offset within its first register, in a view for _word_order_."""
+    code, offset = codes[dtype]
+    if word_order == "little" and struct.calcsize(code) == 1:
+        offset ^= 1  # high byte is the second byte of a little-endian register
+    return code, offset
+
+
+def register_view(
+    image: Sequence[int], word_order: WordOrder = "big", scratch: Optional[array] = None
+) -> memoryview:
+    """
+    16-bit registers as a byte buffer for _word_order_ (big- or little-endian registers).
+
+    An array('H') already in that byte order on this host is viewed without copying. Otherwise it is byte swapped
+    into _scratch_, if that has the same length.
+    """
+    if not isinstance(image, array):
+        image = array("H", image)
+    if sys.byteorder == word_order:
+        return memoryview(image)
+    if scratch is None or len(scratch) != len(image):
+        scratch = array("H", image)
+    else:
+        scratch[:] = image  # same length, in place
+    scratch.byteswap()
+    return memoryview(scratch)
+
+
+def decode_registers(registers: Sequence[int], dtype: DataType, word_order: WordOrder = "big") -> Union[int, float, str]:
+    """Value of _dtype_ held by _registers_, starting at the first register."""
+    if dtype == DataType.UTF8:
+        return register_view(registers).tobytes().decode("utf-8").rstrip("\x00")
+    code, offset = struct_code(dtype, word_order)
+    return struct.unpack_from(byte_order(word_order) + code, register_view(registers, word_order), offset)[0]
+
+
+def encode_value(value: Union[int, float, str], dtype: DataType, word_order: WordOrder = "big") -> list[int]:
+    """
+    Registers holding _value_ as _dtype_. Integer types round _value_ to the nearest integer and raise ValueError
+    outside [dtype.min_value, dtype.max_value]. F32 values out of its range raise ValueError. 8-bit types
+    are returned in their byte of a register whose other byte is 0.
+    """
+    if dtype == DataType.UTF8:
+        raw = str(value).encode("utf-8")
+        raw += b"\x00" * (len(raw) % 2)
+        return list(struct.unpack(f">{len(raw) // 2}H", raw))
+
+    code, offset = struct_code(dtype, word_order)
+    if code not in FLOAT_CODES:
+        value = round(value)  # type: ignore
+        if not dtype.min_value <= value <= dtype.max_value:  # type: ignore
+            raise ValueError(f"Cannot write {value=} to {dtype.value} register, range is [{dtype.min_value}, {dtype.max_value}].")
+    order = byte_order(word_order)
+    raw = bytearray(max(2, struct.calcsize(code)))
+    try:
+        struct.pack_into(order + code, raw, offset, value)
+    except (struct.error, OverflowError) as e:
+        raise ValueError(f"Cannot write {value=} to {dtype.value} register: {e}") from e
+    return list(struct.unpack(f"{order}{len(raw) // 2}H", raw))
@@ -31,6 +31,7 @@ from .enums import (
     DeviceClass,
     HAEntityType,
     Parameter,
+    PollClass,
     RegisterTypes,
     WriteParameter,
     WriteSelectParameter,
@@ -50,7 +51,7 @@ device managed by the add-on. Restart the add-on after editing this file.
 The following names are pre-injected — no imports needed:
 
     ParamWrapped, Parameter, WriteParameter, WriteSelectParameter,
-    DataType, DeviceClass, HAEntityType, RegisterTypes,
+    DataType, DeviceClass, HAEntityType, RegisterTypes, PollClass,
     NOT_PCS, HPS_PCS_HPSTL, HPS_PCS, HPSTL_PBD,
     PBD_ONLY, PCS_ONLY, HPS_ONLY, HPSTL_ONLY
 
@@ -59,6 +60,14 @@ Each ``ParamWrapped`` entry takes:
     2. param           - dict (read sensor) or WriteParameter / WriteSelectParameter
     3. included_groups - set of device groups, or None for "all groups"
     4. is_write_param  - False for read sensor, True for write parameter
+    5. poll_class      - optional: PollClass.REALTIME (every cycle), PollClass.SLOW
+                         (every slow_poll_interval_seconds) or PollClass.STATIC (once
+                         after connecting). Defaults to REALTIME for read sensors and
+                         SLOW for write parameters.
+    6. qos, retain     - optional: MQTT QoS (0, 1 or 2) and retain flag of the
+                         sensor's state messages. Default to the add-on options:
+                         QoS 0 without retain for read sensors, QoS 1 with retain
+                         for write parameters.
 
 Note: register addresses in the protocol PDF are 0-indexed; the add-on uses
 1-indexed Modbus addresses. Use ``addr = pdf_address + 1``.
@@ -96,6 +105,7 @@ MY_SENSORS = [
     #     },
     #     PCS_ONLY,
     #     False,
+    #     poll_class=PollClass.SLOW,  # energy totals change slowly
     # ),
 
     # --- Example 3: writable number entity for HPS/PCS devices ---
@@ -163,6 +173,7 @@ def load_custom_params() -> list[ParamWrapped]:
         "DeviceClass": DeviceClass,
         "HAEntityType": HAEntityType,
         "RegisterTypes": RegisterTypes,
+        "PollClass": PollClass,
         "NOT_PCS": NOT_PCS,
         "HPS_PCS_HPSTL": HPS_PCS_HPSTL,
         "HPS_PCS": HPS_PCS,
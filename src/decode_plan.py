@@ -0,0 +1,122 @@
+"""Decode plan: every parameter of a server decoded from its register image in a few struct calls.
+
+The register image of each register type is viewed once per cycle as a byte
+buffer, big or little endian per the server's word order (see codec).
+Parameters are laid out in "lanes", each a single ``struct.Struct`` whose
+format skips the bytes between parameters, so one ``unpack_from`` decodes a
+whole lane. Parameters overlapping an earlier one (e.g. a high byte and a full
+word at the same address) go into another lane. Scaling by multiplier and
+rounding by device class are precomputed per lane and applied only to the
+values that need them.
+
+Data types without a fixed struct code (UTF8) are left to the server's
+single-parameter decoding.
+"""
+
+import struct
+from array import array
+from dataclasses import dataclass
+from typing import Any, Iterable, Mapping, Optional, Sequence
+
+from .codec import FLOAT_CODES, STRUCT_CODES, WordOrder, byte_order, register_view, struct_code
+from .enums import DataType, RegisterTypes, device_class_to_rounding
+
+
+@dataclass(frozen=True)
+class Lane:
+    struct: struct.Struct
+    names: tuple[str, ...]
+    scale: tuple[tuple[int, float, int], ...]  # (index in names, multiplier, rounding digits) of scaled values
+
+
+@dataclass(frozen=True)
+class DecodePlan:
+    lanes: dict[RegisterTypes, tuple[Lane, ...]]
+    fallback: tuple[str, ...]  # parameters decoded one by one
+    word_order: WordOrder = "big"
+
+    def decode(
+        self,
+        images: Mapping[RegisterTypes, Sequence[int]],
+        scratch: Optional[Mapping[RegisterTypes, array]] = None,
+    ) -> dict[str, Any]:
+        """Decode all lane parameters from the register _images_ the plan was compiled for.
+        _scratch_ arrays of the images' lengths are reused for byte swapping, instead of allocating buffers."""
+        values: dict[str, Any] = {}
+        for register_type, lanes in self.lanes.items():
+            buffer = register_view(
+                images[register_type], self.word_order, scratch.get(register_type) if scratch else None
+            )
+            for lane in lanes:
+                decoded = list(lane.struct.unpack_from(buffer))
+                for i, multiplier, digits in lane.scale:
+                    value = decoded[i] * multiplier
+                    decoded[i] = round(value, digits) if isinstance(value, float) else value
+                values.update(zip(lane.names, decoded))
+        return values
+
+
+def compile_decode_plan(
+    parameters: Mapping[str, Mapping[str, Any]],
+    first_addresses: Mapping[RegisterTypes, int],
+    codes: Mapping[DataType, tuple[str, int]] = STRUCT_CODES,
+    word_order: WordOrder = "big",
+) -> DecodePlan:
+    """
+    Plan for decoding _parameters_ from register images starting at _first_addresses_ (1-indexed, per register type),
+    holding values of several registers in _word_order_.
+
+    Scaling matches Server.read_from_state: values are multiplied by their multiplier, and floats are rounded
+    to the digits of their device class (2 by default).
+    """
+    prefix = byte_order(word_order)
+    fallback: list[str] = []
+    placed: dict[RegisterTypes, list[tuple[int, str, str, Mapping[str, Any]]]] = {rt: [] for rt in RegisterTypes}
+    for name, param in parameters.items():
+        if param["dtype"] not in codes:
+            fallback.append(name)
+            continue
+        code, byte_offset = struct_code(param["dtype"], word_order, codes)
+        position = 2 * (param["addr"] - first_addresses[param["register_type"]]) + byte_offset
+        placed[param["register_type"]].append((position, code, name, param))
+
+    lanes = {
+        register_type: _lanes(sorted(items, key=lambda item: item[0]), prefix)
+        for register_type, items in placed.items()
+        if items
+    }
+    return DecodePlan(lanes, tuple(fallback), word_order)
+
+
+def _lanes(items: Iterable[tuple[int, str, str, Mapping[str, Any]]], prefix: str = ">") -> tuple[Lane, ...]:
+    """Pack items sorted by byte position into as few non-overlapping struct formats as possible."""
+    formats: list[list[str]] = []
+    cursors: list[int] = []  # next free byte of each lane
+    members: list[list[tuple[str, str, Mapping[str, Any]]]] = []
+    for position, code, name, param in items:
+        for lane, cursor in enumerate(cursors):
+            if cursor <= position:
+                break
+        else:
+            lane = len(cursors)
+            formats.append([prefix])
+            cursors.append(0)
+            members.append([])
+        if position > cursors[lane]:
+            formats[lane].append(f"{position - cursors[lane]}x")
+        formats[lane].append(code)
+        cursors[lane] = position + struct.calcsize(">" + code)
+        members[lane].append((name, code, param))
+
+    return tuple(
+        Lane(
+            struct.Struct("".join(fmt)),
+            tuple(name for name, _, _ in lane_members),
+            tuple(
+                (i, param["multiplier"], device_class_to_rounding.get(param.get("device_class"), 2))  # type: ignore
+                for i, (_, code, param) in enumerate(lane_members)
+                if param["multiplier"] != 1 or code in FLOAT_CODES
+            ),
+        )
+        for fmt, lane_members in zip(formats, members)
+    )
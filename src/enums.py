@@ -40,21 +40,25 @@ class DataType(Enum):
         Returns None for variable-size types (UTF8).
         """
         sizes = {
+            DataType.U8L: 1,
+            DataType.U8H: 1,
+            DataType.I8L: 1,
+            DataType.I8H: 1,
             DataType.U16: 2,
             DataType.I16: 2,
             DataType.U32: 4,
             DataType.I32: 4,
             DataType.F32: 4,
-            DataType.F32: 4,
             DataType.U64: 8,
             DataType.I64: 8,
+            DataType.F64: 8,
             DataType.UTF8: None,
         }
         return sizes[self]
 
     @property
     def min_value(self) -> Optional[int]:
-        """Returns the minimum value for numeric types."""
+        """Returns the minimum value for integer types. None for floats and strings."""
         ranges = {
             DataType.U8L: 0,  # -2^7
             DataType.U8H: 0,  # -2^7
@@ -65,14 +69,16 @@ class DataType(Enum):
             DataType.I16: -32768,  # -2^15
             DataType.I32: -2147483648,  # -2^31
             DataType.U64: 0,
-            DataType.I64: -18446744073709551616,
+            DataType.I64: -9223372036854775808,  # -2^63
+            DataType.F32: None,
+            DataType.F64: None,
             DataType.UTF8: None,
         }
         return ranges[self]
 
     @property
     def max_value(self) -> Optional[int]:
-        """Returns the maximum value for numeric types."""
+        """Returns the maximum value for integer types. None for floats and strings."""
         ranges = {
             DataType.U8L: 255,  # 2^8-1
             DataType.U8H: 255,  # 2^8-1
@@ -84,6 +90,8 @@ class DataType(Enum):
             DataType.I32: 2147483647,  # 2^31 - 1
             DataType.U64: 18446744073709551615,
             DataType.I64: 9223372036854775807,
+            DataType.F32: None,
+            DataType.F64: None,
             DataType.UTF8: None,
         }
         return ranges[self]
@@ -154,6 +162,39 @@ device_class_to_rounding: dict[DeviceClass, int] = {
         DeviceClass.POWER: 0
     }
 
+# changes of a value smaller than its deadband are not published, see publish_filter. Others: any change.
+# Values are compared as rounded by device_class_to_rounding, so deadbands are a number of rounding steps
+DEADBAND_ROUNDING_STEPS = 2
+device_class_to_deadband: dict[DeviceClass, float] = {
+        **{
+            device_class: DEADBAND_ROUNDING_STEPS * 10 ** -device_class_to_rounding[device_class]
+            for device_class in (
+                DeviceClass.POWER,
+                DeviceClass.APPARENT_POWER,
+                DeviceClass.REACTIVE_POWER,
+                DeviceClass.CURRENT,
+                DeviceClass.VOLTAGE,
+                DeviceClass.FREQUENCY,
+            )
+        },
+        DeviceClass.TEMPERATURE: 0.5,  # not rounded
+    }
+
+class PollClass(Enum):
+    """
+    Polling tier of a parameter. Each tier has its own batch plan and is read at its own period.
+    """
+
+    REALTIME = "realtime"  # every loop cycle
+    SLOW = "slow"  # every slow_poll_interval_seconds
+    STATIC = "static"  # once after connecting
+
+
+def default_poll_class(is_write_param: bool) -> PollClass:
+    """Poll class of parameters without a poll_class. Write parameters are settings, which rarely change."""
+    return PollClass.SLOW if is_write_param else PollClass.REALTIME
+
+
 class HAEntityType(Enum):
     NUMBER = 'number'
     SWITCH = 'switch'
@@ -181,6 +222,10 @@ class Parameter(ParameterReq, total=False):
     remarks: str
     state_class: Literal["measurement", "total", "total_increasing"]
     value_template: str
+    poll_class: PollClass
+    deadband: float  # overrides device_class_to_deadband
+    qos: int  # MQTT state publishing, overrides the PublishPolicy
+    retain: bool
 
     # all oarameters are required to have these fields
 WriteParameterReq = TypedDict(
@@ -202,6 +247,10 @@ class WriteSelectParameterReq(WriteParameterReq, total=True):
 class WriteSelectParameter(WriteSelectParameterReq, total=False):
     value_template: str
     command_template: str
+    poll_class: PollClass
+    deadband: float
+    qos: int
+    retain: bool
     
 class WriteParameter(WriteParameterReq, total=False):
     device_class: DeviceClass # when not specified w=for a switch, a none type switch is used
@@ -215,6 +264,11 @@ class WriteParameter(WriteParameterReq, total=False):
     payload_off: int
     payload_on: int
 
+    poll_class: PollClass
+    deadband: float
+    qos: int
+    retain: bool
+
     
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+"""Modbus TCP gateway serving the register image of every server.
+
+With ``gateway_enabled``, the add-on answers Modbus TCP requests on
+``gateway_host:gateway_port`` so other masters (an EMS, a data logger) share
+the RS485 bus through it instead of polling it themselves. Unit id N answers
+for the server with ``modbus_id`` N:
+
+- reads are answered from the server's ``holding_state``/``input_state`` as of
+  its last poll, without touching the bus. Addresses the batch plan does not
+  read (outside the extent, in gaps between batches, or learned as illegal)
+  get Illegal Data Address, servers that are not available get Gateway Target
+  Device Failed to Respond.
+- writes are forwarded to the device through its client, as a write
+  transaction of the client's bus scheduler, and the image is updated when the
+  device accepts them.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Callable, Optional
+
+from pymodbus.constants import ExcCodes
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseDeviceContext
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.server import ModbusTcpServer
+
+from .enums import RegisterTypes
+from .server import Server
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayDevice(ModbusBaseDeviceContext):
+    """Device context of one server. _available_ tells whether the server is currently being polled."""
+
+    def __init__(self, server: Server, available: Callable[[Server], bool]) -> None:
+        self.server = server
+        self.available = available
+
+    def register_type(self, func_code: int) -> Optional[RegisterTypes]:
+        return {"h": RegisterTypes.HOLDING_REGISTER, "i": RegisterTypes.INPUT_REGISTER}.get(self.decode(func_code))
+
+    def _image(self, register_type: RegisterTypes):
+        """Register state and its first address."""
+        if register_type == RegisterTypes.HOLDING_REGISTER:
+            return self.server.holding_state, self.server.holding_addr_extent[0]
+        return self.server.input_state, self.server.input_addr_extent[0]
+
+    def _read_by_plan(self, register_type: RegisterTypes, address: int, count: int) -> bool:
+        """Whether every address from _address_ (1-indexed) is read by a batch of the server, and not illegal.
+        Other addresses of the image are zero-filled, not device data."""
+        if register_type == RegisterTypes.HOLDING_REGISTER:
+            batches = self.server.holding_batches
+        else:
+            batches = self.server.input_batches
+        illegal = self.server.illegal_addresses[register_type]
+        return all(
+            a not in illegal and any(a in batch for batch in batches) for a in range(address, address + count)
+        )
+
+    def reset(self) -> None:
+        pass
+
+    def getValues(self, func_code, address, count=1):
+        address += 1  # pymodbus addresses are 0-indexed, parameter maps 1-indexed
+        register_type = self.register_type(func_code)
+        if register_type is None:
+            return ExcCodes.ILLEGAL_FUNCTION
+        if not self.available(self.server) or not self.server.batch_plan:
+            return ExcCodes.GATEWAY_NO_RESPONSE
+        state, first = self._image(register_type)
+        offset = address - first
+        if offset < 0 or offset + count > len(state) or not self._read_by_plan(register_type, address, count):
+            return ExcCodes.ILLEGAL_ADDRESS
+        return list(state[offset : offset + count])
+
+    async def async_setValues(self, func_code, address, values):
+        if self.register_type(func_code) != RegisterTypes.HOLDING_REGISTER:
+            return ExcCodes.ILLEGAL_FUNCTION
+        if not self.available(self.server):
+            return ExcCodes.GATEWAY_NO_RESPONSE
+        try:
+            result = await asyncio.to_thread(
+                self.server.connected_client.write,
+                list(values), address + 1, self.server.modbus_id, RegisterTypes.HOLDING_REGISTER,
+            )
+        except Exception as e:
+            logger.error(f"Gateway write to {self.server.name} at {address + 1} failed: {e}")
+            return ExcCodes.GATEWAY_NO_RESPONSE
+        if result.isError():
+            self.server.connected_client._handle_error_response(result)
+            if isinstance(result, ExceptionResponse):
+                return ExcCodes(result.exception_code)
+            return ExcCodes.DEVICE_FAILURE
+
+        logger.info(f"Gateway wrote {list(values)} to {self.server.name} at {address + 1}")
+        state, first = self._image(RegisterTypes.HOLDING_REGISTER)
+        for i, value in enumerate(values):
+            if 0 <= address + 1 + i - first < len(state):
+                state[address + 1 + i - first] = value
+        return None
+
+    def setValues(self, func_code, address, values):
+        raise RuntimeError("Gateway writes are asynchronous")
+
+
+class Gateway:
+    """Modbus TCP server for _servers_, on its own event loop thread."""
+
+    def __init__(self, servers: list[Server], available: Callable[[Server], bool] = lambda server: True) -> None:
+        devices: dict[int, GatewayDevice] = {}
+        for server in servers:
+            if server.modbus_id in devices:
+                logger.warning(
+                    f"Gateway unit id {server.modbus_id} of {server.name} already serves "
+                    f"{devices[server.modbus_id].server.name}. Not serving {server.name}"
+                )
+                continue
+            devices[server.modbus_id] = GatewayDevice(server, available)
+        self.context = ModbusServerContext(devices=devices, single=False)
+        self.event_loop = asyncio.new_event_loop()
+        self._server: Optional[ModbusTcpServer] = None
+
+    def start(self, host: str = "0.0.0.0", port: int = 502) -> None:
+        threading.Thread(target=self.event_loop.run_forever, name="modbus-gateway", daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._serve(host, port), self.event_loop).result()
+        logger.info(f"Modbus TCP gateway listening on {host}:{port}")
+
+    async def _serve(self, host: str, port: int) -> None:
+        self._server = ModbusTcpServer(self.context, address=(host, port))
+        await self._server.serve_forever(background=True)
+
+    def stop(self) -> None:
+        if self._server is not None:
+            asyncio.run_coroutine_threadsafe(self._server.shutdown(), self.event_loop).result()
+        self.event_loop.call_soon_threadsafe(self.event_loop.stop)
@@ -0,0 +1,72 @@
+"""Register addresses a device answered with Modbus exception 2 (Illegal Data Address).
+
+Firmware variants of the same model expose slightly different register maps.
+Addresses learned to be unreadable are persisted per model, so the next start
+plans its read batches around them from the beginning.
+
+Some devices also reject a read spanning certain addresses although every
+address is readable on its own. Where bisection finds such a batch, the
+address its upper half starts at is persisted as a batch break, and later
+batches do not read across it.
+"""
+
+import logging
+
+from .enums import RegisterTypes
+from .persistence import load_json, save_json
+
+logger = logging.getLogger(__name__)
+
+ILLEGAL_ADDRESSES_FILE = "illegal_addresses.json"
+BATCH_BREAKS_FILE = "batch_breaks.json"
+
+ILLEGAL_DATA_ADDRESS = 2  # modbus exception code
+
+
+def to_ranges(addrs: set[int]) -> list[list[int]]:
+    """Compress a set of addresses into sorted [first, last] ranges."""
+    ranges: list[list[int]] = []
+    for a in sorted(addrs):
+        if ranges and a == ranges[-1][1] + 1:
+            ranges[-1][1] = a
+        else:
+            ranges.append([a, a])
+    return ranges
+
+
+def from_ranges(ranges: list[list[int]]) -> set[int]:
+    return {a for first, last in ranges for a in range(first, last + 1)}
+
+
+def load_illegal_addresses(model: str) -> dict[RegisterTypes, set[int]]:
+    """Return the learned illegal addresses for _model_, per register type."""
+    stored = load_json(ILLEGAL_ADDRESSES_FILE, default={}).get(model, {})
+    return {rt: from_ranges(stored.get(rt.name, [])) for rt in RegisterTypes}
+
+
+def save_illegal_addresses(model: str, addrs: dict[RegisterTypes, set[int]]) -> None:
+    """Persist the illegal addresses for _model_, merged with those stored by other servers of the model.
+    Entries of other models are kept."""
+    stored = load_json(ILLEGAL_ADDRESSES_FILE, default={})
+    known = stored.get(model, {})
+    merged = {rt: from_ranges(known.get(rt.name, [])) | addrs.get(rt, set()) for rt in RegisterTypes}
+    stored[model] = {rt.name: to_ranges(a) for rt, a in merged.items() if a}
+    if save_json(ILLEGAL_ADDRESSES_FILE, stored):
+        logger.info(f"Saved illegal addresses for model {model}: {stored[model]}")
+
+
+def load_batch_breaks(model: str) -> dict[RegisterTypes, set[int]]:
+    """Return the learned batch breaks for _model_, per register type: addresses a read batch must start at."""
+    stored = load_json(BATCH_BREAKS_FILE, default={}).get(model, {})
+    return {rt: set(stored.get(rt.name, [])) for rt in RegisterTypes}
+
+
+def save_batch_breaks(model: str, breaks: dict[RegisterTypes, set[int]]) -> None:
+    """Persist the batch breaks for _model_, merged with those stored by other servers of the model.
+    Entries of other models are kept."""
+    stored = load_json(BATCH_BREAKS_FILE, default={})
+    known = stored.get(model, {})
+    merged = {rt: set(known.get(rt.name, [])) | breaks.get(rt, set()) for rt in RegisterTypes}
+    stored[model] = {rt.name: sorted(b) for rt, b in merged.items() if b}
+    if save_json(BATCH_BREAKS_FILE, stored):
+        logger.info(f"Saved batch breaks for model {model}: {stored[model]}")
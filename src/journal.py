@@ -0,0 +1,137 @@
+"""Disk-backed journal of MQTT state messages published during broker outages.
+
+While the broker is unreachable the add-on keeps polling. Energy counters and
+fault transitions are appended to a journal in the data directory, and
+replayed in order at a controlled rate once the broker is back, so the
+readings of an outage (e.g. Mosquitto restarting with a Home Assistant update)
+are not lost. Other values only matter as the latest state, which the outbox
+keeps.
+
+File layout: the 8-byte magic ``MQJNL\\x00\\x00\\x01``, then one frame per
+message, little endian::
+
+    time f64 (unix seconds), qos u8, retain u8, topic length u16,
+    payload length u32, topic (utf-8), payload (utf-8)
+
+The journal is capped at ``max_bytes`` over two segments: when the current
+file reaches half of it, it replaces the previous segment (``<path>.1``), so
+the oldest messages are dropped first. A truncated last frame (e.g. after a
+power cut) is ignored.
+"""
+
+import logging
+import os
+import struct
+import threading
+from time import time
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MQJNL\x00\x00\x01"
+FRAME = struct.Struct("<dBBHI")
+JOURNAL_FILE = "mqtt_journal.jnl"
+
+
+class JournalEntry(NamedTuple):
+    time: float
+    topic: str
+    payload: str
+    qos: int
+    retain: bool
+
+
+def pack_entry(entry: JournalEntry) -> bytes:
+    topic, payload = entry.topic.encode(), entry.payload.encode()
+    return FRAME.pack(entry.time, entry.qos, entry.retain, len(topic), len(payload)) + topic + payload
+
+
+def read_entries(path: str) -> list[JournalEntry]:
+    """Entries of the journal segment at _path_, in order. Empty if it does not exist."""
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            logger.warning(f"Ignoring {path}, not an MQTT journal")
+            return []
+        while True:
+            header = f.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return entries
+            t, qos, retain, topic_length, payload_length = FRAME.unpack(header)
+            data = f.read(topic_length + payload_length)
+            if len(data) < topic_length + payload_length:
+                logger.warning(f"Ignoring truncated last frame of {path}")
+                return entries
+            entries.append(
+                JournalEntry(t, data[:topic_length].decode(), data[topic_length:].decode(), qos, bool(retain))
+            )
+
+
+class Journal:
+    """Append-only journal at _path_ and its previous segment, of at most _max_bytes_ together. Thread safe."""
+
+    def __init__(self, path: str, max_bytes: int = 5_000_000) -> None:
+        self.path = path
+        self.previous_path = path + ".1"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Bytes journaled, 0 if there is nothing to replay."""
+        return sum(
+            max(0, os.path.getsize(path) - len(MAGIC))
+            for path in (self.previous_path, self.path)
+            if os.path.exists(path)
+        )
+
+    def append(
+        self, topic: str, payload: str, qos: int = 0, retain: bool = False, timestamp: Optional[float] = None
+    ) -> None:
+        """Journal a message, at the unix time its value was read, default now."""
+        self.extend([JournalEntry(time() if timestamp is None else timestamp, topic, payload, qos, retain)])
+
+    def extend(self, entries: list[JournalEntry]) -> None:
+        data = b"".join(pack_entry(entry) for entry in entries)
+        with self._lock:
+            try:
+                self._write(data)
+            except OSError as e:
+                logger.warning(f"Could not write to {self.path}: {e}")
+
+    def take(self) -> list[JournalEntry]:
+        """All journaled entries, oldest first, removing them from the journal."""
+        with self._lock:
+            entries = read_entries(self.previous_path) + read_entries(self.path)
+            self._clear()
+            return entries
+
+    def put_back(self, entries: list[JournalEntry]) -> None:
+        """Journal taken _entries_ that were not replayed again, before the entries journaled since."""
+        with self._lock:
+            newer = read_entries(self.previous_path) + read_entries(self.path)
+            self._clear()
+            try:
+                for entry in entries + newer:
+                    self._write(pack_entry(entry))
+            except OSError as e:
+                logger.warning(f"Could not write to {self.path}: {e}")
+
+    def _write(self, data: bytes) -> None:
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size and size + len(data) > self.max_bytes // 2:
+            os.replace(self.path, self.previous_path)
+            size = 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as f:
+            if size == 0:
+                f.write(MAGIC)
+            f.write(data)
+
+    def _clear(self) -> None:
+        for path in (self.previous_path, self.path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
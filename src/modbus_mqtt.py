@@ -1,19 +1,36 @@
+import copy
+import hashlib
 import os
 import signal
-from typing import Callable
+import threading
+from typing import Any, Callable, Optional
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 import json
 import logging
 
 from .helpers import slugify
 from .options import AppOptions
+from .journal import JOURNAL_FILE, Journal
+from .outbox import Outbox
+from .persistence import data_path, load_json, save_json
+from .topics import PublishPolicy, TopicAliases, TopicTable
 
 from random import getrandbits
-from time import time, sleep
+from time import monotonic, time, sleep
 from queue import Queue
 
 logger = logging.getLogger(__name__)
+
+DISCOVERY_MANIFEST_FILE = "discovery_manifest.json"
+DISCOVERY_CHECK_SECONDS = 2  # for the retained discovery configs to arrive after subscribing to them
+
+
+def config_digest(data: str | bytes) -> str:
+    """Hash of a discovery config, as published."""
+    return hashlib.sha256(data.encode() if isinstance(data, str) else data).hexdigest()[:16]
 # RECV_Q: Queue = Queue()
 
 
@@ -32,14 +49,66 @@ class MqttClient(mqtt.Client):
             return uuid_str
 
         uuid = generate_uuid()
-        super().__init__(CallbackAPIVersion.VERSION2, f"modbus-{uuid}")
+        self.v5 = options.mqtt_v5
+        super().__init__(CallbackAPIVersion.VERSION2, f"modbus-{uuid}", protocol=mqtt.MQTTv5 if self.v5 else mqtt.MQTTv311)
         self.username_pw_set(options.mqtt_user, options.mqtt_password)
         self.base_topic = options.mqtt_base_topic
         self.ha_discovery_topic = options.mwtt_ha_discovery_topic
+        self.aggregate_state = options.mqtt_aggregate_state
+        self.publish_policy = PublishPolicy.from_app_options(options)
+        # aggregated state mode: last known value of every parameter, per server name and slug
+        self.state_documents: dict[str, dict[str, Any]] = {}
+        self._state_documents_lock = threading.Lock()  # publishing thread and message handler
+        # per server name: (the slugs it was built from, topic table), see topics()
+        self.topic_tables: dict[str, tuple[dict[str, str], TopicTable]] = {}
+        self.command_index: dict[str, tuple[Any, str]] = {}  # command topic: (server, write parameter name)
+        # hash of the discovery config last published on each topic, per server name: as saved (manifest),
+        # and as generated since starting
+        self.discovery_cache = options.mqtt_discovery_cache
+        self.discovery_manifest: dict[str, dict[str, str]] = (
+            load_json(DISCOVERY_MANIFEST_FILE, default={}) if self.discovery_cache else {}
+        )
+        self.discovery_configs: dict[str, dict[str, str]] = {}
+        # Home Assistant's birth message: it publishes "online" here when it starts. The broker may have lost
+        # retained configs meanwhile, so their retained copies are compared with the published ones, and the
+        # polling thread publishes those missing (see discovery_check_due)
+        self.ha_status_topic = f"{self.ha_discovery_topic}/status"
+        self.discovery_check_started: Optional[float] = None  # monotonic, while comparing retained configs
+        self.retained_configs: dict[str, str] = {}  # topic: digest of the retained configs received since
+        # state messages wait in the outbox while the broker is unreachable or max_inflight messages are unacknowledged
+        self.outbox = Outbox.from_app_options(options)
+        self.max_inflight = options.mqtt_outbox_max_inflight
+        self.inflight: list[mqtt.MQTTMessageInfo] = []
+        self._flush_lock = threading.Lock()
+        self._logged_drops = 0  # outbox drops when its metrics were last logged
+        # energy counters and fault transitions published during broker outages, replayed after reconnecting
+        self.journal: Optional[Journal] = (
+            Journal(data_path(JOURNAL_FILE), options.mqtt_journal_max_bytes) if options.mqtt_journal_enabled else None
+        )
+        self.journal_replay_rate = options.mqtt_journal_replay_rate
+        self.replaying = False  # live state messages wait in the outbox until the journal is replayed
+        self.was_connected = False
+        self.disconnected_at: Optional[float] = None  # monotonic
+        # MQTT v5: aliases of the current connection, and expiry of measurement messages
+        self.topic_aliases = TopicAliases()
+        self.message_expiry_seconds = options.mqtt_message_expiry_seconds
+        # paho's network loop reconnects with exponential backoff between these delays
+        self.reconnect_delay_set(options.mqtt_reconnect_min_delay_seconds, options.mqtt_reconnect_max_delay_seconds)
 
         def on_connect(client, userdata, connect_flags, reason_code, properties):
             if reason_code == 0:
-                logger.info(f"Connected to MQTT broker.")
+                if self.v5:
+                    self.topic_aliases.reset(getattr(properties, "TopicAliasMaximum", 0))
+                self.subscribe(self.ha_status_topic)
+                if self.was_connected:
+                    self.restore_session()
+                else:
+                    logger.info(f"Connected to MQTT broker.")
+                self.was_connected = True
+                if self.journal is not None and not self.replaying and len(self.journal):
+                    self.replaying = True
+                    threading.Thread(target=self.replay_journal, name="mqtt-journal-replay", daemon=True).start()
+                self.flush_outbox()
             else:
                 logger.info(
                     f"Not connected to MQTT broker.\nReturn code: {reason_code=}")
@@ -50,8 +119,12 @@ class MqttClient(mqtt.Client):
                         reason,
                         properties):
             logger.error(f"Disconnected from MQTT broker, {reason=}\n{disconnect_flags=}\n{properties=}")
-            logger.info(f"Stopping all threads")
-            os.kill(os.getpid(), signal.SIGINT)
+            self.inflight = []
+            self.topic_aliases.reset(0)
+            if self.disconnected_at is None:
+                self.disconnected_at = monotonic()
+            if self.journal is not None:
+                logger.info(f"Journaling energy counters and fault transitions until reconnected")
 
         def on_message(client, userdata, msg):
             logger.info("Received message on MQTT")
@@ -61,33 +134,72 @@ class MqttClient(mqtt.Client):
                 logger.error(f"Exception while handling received message. Stop Process. \n {e}")
                 os.kill(os.getpid(), signal.SIGINT)
 
+        def on_publish(client, userdata, mid, reason_code, properties):
+            self.flush_outbox()
+
         self.on_connect = on_connect
         self.on_disconnect = on_disconnect
         self.on_message = on_message
+        self.on_publish = on_publish
+
+    def restore_session(self) -> None:
+        """After reconnecting: subscribe to the command topics of every topic table again, since the broker does
+        not keep the subscriptions of a clean session, and publish the connected servers as available.
+        Modbus clients, plans and register images are untouched, polling carried on meanwhile."""
+        command_topics = list(self.command_index)
+        if command_topics:
+            self.subscribe([(topic, 0) for topic in command_topics])
+        for server in getattr(self, "servers", []):
+            self.publish_availability(True, server)
+        outage = f" after {monotonic() - self.disconnected_at:.1f}s" if self.disconnected_at is not None else ""
+        self.disconnected_at = None
+        logger.info(f"Reconnected to MQTT broker{outage}, restored {len(command_topics)} subscriptions")
+        self.log_outbox()
 
     def message_handler(self, msg) -> None:
         """
             Writes appropriate server registers for each message in mqtt receive queue
         """
-        # command_topic = f"{self.base_topic}/{server.nickname}/{slugify(register_name)}/set"
-        server_ha_display_name: str = msg.topic.split('/')[1]
-        s = None
-        for s in self.servers: 
-            if s.name == server_ha_display_name:
-                server = s
-        if s is None: raise ValueError(f"Server {server_ha_display_name} not available. Cannot write.")
-        register_slug: str = msg.topic.split('/')[2]
+        if msg.topic == self.ha_status_topic:
+            if msg.payload == b"online":
+                self.start_discovery_check()
+            return
+        if msg.topic.startswith(f"{self.ha_discovery_topic}/") and msg.topic.endswith("/config"):
+            if self.discovery_check_started is not None and msg.retain:
+                self.retained_configs[msg.topic] = config_digest(msg.payload)
+            return
+        command = self.command_index.get(msg.topic)
+        if command is None:
+            raise ValueError(f"No write parameter with command topic {msg.topic}. Cannot write.")
+        server, register_name = command
+        if server not in self.servers:
+            logger.error(f"Server {server.name} not available. Rejected write to {register_name}.")
+            return
         value: str = msg.payload.decode('utf-8')
-        register_name = server.write_parameters_slug_to_name[register_slug]
-
-
-        server.write_registers(register_slug, value)
 
+        try:
+            server.write_registers(self.topics(server).parameters[register_name].slug, value)
+        except ValueError as e:  # invalid value from HA, publish the current setting again instead
+            logger.error(f"Rejected write of {value=} to {register_name} of {server.name}: {e}")
 
         value = server.read_registers(register_name)
         logger.info(f"read {value=}")
         self.publish_to_ha(
-            register_slug, value, server)
+            register_name, value, server)
+
+    def topics(self, server) -> TopicTable:
+        """Topic table of _server_, built once per parameter map. Updates the command index when rebuilt."""
+        built = self.topic_tables.get(server.name)
+        slugs = server.slugs
+        if built is not None and built[0] is slugs:
+            return built[1]
+        if built is not None:
+            for command_topic in built[1].commands:
+                self.command_index.pop(command_topic, None)
+        table = TopicTable.build(server, self.base_topic, self.ha_discovery_topic, self.publish_policy)
+        self.topic_tables[server.name] = (slugs, table)
+        self.command_index.update((topic, (server, name)) for topic, name in table.commands.items())
+        return table
 
     def publish_discovery_topics(self, server) -> None:
         # TODO check if more separation from server is necessary/ possible
@@ -109,50 +221,41 @@ class MqttClient(mqtt.Client):
 
         # publish discovery topics for legal registers
         # assume registers in server.registers
-        availability_topic = f"{self.base_topic}_{nickname}/availability"
+        table = self.topics(server)
+        availability_topic = table.availability_topic
 
         parameters = server.parameters
 
         for register_name, details in parameters.items():
-            state_topic = f"{self.base_topic}/{nickname}/{slugify(register_name)}/state"
+            topics = table.parameters[register_name]
             discovery_payload = {
                 "name": register_name,
-                "unique_id": f"{nickname}_{slugify(register_name)}",
-                "state_topic": state_topic,
+                "unique_id": f"{nickname}_{topics.slug}",
+                **self.state_fields(table, register_name, details.get("value_template")),  # enum template
                 "availability_topic": availability_topic,
                 "device": device,
                 "device_class": details["device_class"].value,
             }
             if details["unit"] != "":
                 discovery_payload.update(unit_of_measurement=details["unit"])
-            if "value_template" in details: #enum
-                discovery_payload.update(value_template=details["value_template"])
 
             state_class = details.get("state_class", False)
             if state_class:
                 discovery_payload['state_class'] = state_class
                 
-            # from sungrow
-            if details.get("value_template") is not None:
-                discovery_payload.update(value_template=details["value_template"])
-            # from sungrow not used in atess yet
-                
-            discovery_topic = f"{self.ha_discovery_topic}/sensor/{nickname}/{slugify(register_name)}/config"
-
-            self.publish(discovery_topic, json.dumps(
-                discovery_payload), retain=True)
+            self.publish_config(topics.sensor_discovery_topic, discovery_payload, server)
 
         self.publish_availability(True, server)
 
         for register_name, details in server.write_parameters.items():
-            item_topic = f"{self.base_topic}/{nickname}/{slugify(register_name)}"
+            topics = table.parameters[register_name]
             discovery_payload = {
                 # required
-                "command_topic": item_topic + f"/set", 
-                "state_topic": item_topic + f"/state",
+                "command_topic": topics.command_topic,
+                **self.state_fields(table, register_name, details.get("value_template") if details.get("options") is not None else None),
                 # optional
                 "name": register_name,
-                "unique_id": f"{nickname}_{slugify(register_name)}",
+                "unique_id": f"{nickname}_{topics.slug}",
                 # "unit_of_measurement": details["unit"],
                 "availability_topic": availability_topic,
                 "device": device
@@ -161,20 +264,91 @@ class MqttClient(mqtt.Client):
                 discovery_payload.update(unit_of_measurement=details["unit"])
             if details.get("options") is not None:
                 discovery_payload.update(options=details["options"])
-                if details.get("value_template") is not None:
-                    discovery_payload.update(value_template=details["value_template"])
                 if details.get("command_template") is not None:
                     discovery_payload.update(command_template=details["command_template"])
             if details.get("min") is not None and details.get("max") is not None:
                 discovery_payload.update(min=details["min"], max=details["max"])
             if details.get("payload_off") is not None and details.get("payload_on") is not None:
                 discovery_payload.update(payload_off=details["payload_off"], payload_on=details["payload_on"])
-            discovery_topic = f"{self.ha_discovery_topic}/{details['ha_entity_type'].value}/{nickname}/{slugify(register_name)}/config"
-            self.publish(discovery_topic, json.dumps(discovery_payload), retain=True)
+            self.publish_config(topics.discovery_topic, discovery_payload, server)
 
             # subscribe to write topics
             self.subscribe(discovery_payload["command_topic"])
 
+    def publish_config(self, topic: str, payload: dict, server) -> None:
+        """Publish the retained discovery config _payload_ of one of _server_'s entities, unless the manifest
+        shows the same config was already published on _topic_."""
+        data = json.dumps(payload)
+        digest = config_digest(data)
+        self.discovery_configs.setdefault(server.name, {})[topic] = digest
+        if self.discovery_manifest.get(server.name, {}).get(topic) == digest:
+            return
+        self.publish(topic, data, retain=True)
+
+    def discovery_check_topic(self, server_name: str) -> str:
+        return f"{self.ha_discovery_topic}/+/{server_name}/+/config"
+
+    def start_discovery_check(self) -> None:
+        """Subscribe to the discovery configs published since starting, to receive the broker's retained copies."""
+        server_names = list(self.discovery_configs)
+        if not server_names:
+            return
+        logger.info("Home Assistant came online, checking the retained discovery configs")
+        self.retained_configs = {}
+        self.discovery_check_started = monotonic()
+        self.subscribe([(self.discovery_check_topic(name), 0) for name in server_names])
+
+    def discovery_check_due(self) -> bool:
+        """Whether a discovery check was started, and the retained configs had time to arrive."""
+        started = self.discovery_check_started
+        return started is not None and monotonic() - started >= DISCOVERY_CHECK_SECONDS
+
+    def forget_missing_discovery(self) -> int:
+        """End the discovery check: drop the manifest entries of configs the broker did not send back as published,
+        so the next discovery publishes them again. Returns how many."""
+        server_names = list(self.discovery_configs)
+        self.unsubscribe([self.discovery_check_topic(name) for name in server_names])
+        self.discovery_check_started = None
+        missing = 0
+        for name in server_names:
+            configs = self.discovery_manifest.get(name, {})
+            kept = {topic: digest for topic, digest in configs.items() if self.retained_configs.get(topic) == digest}
+            missing += len(configs) - len(kept)
+            self.discovery_manifest[name] = kept  # a new dict, the old one may be self.discovery_configs[name]
+        logger.info(f"Discovery: {missing} retained configs missing on the broker")
+        return missing
+
+    def finish_discovery(self, server_names: list[str]) -> None:
+        """
+        Clear the retained configs of entities no longer published, and save the manifest.
+
+        Servers in _server_names_ that published no discovery since starting (not connected yet) keep their
+        entities. Entities of servers not in _server_names_ (removed from the configuration) are cleared.
+        """
+        manifest: dict[str, dict[str, str]] = {}
+        cleared = 0
+        for name, configs in self.discovery_manifest.items():
+            published = self.discovery_configs.get(name)
+            if name in server_names and published is None:
+                manifest[name] = configs
+                continue
+            for topic in configs.keys() - (published or {}).keys():
+                self.publish(topic, "", retain=True)
+                cleared += 1
+        manifest.update(self.discovery_configs)
+
+        skipped = sum(
+            self.discovery_manifest.get(name, {}).get(topic) == digest
+            for name, configs in self.discovery_configs.items()
+            for topic, digest in configs.items()
+        )
+        total = sum(len(configs) for configs in self.discovery_configs.values())
+        logger.info(f"Discovery: {total - skipped} configs published, {skipped} unchanged, {cleared} cleared")
+
+        self.discovery_manifest = manifest
+        if self.discovery_cache:
+            save_json(DISCOVERY_MANIFEST_FILE, manifest)
+
     def publish_fault_discovery(self, server, fault_entity_name="Fault Alarms") -> None:
         """Publish MQTT discovery topic for the combined fault alarm entity."""
         nickname = server.name
@@ -206,20 +380,216 @@ class MqttClient(mqtt.Client):
         }
 
         discovery_topic = f"{self.ha_discovery_topic}/sensor/{nickname}/{slugify(fault_entity_name)}/config"
-        self.publish(discovery_topic, json.dumps(discovery_payload), retain=True)
-
-    def publish_faults(self, active: list[str], inactive: list[str], server, fault_entity_name="Fault Alarms") -> None:
-        """Publish decoded fault alarm data as a JSON object with active and inactive arrays."""
+        self.publish_config(discovery_topic, discovery_payload, server)
+
+    def publish_faults(
+        self,
+        active: list[str],
+        inactive: list[str],
+        server,
+        fault_entity_name="Fault Alarms",
+        sampled_at: Optional[float] = None,
+    ) -> None:
+        """Publish decoded fault alarm data as a JSON object with active and inactive arrays.
+        Retained by default, since it is only published when the fault registers change."""
         nickname = server.name
         state_topic = f"{self.base_topic}/{nickname}/{slugify(fault_entity_name)}/state"
         payload = {"active": active, "inactive": inactive}
-        self.publish(state_topic, json.dumps(payload), qos=1)
+        self.publish_state(
+            state_topic,
+            json.dumps(payload),
+            self.publish_policy.fault_qos,
+            self.publish_policy.fault_retain,
+            journal=True,
+            sampled_at=sampled_at,
+        )
+
+    def publish_fault_binary_discovery(self, server, fault_keys: list[str]) -> None:
+        """Publish MQTT discovery topics for a problem binary_sensor per fault key."""
+        nickname = server.name
+        availability_topic = f"{self.base_topic}_{nickname}/availability"
+        device = {
+            "manufacturer": server.manufacturer,
+            "model": server.model,
+            "identifiers": [f"{nickname}"],
+            "name": f"{nickname}"
+        }
+        for key in fault_keys:
+            discovery_payload = {
+                "name": key,
+                "unique_id": f"{nickname}_fault_{slugify(key)}",
+                "state_topic": f"{self.base_topic}/{nickname}/fault_{slugify(key)}/state",
+                "availability_topic": availability_topic,
+                "device": device,
+                "device_class": "problem",
+                "entity_category": "diagnostic",
+            }
+            discovery_topic = f"{self.ha_discovery_topic}/binary_sensor/{nickname}/fault_{slugify(key)}/config"
+            self.publish_config(discovery_topic, discovery_payload, server)
 
-    def publish_to_ha(self, register_name, value, server):
+    def publish_fault_states(self, states: dict[str, bool], server, sampled_at: Optional[float] = None) -> None:
+        """Publish ON/OFF to the binary_sensor of each fault key in _states_. Retained by default, since only transitions are published."""
         nickname = server.name
-        state_topic = f"{self.base_topic}/{nickname}/{slugify(register_name)}/state"
-        msg_info = self.publish(state_topic, value, qos=1)  # , retain=True)
-            
+        for key, active in states.items():
+            state_topic = f"{self.base_topic}/{nickname}/fault_{slugify(key)}/state"
+            self.publish_state(
+                state_topic, "ON" if active else "OFF", self.publish_policy.fault_qos, self.publish_policy.fault_retain,
+                journal=True, sampled_at=sampled_at,
+            )
+
+    def state_fields(self, table: TopicTable, register_name: str, value_template: Optional[str] = None) -> dict[str, str]:
+        """state_topic and value_template of a parameter entity. In aggregated state mode the value is
+        selected from the server's state document, as the `value` the parameter's own template expects."""
+        topics = table.parameters[register_name]
+        if not self.aggregate_state:
+            fields = {"state_topic": topics.state_topic}
+            if value_template is not None:
+                fields["value_template"] = value_template
+            return fields
+        if value_template is None:
+            value_template = f"{{{{ value_json['{topics.slug}'] }}}}"
+        else:
+            value_template = f"{{% set value = value_json['{topics.slug}'] | string %}}" + value_template
+        return {"state_topic": table.state_topic, "value_template": value_template}
+
+    def publish_to_ha(self, register_name, value, server, sampled_at: Optional[float] = None):
+        if self.aggregate_state:
+            self.publish_state_document([(register_name, value)], server, sampled_at)
+            return
+        topics = self.topics(server).parameters[register_name]
+        self.publish_state(
+            topics.state_topic, value, topics.qos, topics.retain, journal=topics.journal, expires=topics.expires,
+            sampled_at=sampled_at,
+        )
+
+    def publish_state_document(self, values: list[tuple[str, Any]], server, sampled_at: Optional[float] = None) -> None:
+        """Aggregated state mode: merge (register name, value) pairs into the server's state document and publish
+        all of it as one JSON message, so parameters not in _values_ keep their last value."""
+        table = self.topics(server)
+        with self._state_documents_lock:
+            document = self.state_documents.setdefault(server.name, {})
+            document.update((table.parameters[register_name].slug, value) for register_name, value in values)
+            payload = json.dumps(document)
+        qos, retain = self.publish_policy.document
+        journal = any(table.parameters[register_name].journal for register_name, _ in values)
+        self.publish_state(table.state_topic, payload, qos, retain, journal=journal, sampled_at=sampled_at)
+
+    def publish_state(
+        self,
+        topic: str,
+        payload: Any,
+        qos: int = 0,
+        retain: bool = False,
+        journal: bool = False,
+        expires: bool = False,
+        sampled_at: Optional[float] = None,
+    ) -> None:
+        """Publish a state message through the outbox, so a newer state replaces it while the broker lags.
+        While disconnected, messages with _journal_ set are also appended to the journal. In MQTT v5 mode, messages
+        with _expires_ set carry the message expiry.
+
+        _sampled_at_ is the unix time the value was read, default now. The journal, the v5 timestamp, the outbox
+        age and the message expiry count from it, not from when the message is published."""
+        payload = "" if payload is None else str(payload)
+        now = time()
+        if sampled_at is None:
+            sampled_at = now
+        if journal and self.journal is not None and not self.is_connected():
+            self.journal.append(topic, payload, qos, retain, timestamp=sampled_at)
+        properties = self.message_properties(sampled_at, expires) if self.v5 else None
+        self.outbox.put(
+            topic, payload, qos, retain, now=monotonic() - max(0.0, now - sampled_at), properties=properties
+        )
+        self.flush_outbox()
+        if self.outbox.metrics.dropped != self._logged_drops:
+            self.log_outbox()
+
+    def log_outbox(self) -> None:
+        """Log the depth and counters of the outbox."""
+        self._logged_drops = self.outbox.metrics.dropped
+        logger.info(f"MQTT outbox: {self.outbox.metrics.as_dict()}")
+
+    def message_properties(self, timestamp: float, expires: bool = False) -> Properties:
+        """MQTT v5 publish properties: the sample _timestamp_ as user property "ts" (unix milliseconds), and if
+        _expires_ is set, the message expiry, so brokers drop stale values instead of delivering them late."""
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.UserProperty = ("ts", str(round(timestamp * 1000)))
+        if expires and self.message_expiry_seconds:
+            properties.MessageExpiryInterval = self.message_expiry_seconds
+        return properties
+
+    def remaining_expiry(self, properties: Optional[Properties], age: float) -> Optional[Properties]:
+        """_properties_ of a message whose value was read _age_ seconds ago, with the message expiry reduced by
+        the age. None if the message has expired."""
+        if properties is None or not hasattr(properties, "MessageExpiryInterval"):
+            return properties
+        remaining = properties.MessageExpiryInterval - int(age)
+        if remaining <= 0:
+            return None
+        properties = copy.copy(properties)
+        properties.MessageExpiryInterval = remaining
+        return properties
+
+    def aliased(self, topic: str, qos: int, properties: Optional[Properties]) -> tuple[str, Optional[Properties]]:
+        """Topic and properties to publish a message on _topic_ with, using a topic alias if it has one. Only
+        QoS 0 messages use aliases, since paho resends QoS 1 and 2 messages on a new connection, without its aliases."""
+        if properties is None or qos != 0:
+            return topic, properties
+        alias, new = self.topic_aliases.alias(topic)
+        if not alias:
+            return topic, properties
+        properties = copy.copy(properties)
+        properties.TopicAlias = alias
+        return (topic if new else ""), properties
+
+    def replay_journal(self) -> None:
+        """Publish the journaled messages, oldest first, at journal_replay_rate messages per second (0: no limit).
+        Live state messages wait in the outbox meanwhile, and are published after, so the last state wins.
+        Messages not replayed before a disconnect are put back into the journal."""
+        entries = self.journal.take()
+        logger.info(f"Replaying {len(entries)} journaled messages")
+        try:
+            for i, entry in enumerate(entries):
+                if not self.is_connected():
+                    logger.info(f"Disconnected while replaying the journal, {len(entries) - i} messages left")
+                    self.journal.put_back(entries[i:])
+                    return
+                properties = self.message_properties(entry.time) if self.v5 else None
+                self.publish(entry.topic, entry.payload, qos=entry.qos, retain=entry.retain, properties=properties)
+                if self.journal_replay_rate:
+                    sleep(1 / self.journal_replay_rate)
+            logger.info(f"Replayed {len(entries)} journaled messages")
+        finally:
+            self.replaying = False
+            self.flush_outbox()
+
+    def flush_outbox(self) -> None:
+        """Publish queued state messages, oldest first, while connected and fewer than max_inflight are
+        unacknowledged. Called after queueing, and on every acknowledgement and (re)connect."""
+        if self.replaying or not self._flush_lock.acquire(blocking=False):
+            return  # the journal replay, or another thread, flushes later
+        try:
+            while self.is_connected():
+                self.inflight = [info for info in self.inflight if not info.is_published()]
+                if len(self.inflight) >= self.max_inflight:
+                    return
+                message = self.outbox.pop()
+                if message is None:
+                    return
+                properties = self.remaining_expiry(message.properties, monotonic() - message.enqueued)
+                if properties is None and message.properties is not None:
+                    self.outbox.metrics.dropped_expired += 1
+                    continue
+                topic, properties = self.aliased(message.topic, message.qos, properties)
+                info = self.publish(topic, message.payload, qos=message.qos, retain=message.retain, properties=properties)
+                if info is not None and info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    self.outbox.restore(message)
+                    return
+                self.outbox.metrics.published += 1
+                if info is not None:
+                    self.inflight.append(info)
+        finally:
+            self._flush_lock.release()
 
     def publish_availability(self, avail, server):
         nickname = server.name
@@ -228,9 +598,14 @@ class MqttClient(mqtt.Client):
                      "online" if avail else "offline", qos=1, retain=True)
         
 
-    def ensure_connected(self, max_attempts: int = 3) -> None:
+    def ensure_connected(self, max_attempts: int = 3) -> bool:
         """Block while not connected to the broker. Retry every second, for _max_attempts_, before stopping the process.
+
+        An outage after the first connection does not block: returns False, and polling continues into the
+        journal and outbox while paho reconnects.
         """ 
+        if self.was_connected:
+            return self.is_connected()
         attempt_num = 1
 
         while not self.is_connected():
@@ -241,4 +616,5 @@ class MqttClient(mqtt.Client):
             logger.info(f"Not connected to mqtt broker, sleep 1s and retry. {attempt_num=}")
 
             sleep(1)
-        logger.info(f"Connected to MQTT broker")
+            attempt_num += 1
+        return True
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Union
+from typing import Literal, Optional, Union
 
 
 @dataclass
@@ -10,6 +10,7 @@ class ServerOptions:
     server_type: str
     connected_client: str
     modbus_id: int
+    word_order: Literal["big", "little"] = "big"  # of values spanning several registers: high or low word first
 
 
 @dataclass
@@ -51,4 +52,47 @@ class AppOptions:
     mqtt_password: str
     mwtt_ha_discovery_topic: str
     mqtt_base_topic: str
-    mqtt_reconnect_attempts: int
+    mqtt_reconnect_attempts: int  # checks, a second apart, for the first connection to the broker
+
+    slow_poll_interval_seconds: float = 60  # period of PollClass.SLOW parameters
+
+    engine: Literal["sync", "async", "threaded"] = "sync"  # polling engine, async/ threaded poll clients concurrently
+    publish_queue_size: int = 64  # threaded engine: server cycles waiting to be published before polling blocks
+
+    read_retry_attempts: int = 3  # attempts of a read failing with an IO error, before its server is marked unavailable
+    read_retry_backoff_seconds: float = 0.5  # wait after the first failed attempt, doubled every attempt
+    read_retry_max_backoff_seconds: float = 20
+    read_retry_timeout_seconds: float = 30  # budget for all attempts and waits of one read
+
+    modbus_record_dir: Optional[str] = None  # record the traffic of every client to <dir>/<client name>.mbrec
+    modbus_replay_dir: Optional[str] = None  # replay recordings from <dir> instead of connecting to the bus
+    modbus_replay_speed: float = 1  # replay speed multiplier, 0: as fast as possible
+
+    gateway_enabled: bool = False  # serve the register images of all servers over Modbus TCP
+    gateway_host: str = "0.0.0.0"
+    gateway_port: int = 502
+
+    mqtt_v5: bool = False  # MQTT v5 connection: topic aliases, message expiry and sample timestamps
+    mqtt_message_expiry_seconds: int = 300  # MQTT v5: brokers drop undelivered measurements after this, 0: never
+    mqtt_reconnect_min_delay_seconds: int = 1  # backoff of reconnects after the broker disconnects, doubled per failure
+    mqtt_reconnect_max_delay_seconds: int = 60
+    mqtt_discovery_cache: bool = True  # only republish discovery configs changed since /data/discovery_manifest.json
+    mqtt_measurement_qos: int = 0  # state messages of read parameters
+    mqtt_measurement_retain: bool = False
+    mqtt_setting_qos: int = 1  # state messages of write parameters
+    mqtt_setting_retain: bool = True
+    mqtt_fault_qos: int = 1
+    mqtt_fault_retain: bool = True
+    mqtt_aggregate_state: bool = False  # one JSON state document per server on {base}/{name}/state, instead of a topic per value
+    mqtt_outbox_max_messages: int = 5000  # state messages waiting for the broker, newest per topic
+    mqtt_outbox_max_bytes: int = 2_000_000  # of their topics and payloads
+    mqtt_outbox_max_age_seconds: float = 600  # drop waiting state messages older than this, 0: no limit
+    mqtt_outbox_drop: Literal["oldest", "newest"] = "oldest"  # message dropped when the outbox is full
+    mqtt_outbox_max_inflight: int = 20  # unacknowledged state messages before messages wait in the outbox
+    mqtt_journal_enabled: bool = True  # journal energy counters and faults during broker outages
+    mqtt_journal_max_bytes: int = 5_000_000  # of /data/mqtt_journal.jnl, oldest messages are dropped first
+    mqtt_journal_replay_rate: float = 20  # journaled messages per second after reconnecting, 0: no limit
+    publish_on_change: bool = True  # publish values only when they move beyond their deadband
+    publish_heartbeat_seconds: float = 300  # longest time a value is not published
+
+    fault_binary_sensors: bool = False  # a binary_sensor per fault alarm bit, besides the combined fault entity
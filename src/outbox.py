@@ -0,0 +1,146 @@
+"""Bounded, coalescing queue of outbound MQTT state messages.
+
+State messages wait here, keyed by topic, until the broker keeps up: a newer
+value replaces the queued one instead of queueing behind it, so after broker
+pressure or an outage the freshest state is published, not a backlog. The
+queue is capped by message count and by bytes, and messages older than
+``max_age_seconds`` are dropped instead of published.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from time import monotonic
+from typing import Any, Literal, NamedTuple, Optional
+
+from .options import AppOptions
+
+DropPolicy = Literal["oldest", "newest"]  # when full: drop the oldest queued message, or the incoming one
+
+
+class OutboundMessage(NamedTuple):
+    topic: str
+    payload: str
+    qos: int
+    retain: bool
+    enqueued: float  # time of the value, monotonic
+    properties: Any = None  # MQTT v5 publish properties
+
+    @property
+    def size(self) -> int:
+        return len(self.topic) + len(self.payload)
+
+
+@dataclass
+class OutboxMetrics:
+    """Depth of the outbox, and counters since start."""
+
+    depth: int = 0  # queued messages
+    bytes: int = 0  # of queued topics and payloads
+    enqueued: int = 0
+    coalesced: int = 0  # queued messages replaced by a newer value of their topic
+    dropped_full: int = 0
+    dropped_expired: int = 0
+    published: int = 0
+
+    @property
+    def dropped(self) -> int:
+        return self.dropped_full + self.dropped_expired
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class Outbox:
+    """Newest message per topic, oldest first. Thread safe."""
+
+    def __init__(
+        self,
+        max_messages: int = 1000,
+        max_bytes: int = 1_000_000,
+        max_age_seconds: float = 600,
+        drop: DropPolicy = "oldest",
+    ) -> None:
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds  # 0: no limit
+        self.drop = drop
+        self.metrics = OutboxMetrics()
+        self._messages: OrderedDict[str, OutboundMessage] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_app_options(cls, opts: AppOptions) -> "Outbox":
+        return cls(
+            max_messages=opts.mqtt_outbox_max_messages,
+            max_bytes=opts.mqtt_outbox_max_bytes,
+            max_age_seconds=opts.mqtt_outbox_max_age_seconds,
+            drop=opts.mqtt_outbox_drop,
+        )
+
+    def __len__(self) -> int:
+        return self.metrics.depth
+
+    def put(
+        self,
+        topic: str,
+        payload: str,
+        qos: int = 0,
+        retain: bool = False,
+        now: Optional[float] = None,
+        properties: Any = None,
+    ) -> bool:
+        """Queue _payload_ on _topic_, replacing a queued message of the topic, and dropping messages by the drop
+        policy if the outbox is full. Returns False if the message itself was dropped."""
+        message = OutboundMessage(topic, payload, qos, retain, monotonic() if now is None else now, properties)
+        with self._lock:
+            self.metrics.enqueued += 1
+            previous = self._messages.get(topic)
+            if previous is not None:
+                self.metrics.coalesced += 1
+                self._remove(topic)
+            elif self.drop == "newest" and self._full(message):
+                self.metrics.dropped_full += 1
+                return False
+            while self._messages and self._full(message):
+                self._remove(next(iter(self._messages)))
+                self.metrics.dropped_full += 1
+            self._messages[topic] = message
+            self.metrics.depth += 1
+            self.metrics.bytes += message.size
+            return True
+
+    def pop(self, now: Optional[float] = None) -> Optional[OutboundMessage]:
+        """The oldest queued message, or None if the outbox is empty. Drops expired messages."""
+        if now is None:
+            now = monotonic()
+        with self._lock:
+            while self._messages:
+                message = self._remove(next(iter(self._messages)))
+                if self.max_age_seconds and now - message.enqueued > self.max_age_seconds:
+                    self.metrics.dropped_expired += 1
+                    continue
+                return message
+            return None
+
+    def restore(self, message: OutboundMessage) -> None:
+        """Queue a popped _message_ that could not be sent again, first, unless its topic has a newer value."""
+        with self._lock:
+            if message.topic in self._messages:
+                return
+            self._messages[message.topic] = message
+            self._messages.move_to_end(message.topic, last=False)
+            self.metrics.depth += 1
+            self.metrics.bytes += message.size
+
+    def _full(self, message: OutboundMessage) -> bool:
+        return (
+            self.metrics.depth + 1 > self.max_messages
+            or self.metrics.bytes + message.size > self.max_bytes
+        )
+
+    def _remove(self, topic: str) -> OutboundMessage:
+        message = self._messages.pop(topic)
+        self.metrics.depth -= 1
+        self.metrics.bytes -= message.size
+        return message
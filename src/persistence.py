@@ -0,0 +1,47 @@
+"""Small JSON state files kept in the add-on's persistent data directory.
+
+Home Assistant mounts ``/data`` read-write for every add-on and keeps it across
+restarts and updates. Failures to read or write are logged and otherwise
+ignored, persistence is an optimisation and never required for operation.
+"""
+
+import json
+import logging
+import os
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ.get("HASSIO_DATA_PATH", "/data")
+
+
+def data_path(filename: str) -> str:
+    return os.path.join(DATA_DIR, filename)
+
+
+def load_json(filename: str, default: Any = None) -> Any:
+    """Return the parsed contents of _filename_ in the data directory, or _default_ if missing or invalid."""
+    path = data_path(filename)
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read {path}: {e}")
+        return default
+
+
+def save_json(filename: str, data: Any) -> bool:
+    """Atomically write _data_ as json to _filename_ in the data directory. Returns True on success."""
+    path = data_path(filename)
+    tmp_path = path + ".tmp"
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError) as e:
+        logger.warning(f"Could not write {path}: {e}")
+        return False
+    return True
@@ -0,0 +1,160 @@
+"""Offline read plan report.
+
+Prints the batch plan ``Server.create_batches`` produces for a model at the
+given serial settings, with the registers wasted on gaps and the estimated
+wire time of every batch. With ``--config``, also prints the minimum cycle
+time of every client in an add-on configuration.
+
+    python -m src.plan PCS500 --baudrate 9600 --stopbits 2
+    python -m src.plan PBD250 --tcp
+    python -m src.plan PCS500 --config config.yaml --server-model AtessPBD1=PBD250 --server-model AtessPBD2=PBD250
+
+No Modbus connection is made: the plan is built from the parameter registry.
+"""
+
+import argparse
+import logging
+import sys
+from typing import Optional
+
+from .batch_planner import MAX_READ_COUNT, BusTiming, wasted_registers
+from .client import SpoofClient
+from .enums import PollClass, RegisterTypes
+from .illegal_addresses import load_batch_breaks, load_illegal_addresses
+from .implemented_servers import ServerTypes
+from .loader import load_validate_options
+from .server import Server
+
+logger = logging.getLogger(__name__)
+
+
+def build_server(
+    model: str,
+    timing: BusTiming,
+    server_type: str = "ATESS_INVERTER",
+    name: str = "plan",
+    batch_size: int = MAX_READ_COUNT,
+) -> Server:
+    """Instantiate a server of _server_type_ for _model_ and build its read plan, without connecting."""
+    client = SpoofClient()
+    client.timing = timing
+    server: Server = ServerTypes[server_type].value(name, "", 0, client)
+    server.model = model
+    if model not in server.supported_models:
+        raise ValueError(f"Model {model} not in supported models {server.supported_models}")
+    server.setup_valid_registers_for_model()
+    server.illegal_addresses = load_illegal_addresses(model)
+    server.batch_breaks = load_batch_breaks(model)
+    server.exclude_illegal_parameters()
+    server.find_register_extent()
+    server.create_batches(batch_size, timing)
+    return server
+
+
+def tier_time(server: Server, timing: BusTiming, poll_class: PollClass) -> float:
+    """Estimated wire time of reading all batches of _poll_class_ once."""
+    return sum(
+        timing.read_time(len(batch))
+        for batches in server.batch_plan[poll_class].values()
+        for batch in batches
+    )
+
+
+def format_plan(server: Server, timing: BusTiming) -> list[str]:
+    lines = [
+        f"{server.name}: model {server.model}, {len(server.all_parameters)} parameters, "
+        f"gap threshold {timing.gap_threshold} registers",
+        f"  {'tier':<9}{'type':<9}{'batch':>12}{'regs':>6}{'gap':>6}{'time ms':>10}",
+    ]
+    for poll_class in PollClass:
+        frames = registers = wasted = 0
+        for register_type, batches in server.batch_plan[poll_class].items():
+            spans = server.tier_spans[poll_class][register_type]
+            for batch in batches:
+                gap = wasted_registers([batch], spans)
+                lines.append(
+                    f"  {poll_class.value:<9}{register_type.name.split('_')[0].lower():<9}"
+                    f"{f'{batch[0]}-{batch[-1]}':>12}{len(batch):>6}{gap:>6}"
+                    f"{timing.read_time(len(batch)) * 1000:>10.1f}"
+                )
+                frames += 1
+                registers += len(batch)
+                wasted += gap
+        lines.append(
+            f"  {poll_class.value} total: {frames} frames, {registers} registers, {wasted} on gaps, "
+            f"{tier_time(server, timing, poll_class) * 1000:.1f} ms"
+        )
+    return lines
+
+
+def format_config_cycle(
+    config_path: str, default_model: str, server_models: dict[str, str]
+) -> list[str]:
+    """Minimum cycle time per client and for the whole configuration, with the App polling clients in turn."""
+    opts = load_validate_options(config_path)
+    lines = [f"Configuration {config_path}:"]
+    total_realtime = 0.0
+    for cl in opts.clients:
+        timing = BusTiming.from_client_options(cl)
+        realtime = slow = static = 0.0
+        for sr in opts.servers:
+            if sr.connected_client != cl.name:
+                continue
+            model = server_models.get(sr.name, default_model)
+            server = build_server(model, timing, sr.server_type, sr.name)
+            realtime += tier_time(server, timing, PollClass.REALTIME)
+            slow += tier_time(server, timing, PollClass.SLOW)
+            static += tier_time(server, timing, PollClass.STATIC)
+            lines.append(f"  {cl.name}/{sr.name} ({model}): realtime {tier_time(server, timing, PollClass.REALTIME) * 1000:.1f} ms")
+        total_realtime += realtime
+        lines.append(
+            f"  {cl.name}: realtime {realtime * 1000:.1f} ms per cycle, "
+            f"slow {slow * 1000:.1f} ms every {opts.slow_poll_interval_seconds}s, static {static * 1000:.1f} ms once"
+        )
+    lines.append(
+        f"  minimum cycle time {total_realtime * 1000:.1f} ms bus time + "
+        f"{opts.pause_interval_seconds}s pause_interval_seconds = {total_realtime + opts.pause_interval_seconds:.3f}s"
+    )
+    return lines
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m src.plan", description=__doc__.split("\n")[0])
+    parser.add_argument("model", help="model name, e.g. PCS500, PBD250")
+    parser.add_argument("--server-type", default="ATESS_INVERTER", choices=[t.name for t in ServerTypes])
+    parser.add_argument("--tcp", action="store_true", help="plan for a Modbus TCP client")
+    parser.add_argument("--baudrate", type=int, default=9600)
+    parser.add_argument("--bytesize", type=int, default=8)
+    parser.add_argument("--parity", action="store_true")
+    parser.add_argument("--stopbits", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=MAX_READ_COUNT)
+    parser.add_argument("--config", help="config.yaml/ options.json to estimate the cycle time of")
+    parser.add_argument(
+        "--server-model",
+        action="append",
+        default=[],
+        metavar="NAME=MODEL",
+        help="model of a configured server, defaults to MODEL",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.tcp:
+        timing = BusTiming.tcp()
+    else:
+        timing = BusTiming.rtu(args.baudrate, args.bytesize, args.parity, args.stopbits)
+
+    server = build_server(args.model, timing, args.server_type, args.model, args.batch_size)
+    print("\n".join(format_plan(server, timing)))
+
+    if args.config:
+        server_models = dict(sm.split("=", 1) for sm in args.server_model)
+        print()
+        print("\n".join(format_config_cycle(args.config, args.model, server_models)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main(sys.argv[1:])
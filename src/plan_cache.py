@@ -0,0 +1,110 @@
+"""Persisted read plans, so (re)connecting does not rebuild the register map and batches.
+
+A plan is everything ``Server.connect`` computes after reading the model: the
+parameter maps, address spans and extents, and the batch plan. Plans are
+stored per model and key in a versioned json file in the data directory. The
+key hashes everything a plan was computed from (parameter registry, custom
+sensors, bus timing, illegal addresses, batch breaks), so clients with
+different bus timing keep separate plans for the same model. A plan is only
+reused when its key matches.
+"""
+
+import hashlib
+import json
+import logging
+from dataclasses import fields
+from enum import Enum
+from typing import Any, Iterable, Optional
+
+from .enums import DataType, DeviceClass, HAEntityType, PollClass, RegisterTypes
+from .persistence import load_json, save_json
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_FILE = "read_plan_cache.json"
+PLAN_CACHE_VERSION = 2  # bump when the layout of Server.plan_state or of the cache file changes
+MAX_PLANS_PER_MODEL = 4  # the least recently saved plans of a model are dropped beyond this
+
+_ENUMS: dict[str, type[Enum]] = {
+    e.__name__: e for e in (DataType, DeviceClass, HAEntityType, PollClass, RegisterTypes)
+}
+
+
+def encode(obj: Any) -> Any:
+    """Convert _obj_ to json-compatible data. Enums, ranges, tuples, sets and non-string dict keys are tagged."""
+    if isinstance(obj, Enum):
+        return {"__enum__": f"{type(obj).__name__}.{obj.name}"}
+    if isinstance(obj, range):
+        return {"__range__": [obj.start, obj.stop]}
+    if isinstance(obj, tuple):
+        return {"__tuple__": [encode(v) for v in obj]}
+    if isinstance(obj, (set, frozenset)):
+        return {"__set__": sorted(encode(v) for v in obj)}
+    if isinstance(obj, list):
+        return [encode(v) for v in obj]
+    if isinstance(obj, dict):
+        if all(isinstance(k, str) for k in obj):
+            return {k: encode(v) for k, v in obj.items()}
+        return {"__items__": [[encode(k), encode(v)] for k, v in obj.items()]}
+    return obj
+
+
+def decode(obj: Any) -> Any:
+    """Inverse of encode."""
+    if isinstance(obj, list):
+        return [decode(v) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if "__enum__" in obj:
+        enum_name, member = obj["__enum__"].split(".")
+        return _ENUMS[enum_name][member]
+    if "__range__" in obj:
+        return range(*obj["__range__"])
+    if "__tuple__" in obj:
+        return tuple(decode(v) for v in obj["__tuple__"])
+    if "__set__" in obj:
+        return set(decode(v) for v in obj["__set__"])
+    if "__items__" in obj:
+        return {decode(k): decode(v) for k, v in obj["__items__"]}
+    return {k: decode(v) for k, v in obj.items()}
+
+
+def stable_hash(obj: Any) -> str:
+    """sha256 of the canonical json form of _obj_, stable across processes (unlike hash())."""
+    canonical = json.dumps(encode(obj), sort_keys=True, default=repr)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def registry_hash(entries: Iterable[Any]) -> str:
+    """Hash of ParamWrapped registry entries, over all their fields, since build_map merges fields such as
+    poll_class, qos and retain into the cached parameter maps."""
+    return stable_hash([{f.name: getattr(e, f.name) for f in fields(e)} for e in entries])
+
+
+def load_plan(model: str, key: str) -> Optional[dict]:
+    """Return the cached plan for _model_ if it was stored under _key_ by this cache version."""
+    cache = load_json(PLAN_CACHE_FILE, default={})
+    if cache.get("version") != PLAN_CACHE_VERSION:
+        return None
+    entry = cache.get("plans", {}).get(model, {}).get(key)
+    if entry is None:
+        return None
+    try:
+        return decode(entry)
+    except (KeyError, ValueError, TypeError) as e:
+        logger.warning(f"Ignoring invalid cached read plan for {model}: {e}")
+        return None
+
+
+def save_plan(model: str, key: str, plan: dict) -> None:
+    """Store _plan_ for _model_ under _key_, next to the model's plans under other keys."""
+    cache = load_json(PLAN_CACHE_FILE, default={})
+    if cache.get("version") != PLAN_CACHE_VERSION:
+        cache = {"version": PLAN_CACHE_VERSION, "plans": {}}
+    plans = cache["plans"].setdefault(model, {})
+    plans.pop(key, None)  # re-insert as most recent
+    plans[key] = encode(plan)
+    for stale in list(plans)[:-MAX_PLANS_PER_MODEL]:
+        del plans[stale]
+    if save_json(PLAN_CACHE_FILE, cache):
+        logger.info(f"Saved read plan for model {model}")
@@ -0,0 +1,73 @@
+"""Publish-on-change filter for decoded parameter values.
+
+A value is published when it moved by at least its deadband since it was last
+published, or when it was last published ``heartbeat_seconds`` ago, so Home
+Assistant still sees static values (setpoints, version numbers) regularly.
+Deadbands come from ``device_class_to_deadband``, or the ``deadband`` of the
+parameter. Values without a deadband (enums, strings, write parameters) are
+published on any change.
+"""
+
+from time import monotonic
+from typing import Any, Optional
+
+from .enums import device_class_to_deadband
+from .server import Server
+
+
+def deadband(param) -> float:
+    """Deadband of the parameter definition _param_."""
+    return param.get("deadband", device_class_to_deadband.get(param.get("device_class"), 0))
+
+
+def moved(previous: Any, value: Any, band: float) -> bool:
+    """Whether _value_ differs from _previous_ by at least _band_, or at all for non-numeric values."""
+    numeric = (int, float)
+    if band and isinstance(value, numeric) and isinstance(previous, numeric) and not isinstance(value, bool):
+        return round(abs(value - previous), 9) >= band  # rounded values, e.g. 12.3 - 12.2 < 0.1
+    return value != previous
+
+
+class PublishFilter:
+    """Last published value and time of every parameter, per server."""
+
+    def __init__(self, heartbeat_seconds: float = 300, enabled: bool = True) -> None:
+        self.heartbeat_seconds = heartbeat_seconds
+        self.enabled = enabled
+        self._last: dict[str, dict[str, tuple[Any, float]]] = {}  # server name: parameter name: (value, time)
+        self._deadbands: dict[str, dict[str, float]] = {}  # server name: parameter name: deadband
+
+    def _server_deadbands(self, server: Server) -> dict[str, float]:
+        deadbands = self._deadbands.get(server.name)
+        if deadbands is None:
+            deadbands = {name: deadband(param) for name, param in server.all_parameters.items()}
+            self._deadbands[server.name] = deadbands
+        return deadbands
+
+    def filter(
+        self, server: Server, values: list[tuple[str, Any]], now: Optional[float] = None
+    ) -> list[tuple[str, Any]]:
+        """The (register name, value) pairs of _values_ to publish, recorded as published at _now_."""
+        if not self.enabled:
+            return values
+        if now is None:
+            now = monotonic()
+        last = self._last.setdefault(server.name, {})
+        deadbands = self._server_deadbands(server)
+        publish = []
+        for name, value in values:
+            previous = last.get(name)
+            if (
+                previous is not None
+                and now - previous[1] < self.heartbeat_seconds
+                and not moved(previous[0], value, deadbands.get(name, 0))
+            ):
+                continue
+            last[name] = (value, now)
+            publish.append((name, value))
+        return publish
+
+    def reset(self, server: Server) -> None:
+        """Publish every value of _server_ again, e.g. after it was unavailable. Its parameters are read again."""
+        self._last.pop(server.name, None)
+        self._deadbands.pop(server.name, None)
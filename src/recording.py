@@ -0,0 +1,305 @@
+"""Record and replay Modbus traffic.
+
+``RecordingClient`` wraps a client and appends every read and write, with its
+response, to a compact binary file. ``ReplayClient`` stands in for a client and
+answers reads from such a file, at real speed, at a speed multiplier, or as fast
+as possible, so the decoding and publishing path can be benchmarked and
+debugged against captured field traffic without site access.
+
+Set ``modbus_record_dir`` in the add-on options to record every client to
+``<dir>/<client name>.mbrec``, or ``modbus_replay_dir`` to replay those files
+instead of connecting to the bus (``modbus_replay_speed``: 1 real speed, 0 as
+fast as possible).
+
+File layout: the 8-byte magic ``MBREC\\x00\\x00\\x01``, then one frame per
+request, little endian::
+
+    time f64 (unix seconds), op u8, register type u8, slave id u8, address u16,
+    count u16, status u8, count x u16 values
+
+op is 0 for reads and 1 for writes. status is 0 for a response, a Modbus
+exception code, or 0xFF when the request raised an IO error. A read carries
+the registers returned, a write the registers written. A truncated last frame
+(e.g. after a power cut) is ignored.
+
+    python -m src.recording client1.mbrec
+"""
+
+import asyncio
+import logging
+import os
+import struct
+import sys
+from collections import defaultdict, deque
+from time import monotonic, sleep, time
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.pdu.register_message import (
+    ReadHoldingRegistersResponse,
+    ReadInputRegistersResponse,
+    WriteMultipleRegistersResponse,
+)
+
+from .batch_planner import DEFAULT_TIMING, BusTiming
+from .client import Client
+from .enums import RegisterTypes
+from .options import AppOptions
+from .retry import RetryMetrics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MBREC\x00\x00\x01"
+FRAME = struct.Struct("<dBBBHHB")
+READ, WRITE = 0, 1
+OK, IO_ERROR = 0, 0xFF
+RECORDING_SUFFIX = ".mbrec"
+
+
+class Frame(NamedTuple):
+    time: float
+    op: int
+    register_type: RegisterTypes
+    slave_id: int
+    address: int
+    count: int
+    status: int
+    values: tuple[int, ...]
+
+
+def write_frame(f: BinaryIO, frame: Frame) -> None:
+    f.write(
+        FRAME.pack(
+            frame.time, frame.op, frame.register_type.value, frame.slave_id, frame.address, frame.count, frame.status
+        )
+        + struct.pack(f"<{len(frame.values)}H", *frame.values)
+    )
+
+
+def read_frames(path: str) -> Iterator[Frame]:
+    """Frames of the recording at _path_, in order."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a Modbus recording")
+        while True:
+            header = f.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return
+            t, op, register_type, slave_id, address, count, status = FRAME.unpack(header)
+            n_values = count if status == OK else 0
+            data = f.read(2 * n_values)
+            if len(data) < 2 * n_values:
+                logger.warning(f"Ignoring truncated last frame of {path}")
+                return
+            yield Frame(
+                t, op, RegisterTypes(register_type), slave_id, address, count, status,
+                struct.unpack(f"<{n_values}H", data),
+            )
+
+
+def recording_path(directory: str, client_name: str) -> str:
+    return os.path.join(directory, client_name + RECORDING_SUFFIX)
+
+
+def response_status(response) -> int:
+    if isinstance(response, ExceptionResponse):
+        return response.exception_code
+    return OK
+
+
+class RecordingClient:
+    """Client wrapper appending every read and write of _client_ to the recording at _path_."""
+
+    def __init__(self, client, path: str) -> None:
+        self.client = client
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        logger.info(f"Recording Modbus traffic of {client} to {path}")
+
+    def __getattr__(self, name):
+        # name, timing, scheduler, retry_metrics, connect, close, _handle_error_response, ...
+        return getattr(self.client, name)
+
+    @property
+    def event_loop(self):
+        return self.client.event_loop
+
+    @event_loop.setter
+    def event_loop(self, event_loop):
+        """Set by AsyncApp on the wrapped AsyncClient."""
+        self.client.event_loop = event_loop
+
+    def _record(self, t: float, op: int, address: int, count: int, slave_id: int, register_type, status: int, values) -> None:
+        write_frame(self._file, Frame(t, op, register_type, slave_id, address, count, status, tuple(values)))
+        self._file.flush()
+
+    def read(self, address, count, slave_id, register_type):
+        t = time()
+        try:
+            result = self.client.read(address, count, slave_id, register_type)
+        except ModbusIOException:
+            self._record(t, READ, address, count, slave_id, register_type, IO_ERROR, ())
+            raise
+        status = response_status(result)
+        self._record(t, READ, address, count, slave_id, register_type, status, result.registers if status == OK else ())
+        return result
+
+    async def read_async(self, address, count, slave_id, register_type):
+        t = time()
+        try:
+            result = await self.client.read_async(address, count, slave_id, register_type)
+        except ModbusIOException:
+            self._record(t, READ, address, count, slave_id, register_type, IO_ERROR, ())
+            raise
+        status = response_status(result)
+        self._record(t, READ, address, count, slave_id, register_type, status, result.registers if status == OK else ())
+        return result
+
+    def write(self, values: list[int], address: int, slave_id: int, register_type):
+        t = time()
+        result = self.client.write(values, address, slave_id, register_type)
+        status = response_status(result)
+        self._record(t, WRITE, address, len(values), slave_id, register_type, status, values if status == OK else ())
+        return result
+
+    def close(self):
+        self.client.close()
+        self._file.close()
+
+    def __str__(self):
+        return str(self.client)
+
+
+class ReplayClient:
+    """
+    Stand-in for Client answering reads from the recording at _path_.
+
+    Each read is answered with the next recorded response to the same (slave id, register type, address, count),
+    once its recorded time, relative to the first frame and divided by _speed_, has passed since the first read.
+    speed 0 replays as fast as possible. Reads the recording has no more responses for raise ModbusIOException,
+    or start over if _loop_. Writes are acknowledged without being checked against the recording.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: Optional[str] = None,
+        speed: float = 1.0,
+        loop: bool = False,
+        timing: BusTiming = DEFAULT_TIMING,
+    ) -> None:
+        self.path = path
+        self.name = name or os.path.basename(path).removesuffix(RECORDING_SUFFIX)
+        self.speed = speed
+        self.loop = loop
+        self.timing = timing  # the recorded client's, so the batch plan and its requests match the recording
+        self.retry_metrics = RetryMetrics()
+        self.frames = [f for f in read_frames(path) if f.op == READ]
+        self._start: Optional[float] = None  # monotonic time of the first read
+        self._rewind()
+        logger.info(f"Replaying {len(self.frames)} reads from {path} as client {self.name}")
+
+    def _rewind(self) -> None:
+        self._queues: dict[tuple, deque[Frame]] = defaultdict(deque)
+        for frame in self.frames:
+            self._queues[(frame.slave_id, frame.register_type, frame.address, frame.count)].append(frame)
+        self._start = None
+
+    @property
+    def exhausted(self) -> bool:
+        return not any(self._queues.values())
+
+    def _next_frame(self, address, count, slave_id, register_type) -> tuple[Frame, float]:
+        """The recorded response to a read, and seconds to wait before answering it."""
+        self.retry_metrics.requests += 1
+        queue = self._queues.get((slave_id, register_type, address, count))
+        if not queue and self.loop and self.exhausted:
+            self._rewind()
+            queue = self._queues.get((slave_id, register_type, address, count))
+        if not queue:
+            self.retry_metrics.io_errors += 1
+            raise ModbusIOException(f"No recorded response to {address=}, {count=} on {slave_id=}, {register_type=}")
+        frame = queue.popleft()
+
+        if not self.speed:
+            return frame, 0
+        now = monotonic()
+        offset = (frame.time - self.frames[0].time) / self.speed
+        if self._start is None:
+            self._start = now - offset
+        return frame, max(0.0, self._start + offset - now)
+
+    @staticmethod
+    def _response(frame: Frame):
+        function_code = 3 if frame.register_type == RegisterTypes.HOLDING_REGISTER else 4
+        if frame.status == IO_ERROR:
+            raise ModbusIOException(f"Recorded IO error reading {frame.address=}, {frame.count=}")
+        if frame.status != OK:
+            return ExceptionResponse(function_code, frame.status, frame.slave_id)
+        response_class = ReadHoldingRegistersResponse if function_code == 3 else ReadInputRegistersResponse
+        return response_class(registers=list(frame.values), dev_id=frame.slave_id)
+
+    def read(self, address, count, slave_id, register_type):
+        frame, delay = self._next_frame(address, count, slave_id, register_type)
+        if delay:
+            sleep(delay)
+        return self._response(frame)
+
+    async def read_async(self, address, count, slave_id, register_type):
+        frame, delay = self._next_frame(address, count, slave_id, register_type)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._response(frame)
+
+    def write(self, values: list[int], address: int, slave_id: int, register_type):
+        if not register_type == RegisterTypes.HOLDING_REGISTER:
+            raise ValueError(f"unsupported register type {register_type}")
+        logger.info(f"Replay write of {values} at {address=} on {slave_id=} not sent")
+        return WriteMultipleRegistersResponse(address=address - 1, count=len(values), dev_id=slave_id)
+
+    def connect(self, num_retries=2, sleep_interval=3) -> None:
+        logger.info(f"Replay client {self} connected")
+
+    def close(self):
+        logger.info(f"Closing replay client {self}")
+
+    def __str__(self):
+        return f"{self.name}"
+
+    _handle_error_response = Client._handle_error_response
+
+
+def instantiate_replay_clients(OPTIONS: AppOptions) -> list[ReplayClient]:
+    """A ReplayClient for every configured client, replaying <modbus_replay_dir>/<client name>.mbrec."""
+    return [
+        ReplayClient(
+            recording_path(OPTIONS.modbus_replay_dir, cl_options.name),  # type: ignore
+            cl_options.name,
+            OPTIONS.modbus_replay_speed,
+            timing=BusTiming.from_client_options(cl_options),
+        )
+        for cl_options in OPTIONS.clients
+    ]
+
+
+def summary(path: str) -> list[str]:
+    frames = list(read_frames(path))
+    if not frames:
+        return [f"{path}: no frames"]
+    lines = [f"{path}: {len(frames)} frames over {frames[-1].time - frames[0].time:.1f}s"]
+    per_slave: dict[int, list[int]] = defaultdict(lambda: [0, 0, 0])
+    for frame in frames:
+        per_slave[frame.slave_id][frame.op] += 1
+        per_slave[frame.slave_id][2] += frame.status != OK
+    for slave_id, (reads, writes, errors) in sorted(per_slave.items()):
+        lines.append(f"  slave {slave_id}: {reads} reads, {writes} writes, {errors} errors")
+    return lines
+
+
+if __name__ == "__main__":
+    for recording in sys.argv[1:]:
+        print("\n".join(summary(recording)))
@@ -0,0 +1,69 @@
+"""Retry policy for Modbus requests that fail with an IO error (timeout, no response, bad frame).
+
+A request is retried up to ``max_attempts`` times, waiting an exponentially
+growing, jittered delay between attempts. The whole request, including waits,
+must fit in ``timeout_seconds``: the response timeout of an attempt is cut to
+the budget left. When the policy runs out, the last error is raised to the
+caller, which marks only the affected server unavailable.
+"""
+
+import logging
+import random
+from dataclasses import asdict, dataclass
+
+from .options import AppOptions
+
+logger = logging.getLogger(__name__)
+
+MIN_ATTEMPT_TIMEOUT_SECONDS = 0.05
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3
+    backoff_seconds: float = 0.5  # delay after the first failed attempt
+    max_backoff_seconds: float = 20
+    jitter: float = 0.2  # delays vary by up to +/- this fraction
+    timeout_seconds: float = 30  # budget for all attempts and waits of one request
+
+    @classmethod
+    def from_app_options(cls, opts: AppOptions) -> "RetryPolicy":
+        return cls(
+            max_attempts=opts.read_retry_attempts,
+            backoff_seconds=opts.read_retry_backoff_seconds,
+            max_backoff_seconds=opts.read_retry_max_backoff_seconds,
+            timeout_seconds=opts.read_retry_timeout_seconds,
+        )
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after failed attempt number _attempt_ (1-based)."""
+        base = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempt - 1))
+        return max(0.0, base * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def next_delay(self, attempt: int, elapsed: float):
+        """Delay before the next attempt, or None if _attempt_ was the last one the policy allows."""
+        if attempt >= self.max_attempts:
+            return None
+        delay = self.delay(attempt)
+        if elapsed + delay >= self.timeout_seconds:
+            return None
+        return delay
+
+    def attempt_timeout(self, request_timeout: float, elapsed: float) -> float:
+        """Response timeout of an attempt started _elapsed_ seconds into the request: the client's
+        _request_timeout_, cut to the budget left."""
+        return max(MIN_ATTEMPT_TIMEOUT_SECONDS, min(request_timeout, self.timeout_seconds - elapsed))
+
+
+@dataclass
+class RetryMetrics:
+    """Counters of one client's retries, since start."""
+
+    requests: int = 0
+    io_errors: int = 0
+    retries: int = 0
+    exhausted: int = 0  # requests whose error was raised to the caller
+    wait_seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
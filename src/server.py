@@ -1,7 +1,8 @@
 from abc import abstractmethod, ABC
-from functools import lru_cache
+from array import array
 import logging
-from typing import Any, Optional, TypedDict
+from time import monotonic
+from typing import Any, Generator, Iterable, Optional, TypedDict
 
 from .helpers import slugify
 from .enums import (
@@ -9,16 +10,37 @@ from .enums import (
     HAEntityType,
     RegisterTypes,
     Parameter,
+    PollClass,
     DeviceClass,
     WriteParameter,
     WriteSelectParameter,
+    default_poll_class,
     device_class_to_rounding,
 )
 from .client import Client
+from .batch_planner import (
+    MAX_READ_COUNT,
+    BusTiming,
+    plan_batches,
+    register_spans,
+    wasted_registers,
+)
+from .illegal_addresses import (
+    ILLEGAL_DATA_ADDRESS,
+    load_batch_breaks,
+    load_illegal_addresses,
+    save_batch_breaks,
+    save_illegal_addresses,
+)
 from .options import ServerOptions
+from .plan_cache import load_plan, save_plan, stable_hash
+from .codec import WordOrder
+from .decode_plan import DecodePlan, compile_decode_plan
 
 logger = logging.getLogger(__name__)
 
+ReadRequest = tuple[int, int, int, RegisterTypes]  # address, count, slave_id, register_type
+
 
 class Server(ABC):
     """
@@ -35,14 +57,27 @@ class Server(ABC):
         self.connected_client: Client = connected_client
 
         self._model: str = "unknown"
+        self.word_order: WordOrder = "big"  # of values spanning several registers, see codec
         self._fault_alarm_bits = {}  # subclass populates if fault decoding is supported
+        self._fault_words: Optional[tuple] = None  # fault registers last decoded, reset when connecting
+        self._all_parameters: Optional[dict] = None  # cache, reset in find_register_extent
+        self._slugs: dict[str, str] = {}  # parameter name: slug, built with self._all_parameters
+        self._write_slug_to_name: dict[str, str] = {}
+        self._last_polled: dict[PollClass, float] = {}  # monotonic time each poll class was last read
+        self.batch_plan: dict[PollClass, dict[RegisterTypes, tuple[range, ...]]] = {}
+        self.decode_plan: Optional[DecodePlan] = None  # compiled with the register extents
+
+        # addresses answered with Illegal Data Address, learned while reading batches
+        self.illegal_addresses: dict[RegisterTypes, set[int]] = {
+            rt: set() for rt in RegisterTypes
+        }
+        # addresses batches must start at, learned where a batch failed but both its halves were read
+        self.batch_breaks: dict[RegisterTypes, set[int]] = {rt: set() for rt in RegisterTypes}
 
-        self.holding_state: list[
-            int
-        ] = []  # registers read over self.holding_extent   (min, max)
-        self.input_state: list[
-            int
-        ] = []  # registers read over self.input_extent     (min, max)
+        # registers read over self.holding_extent/ self.input_extent (min, max), preallocated and written in place
+        self.holding_state: array = array("H")
+        self.input_state: array = array("H")
+        self._decode_buffers: dict[RegisterTypes, array] = {}  # scratch of DecodePlan.decode
 
         logger.info(f"Server {self.name} set up.")
 
@@ -70,23 +105,30 @@ class Server(ABC):
         """Return a dictionary of WriteParameter names and WriteParameter objects."""
 
     @property
-    @lru_cache
     def all_parameters(
         self,
     ) -> dict[str, Parameter | WriteParameter | WriteSelectParameter]:
-        params: dict[str, Parameter | WriteParameter | WriteSelectParameter] = (
-            self.parameters.copy()
-        )
-        params.update(self.write_parameters)
-        return params
+        if self._all_parameters is None:
+            params: dict[str, Parameter | WriteParameter | WriteSelectParameter] = (
+                self.parameters.copy()
+            )
+            params.update(self.write_parameters)
+            self._all_parameters = params
+            self._slugs = {name: slugify(name) for name in params}
+            self._write_slug_to_name = {self._slugs[name]: name for name in self.write_parameters}
+        return self._all_parameters
+
+    @property
+    def slugs(self) -> dict[str, str]:
+        """Slug of every parameter name, built once per parameter map."""
+        self.all_parameters
+        return self._slugs
 
     @property
     def write_parameters_slug_to_name(self) -> dict[str, str]:
         """Return a dictionary of mapping slugs to writeparameter names."""
-        write_parameters_slug_to_name: dict[str, str] = {
-            slugify(name): name for name in self.write_parameters.copy()
-        }
-        return write_parameters_slug_to_name
+        self.all_parameters
+        return self._write_slug_to_name
 
     @abstractmethod
     def read_model(self) -> str:
@@ -103,91 +145,191 @@ class Server(ABC):
         Removes invalid registers for the specific model of inverter.
         Requires self.model. Call self.read_model() first."""
 
+    def required_addresses(self, register_type: RegisterTypes) -> list[int]:
+        """Addresses that must be read although no parameter refers to them, e.g. fault alarm words.
+        Override in implementations that decode registers outside of the parameter map."""
+        return []
+
+    def exclude_illegal_parameters(self) -> None:
+        """Remove parameters covering any address in self.illegal_addresses from the parameter maps."""
+        for param_map in (self.parameters, self.write_parameters):
+            for name, param in list(param_map.items()):
+                illegal = self.illegal_addresses[param["register_type"]]
+                if any(
+                    a in illegal
+                    for a in range(param["addr"], param["addr"] + param["count"])
+                ):
+                    logger.warning(
+                        f"Parameter {name} of server {self.name} covers an illegal address. Not reading it"
+                    )
+                    del param_map[name]
+        self._all_parameters = None
+
     def find_register_extent(self) -> None:
-        """Find the minimum and maximum address of registers to be read for
-        holding and input register types, for read and write parameters.
+        """Find the used address spans, per poll class, and the minimum and maximum address of registers
+        to be read for holding and input register types, for read and write parameters.
 
         init internal state for each:
-            self.holding[min_addr,max_addr] np
-            self.input[min_addr, max_addr] np
+            self.poll_classes {parameter_name: PollClass}
+            self.tier_spans   {PollClass: {RegisterTypes: [(first, last), ...]}} sorted, merged
+
+            self.holding_spans [(first, last), ...] all poll classes
+            self.input_spans   [(first, last), ...] all poll classes
+
+            self.holding_addr_extent (min, max)
+            self.input_addr_extent (min, max)
 
-            self.holding_start_offset int min
-            self.input_start_offset int min
+        allocates self.holding_state, self.input_state over the extents and compiles self.decode_plan.
         """
         logger.info(f"Finding register extents for reading batches")
+        self._all_parameters = None
         parameters: dict[str, Parameter | WriteParameter | WriteSelectParameter] = (
             self.all_parameters
         )
 
-        # sort params into holding and input
-        holding_params = [
-            (k, v)
-            for k, v in parameters.items()
-            if v["register_type"] == RegisterTypes.HOLDING_REGISTER
-        ]
-        input_params = [
-            (k, v)
-            for k, v in parameters.items()
-            if v["register_type"] == RegisterTypes.INPUT_REGISTER
-        ]
-
-        # sort by address ascending
-        holding_params = sorted(holding_params, key=lambda x: x[1]["addr"])
-        input_params = sorted(input_params, key=lambda x: x[1]["addr"])
-
-        # list addresses
-        holding_addrs = [i[1]["addr"] for i in holding_params]
-        input_addrs = [i[1]["addr"] for i in input_params]
-
-        # account for last item count: meaning the largest address needs to be incremented
-        if holding_params[-1][1]["count"] != 1:
-            holding_addrs.append(
-                holding_params[-1][1]["count"] - 1 + holding_params[-1][1]["addr"]
-            )
-        if input_params[-1][1]["count"] != 1:
-            input_addrs.append(
-                input_params[-1][1]["count"] - 1 + input_params[-1][1]["addr"]
+        self.poll_classes: dict[str, PollClass] = {
+            name: param.get(
+                "poll_class", default_poll_class(name in self.write_parameters)
             )
+            for name, param in parameters.items()
+        }
 
-        logger.info(f"{holding_addrs=}")
-        logger.info(f"{input_addrs=}")
+        self.tier_spans: dict[PollClass, dict[RegisterTypes, list[tuple[int, int]]]] = {}
+        for poll_class in PollClass:
+            tier_params = {
+                name: param
+                for name, param in parameters.items()
+                if self.poll_classes[name] == poll_class
+            }
+            self.tier_spans[poll_class] = {
+                register_type: register_spans(
+                    tier_params,
+                    register_type,
+                    # decoded every cycle, so read with the realtime tier
+                    self.required_addresses(register_type)
+                    if poll_class == PollClass.REALTIME
+                    else (),
+                    self.illegal_addresses[register_type],
+                )
+                for register_type in RegisterTypes
+            }
+
+        self.holding_spans = register_spans(
+            parameters,
+            RegisterTypes.HOLDING_REGISTER,
+            self.required_addresses(RegisterTypes.HOLDING_REGISTER),
+            self.illegal_addresses[RegisterTypes.HOLDING_REGISTER],
+        )
+        self.input_spans = register_spans(
+            parameters,
+            RegisterTypes.INPUT_REGISTER,
+            self.required_addresses(RegisterTypes.INPUT_REGISTER),
+            self.illegal_addresses[RegisterTypes.INPUT_REGISTER],
+        )
+        logger.debug(f"{self.holding_spans=}")
+        logger.debug(f"{self.input_spans=}")
 
         # save min (offset) for internal state
-        self.holding_addr_extent = (min(holding_addrs), max(holding_addrs))
-        self.input_addr_extent = (min(input_addrs), max(input_addrs))
+        self.holding_addr_extent = (self.holding_spans[0][0], self.holding_spans[-1][1])
+        self.input_addr_extent = (self.input_spans[0][0], self.input_spans[-1][1])
         logger.info(f"{self.holding_addr_extent=}")
         logger.info(f"{self.input_addr_extent=}")
 
-    def create_batches(self, batch_size=125):
+        self._allocate_state()
+        self.compile_decode_plan()
+
+    def _allocate_state(self) -> None:
+        """Allocate the register state over the address extents, zeroed.
+        State persists over cycles, since slow and static tiers are not read every cycle.
+        Batches are written into it in place, so it is only reallocated when the extents change."""
+        self.holding_state = array("H", bytes(
+            2 * (self.holding_addr_extent[1] - self.holding_addr_extent[0] + 1)
+        ))
+        self.input_state = array("H", bytes(
+            2 * (self.input_addr_extent[1] - self.input_addr_extent[0] + 1)
+        ))
+        self._decode_buffers = {
+            RegisterTypes.HOLDING_REGISTER: array("H", self.holding_state),
+            RegisterTypes.INPUT_REGISTER: array("H", self.input_state),
+        }
+
+    def compile_decode_plan(self) -> None:
+        """Compile the decode plan of all parameters over the register extents.
+        Assumes the codec encoding in self.word_order, as decoded by _decoded; implementations with other encodings override this."""
+        self.decode_plan = compile_decode_plan(
+            self.all_parameters,
+            {
+                RegisterTypes.HOLDING_REGISTER: self.holding_addr_extent[0],
+                RegisterTypes.INPUT_REGISTER: self.input_addr_extent[0],
+            },
+            word_order=self.word_order,
+        )
+
+    def create_batches(self, batch_size=MAX_READ_COUNT, timing: Optional[BusTiming] = None):
         """
-        stores (uneven) batches for input and holding register addresses (self.holding_addr_extent, self.input_addr_extent)
-                self.holding_batches
-                self.input_batches
+        stores a batch plan per poll class for input and holding register addresses, planned from the used
+        address spans (self.tier_spans). Gaps are only read when cheaper than a new request on the
+        connected client's bus (see batch_planner.BusTiming).
+                self.batch_plan {PollClass: {RegisterTypes: (range, ...)}}
         """
+        if timing is None:
+            timing = getattr(self.connected_client, "timing", None)
+
+        self.batch_plan: dict[PollClass, dict[RegisterTypes, tuple[range, ...]]] = {
+            poll_class: {
+                register_type: plan_batches(
+                    spans,
+                    timing,
+                    batch_size,
+                    self.illegal_addresses[register_type],
+                    self.batch_breaks[register_type],
+                )
+                for register_type, spans in self.tier_spans[poll_class].items()
+            }
+            for poll_class in PollClass
+        }
 
-        def batch(iterable, batch_size=1):
-            l = len(iterable)
-            for ndx in range(0, l, batch_size):
-                yield iterable[ndx : min(ndx + batch_size, l)]
+        logger.debug("")
+        logger.info(
+            f"Created batches for server {self.name}: "
+            f"{len(self.holding_batches)} holding ({wasted_registers(self.holding_batches, self.holding_spans)} gap registers), "
+            f"{len(self.input_batches)} input ({wasted_registers(self.input_batches, self.input_spans)} gap registers)"
+        )
+        logger.debug(f"{self.batch_plan=}")
+        logger.debug("")
 
-        self.holding_batches = tuple(
-            batch(
-                range(self.holding_addr_extent[0], self.holding_addr_extent[1] + 1),
-                batch_size,
-            )
+    @property
+    def holding_batches(self) -> tuple[range, ...]:
+        """Holding register batches of all poll classes."""
+        return tuple(
+            b
+            for plan in self.batch_plan.values()
+            for b in plan[RegisterTypes.HOLDING_REGISTER]
         )
-        self.input_batches = tuple(
-            batch(
-                range(self.input_addr_extent[0], self.input_addr_extent[1] + 1),
-                batch_size,
-            )
+
+    @property
+    def input_batches(self) -> tuple[range, ...]:
+        """Input register batches of all poll classes."""
+        return tuple(
+            b
+            for plan in self.batch_plan.values()
+            for b in plan[RegisterTypes.INPUT_REGISTER]
         )
 
-        logger.debug("")
-        logger.info(f"Created batches for server {self.name}")
-        logger.debug(f"{self.holding_batches=}")
-        logger.debug(f"{self.input_batches}")
-        logger.debug("")
+    def poll_due(self, periods: dict[PollClass, Optional[float]]) -> list[PollClass]:
+        """
+        Return the poll classes due for reading now, and record them as polled.
+
+        periods: seconds between reads of each poll class. None: read once after connecting.
+        """
+        now = monotonic()
+        due = []
+        for poll_class, period in periods.items():
+            last = self._last_polled.get(poll_class)
+            if last is None or (period is not None and now - last >= period):
+                due.append(poll_class)
+                self._last_polled[poll_class] = now
+        return due
 
     @staticmethod
     @abstractmethod
@@ -199,12 +341,13 @@ class Server(ABC):
         -----------
         registers: list: list of ints as read from 16-bit ModBus Registers
         dtype: (DataType.U16, DataType.I16, DataType.U32, DataType.I32, ...)
+        Implementations may use self.word_order, see codec.decode_registers.
         """
 
     @staticmethod
     @abstractmethod
     def _encoded(value: int, dtype: DataType) -> list[int]:
-        "Server-specific encoding of content"
+        "Server-specific encoding of content. Raises ValueError for values out of range of dtype, see codec.encode_value"
 
     @property
     def model(self) -> str:
@@ -258,40 +401,116 @@ class Server(ABC):
 
         return available
 
-    def read_batches(self):
+    def read_batches(self, poll_classes: Optional[Iterable[PollClass]] = None):
         """
-        Read holding and input registers for the server in batches of size 125, and save to internal state
+        Read holding and input registers of the given poll classes (default all) in planned batches,
+        and save to internal state.
+
+        The state lists span the full address extent; registers of poll classes not read keep their previous value.
+        When a batch is answered with Illegal Data Address, the unreadable addresses are found by bisection,
+        persisted for the model, and the batch plan is rebuilt around them before reading all poll classes again.
+        If both halves of such a batch are read, the split is persisted as a batch break and the batch plan is
+        rebuilt, so the batch is not bisected again every cycle.
         """
-        self.holding_state = []
-        self.input_state = []
-
-        for batch in self.holding_batches:
-            logger.info(
-                f"Reading holding batch from {batch[0]} to {batch[-1]}, {len(batch)=}"
-            )
-            result = self.connected_client.read(
-                batch[0], len(batch), self.modbus_id, RegisterTypes.HOLDING_REGISTER
-            )  # TODO check
-
-            if result.isError():
-                self.connected_client._handle_error_response(result)
-                raise Exception(f"Error reading batch {batch=}")
+        steps = self._read_batches_steps(poll_classes)
+        try:
+            request = next(steps)
+            while True:
+                request = steps.send(self.connected_client.read(*request))
+        except StopIteration:
+            pass
+
+    async def read_batches_async(self, poll_classes: Optional[Iterable[PollClass]] = None):
+        """read_batches for clients with a coroutine read_async (see async_app.AsyncClient)."""
+        steps = self._read_batches_steps(poll_classes)
+        try:
+            request = next(steps)
+            while True:
+                request = steps.send(await self.connected_client.read_async(*request))  # type: ignore
+        except StopIteration:
+            pass
+
+    def _read_batches_steps(
+        self, poll_classes: Optional[Iterable[PollClass]] = None
+    ) -> Generator[ReadRequest, Any, None]:
+        """
+        Batch reading logic, independent of how the client is called.
+        Yields (address, count, slave_id, register_type) read requests and expects the response to be sent back.
+        """
+        if poll_classes is None:
+            poll_classes = tuple(PollClass)
+
+        learned = False
+        breaks = sum(len(b) for b in self.batch_breaks.values())
+        for poll_class in poll_classes:
+            for register_type, batches in self.batch_plan[poll_class].items():
+                for batch in batches:
+                    learned |= yield from self._read_batch_steps(batch, register_type)
+        learned_breaks = sum(len(b) for b in self.batch_breaks.values()) > breaks
+        if learned_breaks:
+            save_batch_breaks(self.model, self.batch_breaks)
+
+        if learned:
+            logger.info(f"Rebuilding batch plan for server {self.name} around illegal addresses")
+            save_illegal_addresses(self.model, self.illegal_addresses)
+            self.exclude_illegal_parameters()
+            self.find_register_extent()
+            self.create_batches()
+            self.save_plan_cache()
+            yield from self._read_batches_steps()
+        elif learned_breaks:  # every register was read, only later cycles need the new plan
+            logger.info(f"Rebuilding batch plan for server {self.name} around batch breaks")
+            self.create_batches()
+            self.save_plan_cache()
+
+    def _read_batch_steps(
+        self, batch: range, register_type: RegisterTypes
+    ) -> Generator[ReadRequest, Any, bool]:
+        """
+        Read one batch of registers into internal state.
 
-            self.holding_state.extend(result.registers)
+        On Illegal Data Address the batch is split in halves, which are read recursively, until the single
+        unreadable addresses are found and added to self.illegal_addresses. If both halves of a batch are read
+        whole, the start of its upper half is added to self.batch_breaks instead. Other errors raise.
 
-        for batch in self.input_batches:
-            logger.info(
-                f"Reading input batch from {batch[0]} to {batch[-1]}, {len(batch)=}"
-            )
-            result = self.connected_client.read(
-                batch[0], len(batch), self.modbus_id, RegisterTypes.INPUT_REGISTER
-            )
+        Returns True if new illegal addresses were learned.
+        """
+        logger.info(
+            f"Reading {register_type.name} batch from {batch[0]} to {batch[-1]}, {len(batch)=}"
+        )
+        result = yield (batch[0], len(batch), self.modbus_id, register_type)
 
-            if result.isError():
-                self.connected_client._handle_error_response(result)
+        if result.isError():
+            exception_code = self.connected_client._handle_error_response(result)
+            if exception_code != ILLEGAL_DATA_ADDRESS:
                 raise Exception(f"Error reading batch {batch=}")
+            if len(batch) == 1:
+                logger.warning(
+                    f"Address {batch[0]} ({register_type.name}) of server {self.name} is illegal"
+                )
+                self.illegal_addresses[register_type].add(batch[0])
+                return True
+            mid = len(batch) // 2
+            breaks = len(self.batch_breaks[register_type])
+            learned_low = yield from self._read_batch_steps(batch[:mid], register_type)
+            learned_high = yield from self._read_batch_steps(batch[mid:], register_type)
+            if not (learned_low or learned_high) and len(self.batch_breaks[register_type]) == breaks:
+                # both halves were read whole
+                logger.warning(
+                    f"Batch from {batch[0]} to {batch[-1]} ({register_type.name}) of server {self.name} "
+                    f"is only readable in parts. Not reading across {batch[mid]}"
+                )
+                self.batch_breaks[register_type].add(batch[mid])
+            return learned_low or learned_high
 
-            self.input_state.extend(result.registers)
+        if register_type == RegisterTypes.HOLDING_REGISTER:
+            state, offset = self.holding_state, batch[0] - self.holding_addr_extent[0]
+        else:
+            state, offset = self.input_state, batch[0] - self.input_addr_extent[0]
+        if len(result.registers) != len(batch):
+            raise Exception(f"Read {len(result.registers)} registers for batch {batch=}")
+        state[offset : offset + len(batch)] = array("H", result.registers)  # same length, in place
+        return False
 
     def read_from_state(self, parameter_name: str):
         param = self.all_parameters.get(parameter_name)  # type: ignore
@@ -315,13 +534,13 @@ class Server(ABC):
         if register_type == RegisterTypes.HOLDING_REGISTER:
             # logger.debug(f"{address=}, {count=}, offset={self.holding_addr_extent[0]}")
             # logger.debug(f"start {address-self.holding_addr_extent[0]}, exclusive_end = { address+count-self.holding_addr_extent[0]}")
-            result = self.holding_state[
+            result = memoryview(self.holding_state)[
                 address - self.holding_addr_extent[0] : address
                 + count
                 - self.holding_addr_extent[0]
             ]  # address is 1-indexed
         elif register_type == RegisterTypes.INPUT_REGISTER:
-            result = self.input_state[
+            result = memoryview(self.input_state)[
                 address - self.input_addr_extent[0] : address
                 + count
                 - self.input_addr_extent[0]
@@ -341,6 +560,21 @@ class Server(ABC):
 
         return val
 
+    def decode_all(self) -> dict[str, Any]:
+        """Decode every parameter from internal state, as read_from_state would, in one pass over the decode plan."""
+        if self.decode_plan is None:
+            self.compile_decode_plan()
+        values = self.decode_plan.decode(  # type: ignore
+            {
+                RegisterTypes.HOLDING_REGISTER: self.holding_state,
+                RegisterTypes.INPUT_REGISTER: self.input_state,
+            },
+            self._decode_buffers,
+        )
+        for parameter_name in self.decode_plan.fallback:  # type: ignore
+            values[parameter_name] = self.read_from_state(parameter_name)
+        return values
+
     def read_registers(self, parameter_name: str):
         """
         Read a group of registers (parameter) using pymodbus
@@ -401,7 +635,7 @@ class Server(ABC):
 
         Requires implementation of the abstract method 'Server._encoded()'
 
-        Finds correct write register name using mapping from Server.write_registers_slug_to_name
+        Finds correct write register name using mapping from Server.write_parameters_slug_to_name
         """
         parameter_name = self.write_parameters_slug_to_name[parameter_name_slug]
         param: WriteParameter = self.write_parameters[parameter_name]
@@ -457,10 +691,85 @@ class Server(ABC):
         if not self.is_available():
             logger.error(f"Server {self.name} not available")
             raise ConnectionError()
+        self._last_polled = {}  # read static registers again after (re)connecting
+        self._fault_words = None  # and publish faults again
+        if self.batch_plan:
+            logger.info(f"Reusing read plan of server {self.name} for model {self.model}")
+            return
+
         self.set_model()
+        self.illegal_addresses = load_illegal_addresses(self.model)
+        self.batch_breaks = load_batch_breaks(self.model)
+        key = self.plan_cache_key()
+        cached = load_plan(self.model, key) if key is not None else None
+        if cached is not None:
+            logger.info(f"Loaded cached read plan of server {self.name} for model {self.model}")
+            self.restore_plan_state(cached)
+            return
+
         self.setup_valid_registers_for_model()
+        self.exclude_illegal_parameters()
         self.find_register_extent()
         self.create_batches()
+        self.save_plan_cache()
+
+    def registry_hash(self) -> Optional[str]:
+        """Hash of the parameter definitions the register map is built from. Implement to enable read plan caching."""
+        return None
+
+    def plan_inputs(self) -> dict[str, Any]:
+        """Inputs of the read plan besides the registry, bus timing, illegal addresses and batch breaks, e.g.
+        defaults in code.
+        Implementations add their own and call super()."""
+        return {"default_poll_classes": (default_poll_class(False), default_poll_class(True))}
+
+    def plan_cache_key(self) -> Optional[str]:
+        """Key of the read plan: parameter registry, bus timing, illegal addresses, batch breaks and plan_inputs.
+        None disables caching."""
+        registry = self.registry_hash()
+        if registry is None:
+            return None
+        return stable_hash(
+            (
+                registry,
+                getattr(self.connected_client, "timing", None),
+                self.illegal_addresses,
+                self.batch_breaks,
+                self.plan_inputs(),
+            )
+        )
+
+    def plan_state(self) -> dict[str, Any]:
+        """Everything computed by setup_valid_registers_for_model, find_register_extent and create_batches."""
+        return {
+            "parameters": self.parameters,
+            "write_parameters": self.write_parameters,
+            "poll_classes": self.poll_classes,
+            "tier_spans": self.tier_spans,
+            "holding_spans": self.holding_spans,
+            "input_spans": self.input_spans,
+            "holding_addr_extent": self.holding_addr_extent,
+            "input_addr_extent": self.input_addr_extent,
+            "batch_plan": self.batch_plan,
+        }
+
+    def restore_plan_state(self, state: dict[str, Any]) -> None:
+        """Restore a plan_state. Implementations restore the parameter maps and call super()."""
+        self._all_parameters = None
+        self.poll_classes = state["poll_classes"]
+        self.tier_spans = state["tier_spans"]
+        self.holding_spans = state["holding_spans"]
+        self.input_spans = state["input_spans"]
+        self.holding_addr_extent = state["holding_addr_extent"]
+        self.input_addr_extent = state["input_addr_extent"]
+        self.batch_plan = state["batch_plan"]
+        self._allocate_state()
+        self.compile_decode_plan()
+
+    def save_plan_cache(self) -> None:
+        key = self.plan_cache_key()
+        if key is not None:
+            save_plan(self.model, key, self.plan_state())
 
     @classmethod
     def from_ServerOptions(cls, opts: ServerOptions, clients: list[Client]):
@@ -485,4 +794,6 @@ class Server(ABC):
             )
         connected_client = clients[idx]
 
-        return cls(name, serial, modbus_id, connected_client)
+        server = cls(name, serial, modbus_id, connected_client)
+        server.word_order = opts.word_order
+        return server
@@ -0,0 +1,375 @@
+"""Local Modbus simulator serving the Atess register map.
+
+Every configured server becomes a simulated device on one pymodbus server,
+addressed by its ``modbus_id``. The holding and input register images are
+built from the same parameter maps the add-on reads (``atess_registers_v2`` and
+custom sensors), with plausible values per device class, the model's Device
+Type Code and the configured serial number. Measurements drift slowly, energy
+counters increase, and fault bits can be toggled at random.
+
+    python -m src.simulator PCS500 --config config.yaml --port 5020
+    python -m src.simulator PCS500 --config config.yaml --rtu --server-model AtessPBD1=PBD250 --latency 0.05
+
+With ``--rtu`` the simulator listens on one end of a linked pty pair and prints
+the path of the other end, to be used as the ``port`` of an RTU client.
+Latency and exception injection emulate a slow or unreliable bus.
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import random
+import select
+import sys
+import threading
+from dataclasses import dataclass
+from time import monotonic
+from typing import Optional
+
+from pymodbus.client import ModbusSerialClient
+from pymodbus.constants import ExcCodes
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseDeviceContext
+from pymodbus.server import ModbusSerialServer, ModbusTcpServer
+
+from .atess_registers_v2 import model_code_to_name
+from .client import SpoofClient
+from .codec import WordOrder, encode_value
+from .enums import DataType, DeviceClass, HAEntityType, PollClass, RegisterTypes, default_poll_class
+from .implemented_servers import ServerTypes
+from .loader import load_validate_options
+from .server import Server
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_SPACE = 0x10000
+
+# nominal value of a parameter per device class, in engineering units
+NOMINAL_VALUES: dict[DeviceClass, float] = {
+    DeviceClass.VOLTAGE: 400,
+    DeviceClass.CURRENT: 25,
+    DeviceClass.POWER: 40,
+    DeviceClass.APPARENT_POWER: 45,
+    DeviceClass.REACTIVE_POWER: 5,
+    DeviceClass.FREQUENCY: 50,
+    DeviceClass.POWER_FACTOR: 0.98,
+    DeviceClass.TEMPERATURE: 30,
+    DeviceClass.BATTERY: 60,
+    DeviceClass.ENERGY: 1000,
+}
+ENERGY_RATE = 0.01  # kWh per second added to increasing energy counters
+
+
+@dataclass
+class SimulatorOptions:
+    latency_seconds: float = 0.0  # added to every request
+    latency_jitter_seconds: float = 0.0  # random extra latency, up to this
+    exception_rate: float = 0.0  # fraction of reads answered with exception_code
+    exception_code: int = ExcCodes.DEVICE_BUSY
+    fault_rate: float = 0.0  # chance per read of toggling a random fault bit
+    drift_amplitude: float = 0.05  # measurements vary by up to +/- this fraction
+    drift_period_seconds: float = 300
+    seed: Optional[int] = None
+
+    def __post_init__(self):
+        if self.exception_code not in {c.value for c in ExcCodes}:
+            raise ValueError(f"Unknown Modbus exception code {self.exception_code}, expected one of {exception_codes()}")
+
+
+def exception_codes() -> str:
+    return ", ".join(f"{c.value} ({c.name})" for c in ExcCodes)
+
+
+def exception_code(value: str) -> int:
+    """argparse type of --exception-code."""
+    try:
+        code = int(value)
+    except ValueError:
+        code = None
+    if code not in {c.value for c in ExcCodes}:
+        raise argparse.ArgumentTypeError(f"invalid exception code {value!r}, expected one of {exception_codes()}")
+    return code
+
+
+def to_registers(value: float, dtype: DataType, word_order: WordOrder = "big") -> list[int]:
+    """Encode raw (unscaled) _value_ into 16-bit registers, clamped to the range of _dtype_."""
+    if dtype.min_value is not None:
+        value = min(max(value, dtype.min_value), dtype.max_value)  # type: ignore
+    return encode_value(value, dtype, word_order)
+
+
+def model_code(model: str) -> int:
+    """Device Type Code of _model_."""
+    for code, name in model_code_to_name.items():
+        if name == model:
+            return code
+    raise ValueError(f"No Device Type Code for model {model}")
+
+
+class SimulatedDevice(ModbusBaseDeviceContext):
+    """
+    Device context answering reads from register images built from _server_'s parameter maps.
+
+    _server_ must have its model set and setup_valid_registers_for_model called. Addresses are the
+    1-indexed addresses of the parameter maps. Writes to holding registers are kept.
+    """
+
+    def __init__(
+        self,
+        server: Server,
+        options: SimulatorOptions = SimulatorOptions(),
+        illegal_addresses: Optional[dict[RegisterTypes, set[int]]] = None,
+    ) -> None:
+        self.server = server
+        self.options = options
+        self.illegal_addresses = illegal_addresses or {rt: set() for rt in RegisterTypes}
+        self.random = random.Random(options.seed)
+        self.started = monotonic()
+        self.requests = 0
+        self.images: dict[RegisterTypes, list[int]] = {rt: [0] * ADDRESS_SPACE for rt in RegisterTypes}
+        # (parameter, nominal raw value, phase) of values changing over time
+        self.dynamic: list[tuple[dict, float, float]] = []
+        self._build_images()
+
+    def _build_images(self) -> None:
+        for name, param in self.server.all_parameters.items():
+            device_class = param.get("device_class")
+            if name == "Device Type Code":
+                self.store(param, model_code(self.server.model))
+            elif param["dtype"] == DataType.UTF8:
+                registers = ModbusSerialClient.convert_to_registers(
+                    self.server.serial.ljust(2 * param["count"])[: 2 * param["count"]],
+                    ModbusSerialClient.DATATYPE.STRING,
+                )
+                self.images[param["register_type"]][param["addr"] : param["addr"] + param["count"]] = registers
+            elif name in self.server.write_parameters:
+                if param.get("ha_entity_type") == HAEntityType.SWITCH:
+                    self.store(param, param.get("payload_on", 1))
+                elif param.get("min") is not None and param.get("max") is not None:
+                    self.store(param, (param["min"] + param["max"]) / 2 / param["multiplier"])
+            elif device_class == DeviceClass.ENUM:
+                self.store(param, 1 if name == "Device On/Off" else 0)
+            elif device_class in NOMINAL_VALUES:
+                nominal = NOMINAL_VALUES[device_class] / param["multiplier"]
+                self.store(param, nominal)
+                poll_class = param.get("poll_class", default_poll_class(False))
+                if poll_class == PollClass.REALTIME:
+                    self.dynamic.append((param, nominal, self.random.uniform(0, 2 * math.pi)))
+
+    def store(self, param: dict, raw_value: float) -> None:
+        registers = to_registers(raw_value, param["dtype"], self.server.word_order)
+        image = self.images[param["register_type"]]
+        if param["dtype"] in (DataType.U8H, DataType.I8H):
+            image[param["addr"]] = (image[param["addr"]] & 0x00FF) | registers[0]
+        elif param["dtype"] in (DataType.U8L, DataType.I8L):
+            image[param["addr"]] = (image[param["addr"]] & 0xFF00) | registers[0]
+        else:
+            image[param["addr"] : param["addr"] + len(registers)] = registers
+
+    def refresh(self) -> None:
+        """Move measurements along their drift and energy counters along their rate."""
+        elapsed = monotonic() - self.started
+        for param, nominal, phase in self.dynamic:
+            if param.get("state_class") == "total_increasing":
+                value = nominal + ENERGY_RATE * elapsed / param["multiplier"]
+            else:
+                angle = 2 * math.pi * elapsed / self.options.drift_period_seconds + phase
+                value = nominal * (1 + self.options.drift_amplitude * math.sin(angle))
+            self.store(param, value)
+
+        fault_bits = getattr(self.server, "_fault_alarm_bits", {})
+        if fault_bits and self.random.random() < self.options.fault_rate:
+            group_num = self.random.choice(list(fault_bits))
+            if fault_bits[group_num]:
+                bit_num = self.random.choice(list(fault_bits[group_num]))
+                swapped = 1 << bit_num  # fault words are decoded byte swapped
+                addr = self.server._fault_reg_base + group_num  # type: ignore
+                self.images[RegisterTypes.INPUT_REGISTER][addr] ^= ((swapped & 0xFF) << 8) | (swapped >> 8)
+
+    def register_type(self, func_code: int) -> Optional[RegisterTypes]:
+        return {"h": RegisterTypes.HOLDING_REGISTER, "i": RegisterTypes.INPUT_REGISTER}.get(self.decode(func_code))
+
+    def reset(self) -> None:
+        self.images = {rt: [0] * ADDRESS_SPACE for rt in RegisterTypes}
+        self._build_images()
+
+    async def async_getValues(self, func_code, address, count=1):
+        await self._delay()
+        return self.getValues(func_code, address, count)
+
+    async def async_setValues(self, func_code, address, values):
+        await self._delay()
+        return self.setValues(func_code, address, values)
+
+    async def _delay(self) -> None:
+        delay = self.options.latency_seconds + self.random.uniform(0, self.options.latency_jitter_seconds)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def getValues(self, func_code, address, count=1):
+        address += 1  # pymodbus addresses are 0-indexed, parameter maps 1-indexed
+        self.requests += 1
+        register_type = self.register_type(func_code)
+        if register_type is None:
+            return ExcCodes.ILLEGAL_FUNCTION
+        if any(a in self.illegal_addresses[register_type] for a in range(address, address + count)):
+            return ExcCodes.ILLEGAL_ADDRESS
+        if self.random.random() < self.options.exception_rate:
+            return ExcCodes(self.options.exception_code)
+        self.refresh()
+        return self.images[register_type][address : address + count]
+
+    def setValues(self, func_code, address, values):
+        address += 1
+        self.requests += 1
+        if self.register_type(func_code) != RegisterTypes.HOLDING_REGISTER:
+            return ExcCodes.ILLEGAL_FUNCTION
+        if any(a in self.illegal_addresses[RegisterTypes.HOLDING_REGISTER] for a in range(address, address + len(values))):
+            return ExcCodes.ILLEGAL_ADDRESS
+        self.images[RegisterTypes.HOLDING_REGISTER][address : address + len(values)] = values
+        return None
+
+
+def build_device(
+    model: str,
+    serial: str = "SIM0000000",
+    server_type: str = "ATESS_INVERTER",
+    options: SimulatorOptions = SimulatorOptions(),
+    illegal_addresses: Optional[dict[RegisterTypes, set[int]]] = None,
+) -> SimulatedDevice:
+    """Simulated device of _server_type_ and _model_, answering the registers the add-on reads for the model."""
+    server: Server = ServerTypes[server_type].value(model, serial, 0, SpoofClient())
+    if model not in server.supported_models:
+        raise ValueError(f"Model {model} not in supported models {server.supported_models}")
+    server.model = model
+    server.setup_valid_registers_for_model()
+    return SimulatedDevice(server, options, illegal_addresses)
+
+
+def build_context(devices: dict[int, SimulatedDevice]) -> ModbusServerContext:
+    """Server context answering each modbus id with its device."""
+    return ModbusServerContext(devices=devices, single=False)
+
+
+async def serve_tcp(context: ModbusServerContext, host: str = "127.0.0.1", port: int = 5020) -> ModbusTcpServer:
+    """Start a Modbus TCP server for _context_ in the background of the running event loop."""
+    server = ModbusTcpServer(context, address=(host, port))
+    await server.serve_forever(background=True)
+    logger.info(f"Simulator listening on {host}:{port}")
+    return server
+
+
+async def serve_rtu(context: ModbusServerContext, port: str, baudrate: int = 9600) -> ModbusSerialServer:
+    """Start a Modbus RTU server for _context_ on serial _port_ in the background of the running event loop."""
+    server = ModbusSerialServer(context, port=port, baudrate=baudrate)
+    await server.serve_forever(background=True)
+    logger.info(f"Simulator listening on {port}")
+    return server
+
+
+class PtyPair:
+    """Two linked pseudo terminals, like `socat pty pty`. Bytes written to one end are read from the other."""
+
+    def __init__(self) -> None:
+        self._master_a, slave_a = os.openpty()
+        self._master_b, slave_b = os.openpty()
+        self._slaves = (slave_a, slave_b)
+        self.ports = (os.ttyname(slave_a), os.ttyname(slave_b))
+        self._thread = threading.Thread(target=self._relay, name="simulator-pty", daemon=True)
+        self._thread.start()
+
+    def _relay(self) -> None:
+        other = {self._master_a: self._master_b, self._master_b: self._master_a}
+        while True:
+            readable, _, _ = select.select(list(other), [], [])
+            for fd in readable:
+                try:
+                    data = os.read(fd, 1024)
+                except OSError:  # no end opened yet
+                    continue
+                os.write(other[fd], data)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m src.simulator", description=__doc__.split("\n")[0])
+    parser.add_argument("model", help="model of simulated servers, e.g. PCS500, PBD250")
+    parser.add_argument("--config", help="config.yaml/ options.json whose servers to simulate")
+    parser.add_argument(
+        "--server-model",
+        action="append",
+        default=[],
+        metavar="NAME=MODEL",
+        help="model of a configured server, defaults to MODEL",
+    )
+    parser.add_argument("--modbus-id", type=int, default=1, help="modbus id of the device without --config")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--rtu", action="store_true", help="serve RTU on a pty pair instead of TCP")
+    parser.add_argument("--baudrate", type=int, default=9600)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds per request, up to this")
+    parser.add_argument("--exception-rate", type=float, default=0.0, help="fraction of reads answered with an exception")
+    parser.add_argument("--exception-code", type=exception_code, default=ExcCodes.DEVICE_BUSY)
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="chance per read of toggling a fault bit")
+    parser.add_argument(
+        "--illegal-address",
+        action="append",
+        type=int,
+        default=[],
+        metavar="ADDR",
+        help="input register address answered with Illegal Data Address",
+    )
+    parser.add_argument("--seed", type=int)
+    return parser.parse_args(argv)
+
+
+def build_devices(args: argparse.Namespace) -> dict[int, SimulatedDevice]:
+    options = SimulatorOptions(
+        latency_seconds=args.latency,
+        latency_jitter_seconds=args.jitter,
+        exception_rate=args.exception_rate,
+        exception_code=args.exception_code,
+        fault_rate=args.fault_rate,
+        seed=args.seed,
+    )
+    illegal = {
+        RegisterTypes.INPUT_REGISTER: set(args.illegal_address),
+        RegisterTypes.HOLDING_REGISTER: set(),
+    }
+    if not args.config:
+        return {args.modbus_id: build_device(args.model, options=options, illegal_addresses=illegal)}
+
+    server_models = dict(sm.split("=", 1) for sm in args.server_model)
+    opts = load_validate_options(args.config)
+    return {
+        sr.modbus_id: build_device(
+            server_models.get(sr.name, args.model), sr.serialnum, sr.server_type, options, illegal
+        )
+        for sr in opts.servers
+    }
+
+
+async def run(args: argparse.Namespace) -> None:
+    devices = build_devices(args)
+    context = build_context(devices)
+    for modbus_id, device in devices.items():
+        print(f"modbus id {modbus_id}: {device.server.model}, serial {device.server.serial}")
+    if args.rtu:
+        ptys = PtyPair()
+        server = await serve_rtu(context, ptys.ports[0], args.baudrate)
+        print(f"Serving RTU at {args.baudrate} baud. Client port: {ptys.ports[1]}")
+    else:
+        server = await serve_tcp(context, args.host, args.port)
+        print(f"Serving TCP on {args.host}:{args.port}")
+    await server.serving
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    asyncio.run(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
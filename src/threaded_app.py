@@ -0,0 +1,145 @@
+"""Threaded polling engine.
+
+Selected with ``engine: threaded`` in the add-on options. Every client gets its
+own polling thread, so servers on separate RS485 adapters or TCP gateways are
+read in parallel, while servers sharing a client stay serialised on its thread.
+
+Polling threads only read and decode. Decoded values are put on a bounded
+queue that a single publisher thread drains to MQTT, so a slow broker cannot
+interleave with bus timing. When the queue is full, polling threads block
+until the publisher catches up.
+
+An error reading a server marks it disconnected, an error reconnecting it
+leaves it disconnected. Any other error on a polling thread stops the process,
+as it would with the sync engine, instead of silently ending that client's
+polling.
+"""
+
+import logging
+import os
+import signal
+import threading
+from queue import Queue
+from time import sleep
+from typing import Any, Optional
+
+from .app import App
+from .client import Client
+from .server import Server
+
+logger = logging.getLogger(__name__)
+
+# (server, [(register name, value)], (active, inactive) faults or None, unix time read)
+Publication = tuple[Server, list[tuple[str, Any]], Optional[tuple[list[str], list[str]]], float]
+
+
+class ThreadedApp(App):
+    """App polling every client on its own thread, publishing from one MQTT thread."""
+
+    def setup(self) -> None:
+        super().setup()
+        self.publish_queue: Queue[Optional[Publication]] = Queue(maxsize=self.OPTIONS.publish_queue_size)
+        self._servers_lock = threading.Lock()  # guards self.servers/ self.disconnected_servers
+
+    def loop(self, loop_once=False) -> None:
+        if not self.servers or not self.clients:
+            logger.info(f"In loop but app servers or clients not setup up")
+            raise ValueError(
+                f"In loop but app servers or clients not setup up")
+
+        publisher = threading.Thread(target=self._publish_loop, name="mqtt-publisher", daemon=True)
+        publisher.start()
+
+        pollers = [
+            threading.Thread(
+                target=self._poll_client, args=(client, loop_once), name=f"modbus-{client}", daemon=True)
+            for client in self.clients
+        ]
+        for poller in pollers:
+            poller.start()
+        for poller in pollers:
+            poller.join()
+
+        self.publish_queue.put(None)
+        publisher.join()
+
+    def _poll_client(self, client: Client, loop_once: bool) -> None:
+        """Poll the servers connected to _client_, in turn, every pause_interval. Stops the process on errors
+        other than reading or reconnecting a server."""
+        try:
+            self._poll_client_cycles(client, loop_once)
+        except Exception as e:
+            logger.exception(f"Error polling client {client}. Stop Process. \n {e}")
+            os.kill(os.getpid(), signal.SIGINT)
+
+    def _poll_client_cycles(self, client: Client, loop_once: bool) -> None:
+        while True:
+            self.republish_discovery()
+            with self._servers_lock:
+                servers = [s for s in self.servers if s.connected_client is client]
+            for server in servers:
+                try:
+                    poll_classes = server.poll_due(self.poll_periods)
+                    server.read_batches(poll_classes)
+                    values, faults, sampled_at = self.decode_server(server, poll_classes)
+                except Exception as e:
+                    logger.error(f"Error reading from {server.name}: {e}")
+                    self.mark_disconnected(server)
+                    continue
+                self.publish_queue.put((server, values, faults, sampled_at))
+            logger.info(f"Polled client {client}, {self.publish_queue.qsize()} publications queued")
+            self.log_retry_metrics(client)
+
+            if loop_once:
+                break
+
+            sleep(self.pause_interval)
+
+            with self._servers_lock:
+                disconnected = [s for s in reversed(self.disconnected_servers) if s.connected_client is client]
+            for server in disconnected:
+                try:
+                    self.reconnect(server)
+                except Exception as e:
+                    logger.error(f"Error reconnecting to {server.name}: {e}. Disable reading until next loop")
+
+            self.sleep_if_midnight()
+
+    def _publish_loop(self) -> None:
+        """Publish queued server cycles until a None sentinel is received."""
+        while True:
+            publication = self.publish_queue.get()
+            if publication is None:
+                break
+            server, values, faults, sampled_at = publication
+            try:
+                self.mqtt_client.ensure_connected(self.OPTIONS.mqtt_reconnect_attempts)
+                self.publish_decoded(server, values, faults, sampled_at)
+            except Exception as e:
+                logger.error(f"Error publishing values of {server.name}: {e}")
+
+    def republish_discovery(self) -> None:
+        with self._servers_lock:  # polling threads check in turn, the first one due publishes
+            super().republish_discovery()
+
+    def mark_disconnected(self, server: Server) -> None:
+        with self._servers_lock:
+            self.servers.remove(server)
+            self.disconnected_servers.append(server)
+        self.publish_filter.reset(server)
+        self.mqtt_client.publish_availability(False, server)
+        self.log_retry_metrics(server.connected_client)
+
+    def reconnect(self, server: Server) -> bool:
+        logger.info("Retrying connection to %s" % server.name)
+        try:
+            server.connect()
+        except ConnectionError:
+            logger.error("Error connecting to server %s. Disable reading until next loop" % server.name)
+            return False
+        logger.info("Successfully reconnected to %s" % server.name)
+        with self._servers_lock:
+            self.servers.append(server)
+            self.disconnected_servers.remove(server)
+        self.mqtt_client.publish_availability(True, server)
+        return True
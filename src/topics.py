@@ -0,0 +1,139 @@
+"""MQTT topics of a server's entities, built once per parameter map.
+
+Publishing a value and dispatching a command are dictionary lookups in a
+``TopicTable`` instead of slugifying names and formatting topics per message.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional
+
+from .enums import PollClass, default_poll_class
+from .options import AppOptions
+from .server import Server
+
+
+JOURNALED_STATE_CLASSES = ("total", "total_increasing")
+
+
+def is_measurement(param: Mapping[str, Any]) -> bool:
+    """Whether the read parameter _param_ is measurement-class telemetry, which the next cycle supersedes."""
+    return (
+        param.get("state_class") == "measurement"
+        or param.get("poll_class", default_poll_class(False)) == PollClass.REALTIME
+    )
+
+
+@dataclass(frozen=True)
+class PublishPolicy:
+    """MQTT QoS and retain flag of state messages, by kind. Parameters may set their own qos and retain."""
+
+    measurement_qos: int = 0  # read parameters, is_measurement ones are superseded by the next cycle
+    measurement_retain: bool = False
+    setting_qos: int = 1  # write parameters: control state
+    setting_retain: bool = True
+    fault_qos: int = 1
+    fault_retain: bool = True
+
+    @classmethod
+    def from_app_options(cls, opts: AppOptions) -> "PublishPolicy":
+        return cls(
+            measurement_qos=opts.mqtt_measurement_qos,
+            measurement_retain=opts.mqtt_measurement_retain,
+            setting_qos=opts.mqtt_setting_qos,
+            setting_retain=opts.mqtt_setting_retain,
+            fault_qos=opts.mqtt_fault_qos,
+            fault_retain=opts.mqtt_fault_retain,
+        )
+
+    def of(self, param: Mapping[str, Any], is_write_param: bool) -> tuple[int, bool]:
+        """QoS and retain flag of the parameter definition _param_. Read parameters other than measurements,
+        e.g. serial number and firmware version, are retained: they are published rarely, STATIC ones only once
+        after connecting, so Home Assistant would not see them again after it restarts."""
+        if is_write_param:
+            return param.get("qos", self.setting_qos), param.get("retain", self.setting_retain)
+        retain = self.measurement_retain or not is_measurement(param)
+        return param.get("qos", self.measurement_qos), param.get("retain", retain)
+
+    @property
+    def document(self) -> tuple[int, bool]:
+        """QoS and retain flag of an aggregated state document, which holds measurements and settings."""
+        return max(self.measurement_qos, self.setting_qos), self.measurement_retain or self.setting_retain
+
+
+@dataclass(frozen=True)
+class ParameterTopics:
+    slug: str
+    state_topic: str  # per-value state topic, see TopicTable.state_topic for the aggregated mode
+    sensor_discovery_topic: Optional[str] = None  # read parameters
+    discovery_topic: Optional[str] = None  # write parameters, of their number/ select/ switch entity
+    command_topic: Optional[str] = None  # write parameters
+    qos: int = 0  # of state messages
+    retain: bool = False
+    journal: bool = False  # energy counters, journaled during broker outages
+    expires: bool = False  # measurements, published with a message expiry in MQTT v5 mode, see is_measurement
+
+
+@dataclass(frozen=True)
+class TopicTable:
+    parameters: dict[str, ParameterTopics]  # parameter name: topics
+    commands: dict[str, str]  # command topic: write parameter name
+    availability_topic: str
+    state_topic: str  # aggregated state document
+
+    @classmethod
+    def build(
+        cls, server: Server, base_topic: str, discovery_prefix: str, policy: PublishPolicy = PublishPolicy()
+    ) -> "TopicTable":
+        """Topics of every parameter of _server_, and their QoS and retain flag by _policy_.
+        A name can be both a read and a write parameter, it is then published as a write parameter."""
+        nickname = server.name
+        parameters: dict[str, ParameterTopics] = {}
+        for name, slug in server.slugs.items():
+            write_param = server.write_parameters.get(name)
+            parameters[name] = ParameterTopics(
+                slug,
+                f"{base_topic}/{nickname}/{slug}/state",
+                f"{discovery_prefix}/sensor/{nickname}/{slug}/config" if name in server.parameters else None,
+                f"{discovery_prefix}/{write_param['ha_entity_type'].value}/{nickname}/{slug}/config" if write_param else None,
+                f"{base_topic}/{nickname}/{slug}/set" if write_param else None,
+                *policy.of(server.all_parameters[name], write_param is not None),
+                server.all_parameters[name].get("state_class") in JOURNALED_STATE_CLASSES,
+                write_param is None and is_measurement(server.all_parameters[name]),
+            )
+        return cls(
+            parameters,
+            {topics.command_topic: name for name, topics in parameters.items() if topics.command_topic is not None},
+            f"{base_topic}_{nickname}/availability",
+            f"{base_topic}/{nickname}/state",
+        )
+
+
+class TopicAliases:
+    """MQTT v5 topic aliases of one connection, up to the broker's TopicAliasMaximum.
+
+    A topic gets an alias when it is published a second time, so the aliases go to the state topics that
+    repeat every cycle rather than to the first topics published. The first message with a new alias carries
+    the topic too, later ones an empty topic.
+    """
+
+    def __init__(self, maximum: int = 0) -> None:
+        self.reset(maximum)
+
+    def reset(self, maximum: int) -> None:
+        """Forget all aliases, e.g. on a new connection allowing _maximum_ aliases."""
+        self.maximum = maximum
+        self.aliases: dict[str, int] = {}
+        self.seen: set[str] = set()
+
+    def alias(self, topic: str) -> tuple[int, bool]:
+        """Alias of _topic_, 0 if it has none, and whether it is new."""
+        alias = self.aliases.get(topic)
+        if alias is not None:
+            return alias, False
+        if topic not in self.seen:
+            self.seen.add(topic)
+            return 0, False
+        if len(self.aliases) >= self.maximum:
+            return 0, False
+        alias = self.aliases[topic] = len(self.aliases) + 1
+        return alias, True
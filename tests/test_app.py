@@ -1,6 +1,19 @@
+import asyncio
+import threading
 import unittest
+from types import SimpleNamespace
+from typing import Optional
+from unittest.mock import patch
+from pymodbus.exceptions import ModbusIOException
 import src.app as app
+import src.async_app as async_app
+import src.threaded_app as threaded_app
+from src.async_app import AsyncApp, AsyncClient
 from src.client import SpoofClient
+from src.enums import PollClass, RegisterTypes
+from src.options import ModbusTCPOptions
+from src.retry import RetryPolicy
+from src.threaded_app import ThreadedApp
 import logging
 logging.disable(logging.CRITICAL)
 
@@ -29,5 +42,331 @@ class TestApp(unittest.TestCase):
         self.app.loop(loop_once=True)
 
 
+
+class RecordingMqttClient:
+    """Records published values and the thread publishing them, instead of connecting to a broker."""
+
+    def __init__(self):
+        self.published: list[tuple[str, str, str]] = []
+        self.availability: list[tuple[bool, str]] = []
+        self.fault_states: list[tuple[str, dict[str, bool]]] = []
+        self.sampled_at: list[Optional[float]] = []  # unix time each published value was read
+        self.discovery_due = False  # Home Assistant came online
+        self.discovery_checks = 0
+
+    def ensure_connected(self, max_attempts=3):
+        pass
+
+    def discovery_check_due(self):
+        return self.discovery_due
+
+    def forget_missing_discovery(self):
+        self.discovery_due = False
+        self.discovery_checks += 1
+        return 1
+
+    def publish_to_ha(self, register_name, value, server, sampled_at=None):
+        self.published.append((server.name, register_name, threading.current_thread().name))
+        self.sampled_at.append(sampled_at)
+
+    def publish_faults(self, active, inactive, server, sampled_at=None):
+        pass
+
+    def publish_availability(self, avail, server):
+        self.availability.append((avail, server.name))
+
+    def publish_fault_states(self, states, server, sampled_at=None):
+        self.fault_states.append((server.name, states))
+
+
+class TestFaultTransitions(unittest.TestCase):
+    def setUp(self):
+        self.app = app.App(
+            client_instantiator_callback=lambda options: [SpoofClient()],
+            server_instantiator_callback=app.instantiate_servers,
+            options_rel_path="config.yaml"
+        )
+        self.app.midnight_sleep_enabled = False
+        self.app.setup()
+        for s in self.app.servers:
+            s.connect = lambda: None
+        self.app.disconnected_servers = []
+        self.app.mqtt_client = RecordingMqttClient()
+        self.server = self.app.servers[0]
+
+    def published(self) -> list[dict[str, bool]]:
+        return [states for name, states in self.app.mqtt_client.fault_states if name == self.server.name]
+
+    def test_first_publish_has_every_key(self):
+        self.app.publish_fault_transitions(self.server, {"a"}, {"b", "c"})
+        self.assertEqual(self.published(), [{"a": True, "b": False, "c": False}])
+
+    def test_only_changed_keys_after_first_publish(self):
+        self.app.publish_fault_transitions(self.server, {"a"}, {"b", "c"})
+        self.app.publish_fault_transitions(self.server, {"a"}, {"b", "c"})
+        self.app.publish_fault_transitions(self.server, {"b"}, {"a", "c"})
+        self.assertEqual(self.published()[1:], [{}, {"a": False, "b": True}])
+
+    def test_servers_are_tracked_separately(self):
+        other = self.app.servers[1]
+        self.app.publish_fault_transitions(self.server, {"a"}, {"b"})
+        self.app.publish_fault_transitions(other, set(), {"a", "b"})
+        self.assertEqual(self.app.mqtt_client.fault_states[1], (other.name, {"a": False, "b": False}))
+
+    def test_state_kept_across_reconnect(self):
+        self.app.publish_fault_transitions(self.server, {"a"}, {"b"})
+        self.app.mark_disconnected(self.server)
+        self.assertTrue(self.app.reconnect(self.server))
+        self.app.publish_fault_transitions(self.server, {"a", "b"}, set())
+        self.assertEqual(self.published()[1:], [{"b": True}])
+
+
+class TestPublishOnChange(unittest.TestCase):
+    def setUp(self):
+        self.app = app.App(
+            client_instantiator_callback=lambda options: [SpoofClient()],
+            server_instantiator_callback=app.instantiate_servers,
+            options_rel_path="config.yaml"
+        )
+        self.app.midnight_sleep_enabled = False
+        self.app.setup()
+        self.server = self.app.servers[0]
+        self.server.model = "PCS500"
+        self.server.setup_valid_registers_for_model()
+        self.server.find_register_extent()
+        self.server.create_batches()
+        self.server.read_batches()
+
+    def set_input_register(self, address, value):
+        self.server.input_state[address - self.server.input_addr_extent[0]] = value
+
+    def published(self) -> dict:
+        """Published values of Battery Power and Grid Frequency."""
+        values, _, _ = self.app.decode_server(self.server, [PollClass.REALTIME])
+        return {name: value for name, value in values if name in ("Battery Power", "Grid Frequency")}
+
+    def test_sub_deadband_moves_are_suppressed(self):
+        # Battery Power: input register 18, 0.1 kW per bit, published in whole kW with a 2 kW deadband
+        # Grid Frequency: input register 22, 0.01 Hz per bit, published to 0.1 Hz with a 0.2 Hz deadband
+        self.set_input_register(18, 73)
+        self.set_input_register(22, 5000)
+        self.assertEqual(self.published(), {"Battery Power": 7, "Grid Frequency": 50.0})
+
+        self.set_input_register(18, 83)  # one rounding step
+        self.set_input_register(22, 5014)
+        self.assertEqual(self.published(), {})
+
+        self.set_input_register(18, 93)
+        self.set_input_register(22, 5027)
+        self.assertEqual(self.published(), {"Battery Power": 9, "Grid Frequency": 50.3})
+
+
+class TestThreadedApp(unittest.TestCase):
+    def setUp(self):
+        class ThreadRecordingClient(SpoofClient):
+            def __init__(self, name):
+                super().__init__()
+                self.name = name
+                self.threads: set[str] = set()
+
+            def read(self, address, count, slave_id, register_type):
+                self.threads.add(threading.current_thread().name)
+                return super().read(address, count, slave_id, register_type)
+
+            def __str__(self):
+                return self.name
+
+        self.app = ThreadedApp(
+            client_instantiator_callback=lambda options: [ThreadRecordingClient("client1"), ThreadRecordingClient("client2")],
+            server_instantiator_callback=app.instantiate_servers,
+            options_rel_path="config.yaml"
+        )
+        self.app.OPTIONS.midnight_sleep_enabled = False
+        self.app.midnight_sleep_enabled = False
+        self.app.OPTIONS.servers[-1].connected_client = "client2"
+        self.app.setup()
+        for s in self.app.servers:
+            s.model = "PCS500"
+            s.setup_valid_registers_for_model()
+            s.find_register_extent()
+            s.create_batches()
+        self.app.disconnected_servers = []
+        self.app.mqtt_client = RecordingMqttClient()
+
+    def test_connect_errors_keep_polling_other_errors_stop(self):
+        class StopPolling(Exception):
+            pass
+
+        failing = self.app.servers[-1]
+        self.app.mark_disconnected(failing)
+
+        def connect():
+            raise ValueError("unexpected response")
+
+        failing.connect = connect
+        self.app.pause_interval = 0
+        cycles = {"client1": 0, "client2": 0}
+
+        def sleep_if_midnight():
+            name = threading.current_thread().name.removeprefix("modbus-")
+            cycles[name] += 1
+            if cycles[name] == 2:
+                raise StopPolling
+
+        with patch.object(self.app, "sleep_if_midnight", sleep_if_midnight), \
+                patch.object(threaded_app.os, "kill") as kill:
+            self.app.loop()
+
+        self.assertEqual(kill.call_count, 2)  # once per polling thread, after the second cycle
+        self.assertEqual(cycles, {"client1": 2, "client2": 2})
+        self.assertEqual(self.app.disconnected_servers, [failing])
+
+    def test_discovery_republished_by_one_polling_thread(self):
+        self.app.mqtt_client.discovery_due = True
+        with patch.object(self.app, "publish_discovery") as publish_discovery:
+            self.app.loop(loop_once=True)
+        publish_discovery.assert_called_once()
+        self.assertEqual(self.app.mqtt_client.discovery_checks, 1)
+
+    def test_one_loop_polls_each_client_on_its_thread(self):
+        with patch.object(threaded_app.logger, "error") as error, patch.object(app.logger, "info") as info:
+            self.app.loop(loop_once=True)
+        error.assert_not_called()
+        for client in self.app.clients:
+            self.assertIn(
+                f"Client {client} retry metrics: {client.retry_metrics.as_dict()}",
+                [c.args[0] for c in info.call_args_list],
+            )
+
+        for client in self.app.clients:
+            self.assertEqual(client.threads, {f"modbus-{client}"})
+        published = self.app.mqtt_client.published
+        self.assertEqual({name for name, _, _ in published}, {s.name for s in self.app.servers})
+        self.assertEqual({thread for _, _, thread in published}, {"mqtt-publisher"})
+        self.assertTrue(all(sampled_at is not None for sampled_at in self.app.mqtt_client.sampled_at))
+
+
+class TestAsyncApp(unittest.TestCase):
+    def setUp(self):
+        class AsyncSpoofClient(SpoofClient):
+            def __init__(self, name):
+                super().__init__()
+                self.name = name
+                self.tasks: set[asyncio.Task] = set()
+                self.failing = False
+
+            async def read_async(self, address, count, slave_id, register_type):
+                self.tasks.add(asyncio.current_task())
+                if self.failing:
+                    raise ModbusIOException("no response")
+                return self.read(address, count, slave_id, register_type)
+
+            def __str__(self):
+                return self.name
+
+        self.app = AsyncApp(
+            client_instantiator_callback=lambda options: [AsyncSpoofClient("client1"), AsyncSpoofClient("client2")],
+            server_instantiator_callback=app.instantiate_servers,
+            options_rel_path="config.yaml"
+        )
+        self.app.OPTIONS.midnight_sleep_enabled = False
+        self.app.midnight_sleep_enabled = False
+        self.app.OPTIONS.servers[-1].connected_client = "client2"
+        self.app.setup()
+        for s in self.app.servers:
+            s.connect = lambda: None
+            s.model = "PCS500"
+            s.setup_valid_registers_for_model()
+            s.find_register_extent()
+            s.create_batches()
+        self.app.disconnected_servers = []
+        self.app.mqtt_client = RecordingMqttClient()
+        self.app.pause_interval = 0
+
+    def tearDown(self):
+        self.app.event_loop.call_soon_threadsafe(self.app.event_loop.stop)
+        self.app._loop_thread.join()
+
+    def test_one_loop_polls_each_client_in_its_task(self):
+        with patch.object(async_app.logger, "error") as error:
+            self.app.loop(loop_once=True)
+        error.assert_not_called()
+
+        client1, client2 = self.app.clients
+        self.assertEqual(len(client1.tasks), 1)
+        self.assertEqual(len(client2.tasks), 1)
+        self.assertNotEqual(client1.tasks, client2.tasks)
+        published = self.app.mqtt_client.published
+        self.assertEqual({name for name, _, _ in published}, {s.name for s in self.app.servers})
+
+    def test_failing_server_is_disconnected_and_reconnected(self):
+        class StopPolling(Exception):
+            pass
+
+        cycle_done = threading.Barrier(2)
+
+        def stop_after_cycle():  # every client task calls sleep_if_midnight once per cycle, after reconnecting
+            cycle_done.wait(timeout=5)
+            raise StopPolling
+
+        client2 = self.app.clients[1]
+        client2.failing = True
+        failing_server = next(s for s in self.app.servers if s.connected_client is client2)
+        original_reconnect = self.app.reconnect
+
+        def reconnect(server):
+            client2.failing = False
+            return original_reconnect(server)
+
+        with patch.object(self.app, "sleep_if_midnight", stop_after_cycle), \
+                patch.object(self.app, "reconnect", reconnect), self.assertRaises(StopPolling):
+            self.app.loop()
+
+        self.assertEqual(self.app.mqtt_client.availability, [(False, failing_server.name), (True, failing_server.name)])
+        self.assertIn(failing_server, self.app.servers)
+        self.assertEqual(self.app.disconnected_servers, [])
+
+
+class TestAsyncClient(unittest.TestCase):
+    def test_created_on_the_event_loop(self):
+        polling_app = AsyncApp(async_app.instantiate_async_clients, app.instantiate_servers, options_rel_path="config.yaml")
+        polling_app.midnight_sleep_enabled = False
+        polling_app.setup()
+        self.addCleanup(polling_app._loop_thread.join)
+        self.addCleanup(polling_app.event_loop.call_soon_threadsafe, polling_app.event_loop.stop)
+
+        self.assertTrue(all(isinstance(client, AsyncClient) for client in polling_app.clients))
+        self.assertIs(polling_app.client_instantiator_callback, async_app.instantiate_async_clients)
+
+    def test_io_errors_are_retried(self):
+        class FlakyModbusClient:
+            def __init__(self, failures):
+                self.failures = failures
+                self.comm_params = SimpleNamespace(timeout_connect=3.0)
+
+            async def read_input_registers(self, address, count, device_id):
+                if self.failures:
+                    self.failures -= 1
+                    raise ModbusIOException("no response")
+                return SpoofClient.SpoofResponse([0] * count)
+
+        async def read_twice():
+            client = AsyncClient(
+                ModbusTCPOptions(name="client1", type="TCP", host="127.0.0.1", port=5020),
+                RetryPolicy(max_attempts=2, backoff_seconds=0, jitter=0),
+            )
+            client.client = FlakyModbusClient(failures=1)
+            response = await client.read_async(1, 2, 1, RegisterTypes.INPUT_REGISTER)
+            self.assertEqual(response.registers, [0, 0])
+
+            client.client = FlakyModbusClient(failures=2)
+            with self.assertRaises(ModbusIOException):
+                await client.read_async(1, 2, 1, RegisterTypes.INPUT_REGISTER)
+            return client
+
+        metrics = asyncio.run(read_twice()).retry_metrics
+        self.assertEqual((metrics.requests, metrics.io_errors, metrics.retries, metrics.exhausted), (2, 3, 2, 1))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import logging
+
+from src.batch_planner import (
+    MAX_READ_COUNT,
+    BusTiming,
+    plan_batches,
+    register_spans,
+    wasted_registers,
+)
+from src.enums import RegisterTypes
+from src.atess_inverter import AtessInverter
+from src.client import SpoofClient
+from src.plan import build_server, format_config_cycle, tier_time
+from src.enums import PollClass
+
+logging.disable(logging.CRITICAL)
+
+
+class AddressClient(SpoofClient):
+    """Returns a register value derived from its address, so misplaced batches are detected.
+    Both bytes are ASCII letters so string registers decode."""
+
+    def read(self, address, count, slave_id, register_type):
+        return SpoofClient.SpoofResponse(
+            [
+                ((0x41 + a % 26) << 8) | (0x41 + (a + register_type.value) % 26)
+                for a in range(address, address + count)
+            ]
+        )
+
+
+class TestBatchPlanner(unittest.TestCase):
+    def test_rtu_gap_threshold(self):
+        # 9600 8N2: 11 bits per byte. Overhead of 13 frame bytes, 7 silent chars and 20ms turnaround
+        timing = BusTiming.rtu(9600, 8, False, 2)
+        self.assertAlmostEqual(timing.byte_time, 11 / 9600)
+        self.assertEqual(timing.gap_threshold, 18)
+
+    def test_tcp_never_splits_on_gaps(self):
+        self.assertEqual(BusTiming.tcp().gap_threshold, MAX_READ_COUNT)
+
+    def test_register_spans_merge(self):
+        params = {
+            "a": {"addr": 1, "count": 1, "register_type": RegisterTypes.INPUT_REGISTER},
+            "b": {"addr": 2, "count": 2, "register_type": RegisterTypes.INPUT_REGISTER},
+            "c": {"addr": 10, "count": 1, "register_type": RegisterTypes.INPUT_REGISTER},
+            "d": {"addr": 5, "count": 1, "register_type": RegisterTypes.HOLDING_REGISTER},
+        }
+        self.assertEqual(
+            register_spans(params, RegisterTypes.INPUT_REGISTER, [12]),
+            [(1, 3), (10, 10), (12, 12)],
+        )
+
+    def test_split_on_large_gap(self):
+        timing = BusTiming(byte_time=1.0, frame_overhead=10.0)  # gap threshold 5
+        batches = plan_batches([(1, 2), (8, 8), (20, 21)], timing)
+        self.assertEqual(batches, (range(1, 9), range(20, 22)))
+        self.assertEqual(wasted_registers(batches, [(1, 2), (8, 8), (20, 21)]), 5)
+
+    def test_pdu_limit(self):
+        batches = plan_batches([(1, 100), (110, 130), (140, 400)], BusTiming.tcp())
+        self.assertTrue(all(len(b) <= MAX_READ_COUNT for b in batches))
+        covered = {a for b in batches for a in b}
+        for first, last in [(1, 100), (110, 130), (140, 400)]:
+            self.assertTrue(set(range(first, last + 1)) <= covered)
+
+    def test_no_batch_across_breaks(self):
+        batches = plan_batches([(1, 10), (12, 20)], BusTiming.tcp(), breaks={5, 12})
+        self.assertEqual(batches, (range(1, 5), range(5, 11), range(12, 21)))
+
+    def test_plan_reads_less_than_full_extent(self):
+        inv = AtessInverter("test", "", 1, AddressClient())
+        inv.model = "PCS500"
+        inv.setup_valid_registers_for_model()
+        inv.find_register_extent()
+        inv.create_batches()
+
+        planned = sum(len(b) for b in inv.holding_batches + inv.input_batches)
+        full = (inv.holding_addr_extent[1] - inv.holding_addr_extent[0] + 1) + (
+            inv.input_addr_extent[1] - inv.input_addr_extent[0] + 1
+        )
+        self.assertLess(planned, full)
+
+    def test_read_from_state_unchanged(self):
+        """Every parameter decodes as if the whole extent had been read."""
+        client = AddressClient()
+        inv = AtessInverter("test", "", 1, client)
+        inv.model = "PBD250"
+        inv.setup_valid_registers_for_model()
+        inv.find_register_extent()
+        inv.create_batches()
+        inv.read_batches()
+
+        for name in inv.all_parameters:
+            self.assertEqual(inv.read_from_state(name), inv.read_registers(name), name)
+
+
+class TestPlanReport(unittest.TestCase):
+    def test_build_server_offline(self):
+        timing = BusTiming.rtu(9600)
+        server = build_server("PBD250", timing)
+        self.assertGreater(tier_time(server, timing, PollClass.REALTIME), 0)
+        self.assertEqual(server.connected_client.timing, timing)
+
+    def test_unsupported_model(self):
+        with self.assertRaises(ValueError):
+            build_server("XYZ1", BusTiming.tcp())
+
+    def test_config_cycle(self):
+        lines = format_config_cycle("config.yaml", "PCS500", {"AtessPBD1": "PBD250"})
+        self.assertIn("minimum cycle time", lines[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from src.bus_scheduler import AsyncTransactionScheduler, Priority, TransactionScheduler
+
+
+class TestTransactionScheduler(unittest.TestCase):
+    def test_waiting_write_goes_before_waiting_read(self):
+        scheduler = TransactionScheduler()
+        order: list[str] = []
+
+        def request(name, priority):
+            with scheduler.transaction(priority):
+                order.append(name)
+
+        with scheduler.transaction():  # batch in flight
+            read = threading.Thread(target=request, args=("read", Priority.READ))
+            read.start()
+            time.sleep(0.05)
+            write = threading.Thread(target=request, args=("write", Priority.WRITE))
+            write.start()
+            while scheduler.waiting_writes == 0:
+                time.sleep(0.001)
+        read.join()
+        write.join()
+
+        self.assertEqual(order, ["write", "read"])
+
+    def test_transactions_never_overlap(self):
+        scheduler = TransactionScheduler()
+        active = []
+        overlaps = []
+
+        def request(priority):
+            for _ in range(50):
+                with scheduler.transaction(priority):
+                    active.append(1)
+                    if len(active) > 1:
+                        overlaps.append(1)
+                    time.sleep(0.0001)
+                    active.pop()
+
+        threads = [threading.Thread(target=request, args=(p,)) for p in (Priority.READ, Priority.READ, Priority.WRITE)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(overlaps, [])
+
+
+class TestAsyncTransactionScheduler(unittest.TestCase):
+    def test_waiting_write_goes_before_waiting_read(self):
+        async def run() -> list[str]:
+            scheduler = AsyncTransactionScheduler()
+            order: list[str] = []
+
+            async def request(name, priority):
+                async with scheduler.transaction(priority):
+                    order.append(name)
+
+            async with scheduler.transaction():
+                read = asyncio.create_task(request("read", Priority.READ))
+                await asyncio.sleep(0)
+                write = asyncio.create_task(request("write", Priority.WRITE))
+                await asyncio.sleep(0)
+            await asyncio.gather(read, write)
+            return order
+
+        self.assertEqual(asyncio.run(run()), ["write", "read"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from src.codec import decode_registers, encode_value
+from src.decode_plan import compile_decode_plan
+from src.enums import DataType, RegisterTypes
+
+VALUES = {
+    DataType.U8H: 200,
+    DataType.U8L: 7,
+    DataType.I8H: -100,
+    DataType.I8L: -1,
+    DataType.U16: 65535,
+    DataType.I16: -2,
+    DataType.U32: 4000000000,
+    DataType.I32: -123456789,
+    DataType.U64: 18446744073709551615,
+    DataType.I64: -9223372036854775808,
+    DataType.F32: 1.5,
+    DataType.F64: -2.25e100,
+}
+
+
+class TestCodec(unittest.TestCase):
+    def test_round_trip(self):
+        for word_order in ("big", "little"):
+            for dtype, value in VALUES.items():
+                registers = encode_value(value, dtype, word_order)
+                self.assertEqual(len(registers), max(1, dtype.size // 2), dtype)
+                self.assertEqual(decode_registers(registers, dtype, word_order), value, (dtype, word_order))
+        self.assertEqual(decode_registers(encode_value("ABC", DataType.UTF8), DataType.UTF8), "ABC")
+
+    def test_word_order(self):
+        self.assertEqual(encode_value(0x12345678, DataType.U32, "big"), [0x1234, 0x5678])
+        self.assertEqual(encode_value(0x12345678, DataType.U32, "little"), [0x5678, 0x1234])
+        self.assertEqual(encode_value(1.0, DataType.F32, "big"), [0x3F80, 0x0000])
+        self.assertEqual(encode_value(0x12, DataType.U8H, "little"), [0x1200])
+        self.assertEqual(decode_registers([0x0304], DataType.I8H, "little"), 3)
+
+    def test_range_checks(self):
+        for dtype in (DataType.U16, DataType.I16, DataType.U32, DataType.I32, DataType.I64, DataType.U8L, DataType.I8H):
+            with self.assertRaises(ValueError, msg=dtype):
+                encode_value(dtype.max_value + 1, dtype)
+            with self.assertRaises(ValueError, msg=dtype):
+                encode_value(dtype.min_value - 1, dtype)
+        with self.assertRaises(ValueError):
+            encode_value(1e39, DataType.F32)
+        self.assertEqual(encode_value(233.99999, DataType.U16), [234])
+
+    def test_decode_plan_matches_codec(self):
+        parameters, registers, addr = {}, [], 1
+        for dtype, value in VALUES.items():
+            count = max(1, dtype.size // 2)
+            parameters[dtype.value] = {
+                "addr": addr, "count": count, "dtype": dtype, "multiplier": 1,
+                "register_type": RegisterTypes.INPUT_REGISTER,
+            }
+            addr += count
+        for word_order in ("big", "little"):
+            image = [0] * (addr - 1)
+            for dtype, value in VALUES.items():
+                param = parameters[dtype.value]
+                image[param["addr"] - 1 : param["addr"] - 1 + param["count"]] = encode_value(value, dtype, word_order)
+            plan = compile_decode_plan(parameters, {rt: 1 for rt in RegisterTypes}, word_order=word_order)
+            decoded = plan.decode({RegisterTypes.INPUT_REGISTER: image, RegisterTypes.HOLDING_REGISTER: []})
+            self.assertEqual(decoded, {dtype.value: value for dtype, value in VALUES.items()}, word_order)
+
+
+if __name__ == "__main__":
+    unittest.main()
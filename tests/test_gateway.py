@@ -0,0 +1,107 @@
+import logging
+import socket
+import unittest
+
+from pymodbus.client import ModbusTcpClient
+
+from src.atess_inverter import AtessInverter
+from src.batch_planner import BusTiming
+from src.client import Client, SpoofClient
+from src.enums import RegisterTypes
+from src.gateway import Gateway
+
+logging.disable(logging.CRITICAL)
+
+
+class CountingClient(SpoofClient):
+    """Answers address % 100, and records writes."""
+
+    _handle_error_response = Client._handle_error_response
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.writes: list[tuple[list[int], int, int]] = []
+
+    def read(self, address, count, slave_id, register_type):
+        self.reads += 1
+        return SpoofClient.SpoofResponse([a % 100 for a in range(address, address + count)])
+
+    def write(self, values, address, slave_id, register_type):
+        self.writes.append((values, address, slave_id))
+        return super().write(values, address, slave_id, register_type)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestGateway(unittest.TestCase):
+    def setUp(self):
+        self.client = CountingClient()
+        self.servers = []
+        for modbus_id, model in ((1, "PCS500"), (2, "PBD250")):
+            inv = AtessInverter(f"inv{modbus_id}", "", modbus_id, self.client)
+            inv.model = model
+            inv.setup_valid_registers_for_model()
+            inv.find_register_extent()
+            inv.create_batches()
+            inv.read_batches()
+            self.servers.append(inv)
+        self.available = set(self.servers)
+
+        port = free_port()
+        self.gateway = Gateway(self.servers, lambda server: server in self.available)
+        self.gateway.start("127.0.0.1", port)
+        self.tcp = ModbusTcpClient("127.0.0.1", port=port)
+        self.tcp.connect()
+
+    def tearDown(self):
+        self.tcp.close()
+        self.gateway.stop()
+
+    def test_reads_served_from_state(self):
+        reads = self.client.reads
+        # Battery SOC, input register 48 (1-indexed)
+        result = self.tcp.read_input_registers(47, count=2, device_id=1)
+        self.assertEqual(result.registers, [48, 49])
+        result = self.tcp.read_holding_registers(43, count=1, device_id=2)
+        self.assertEqual(result.registers, [44])
+        self.assertEqual(self.client.reads, reads)
+
+    def test_errors(self):
+        result = self.tcp.read_input_registers(5000, count=1, device_id=1)
+        self.assertEqual(result.exception_code, 2)
+
+        self.available.discard(self.servers[1])
+        result = self.tcp.read_input_registers(47, count=1, device_id=2)
+        self.assertEqual(result.exception_code, 0x0B)
+
+    def test_unread_addresses(self):
+        server = self.servers[0]
+        server.create_batches(timing=BusTiming(byte_time=1, frame_overhead=0))  # gaps are never read
+        batches = server.input_batches
+        gap = next(b[-1] + 1 for b, following in zip(batches, batches[1:]) if following[0] > b[-1] + 1)
+        result = self.tcp.read_input_registers(gap - 1, count=1, device_id=1)
+        self.assertEqual(result.exception_code, 2)
+        result = self.tcp.read_input_registers(gap - 2, count=2, device_id=1)  # last register of a batch, and the gap
+        self.assertEqual(result.exception_code, 2)
+
+        illegal = batches[0][0]
+        server.illegal_addresses[RegisterTypes.INPUT_REGISTER].add(illegal)
+        result = self.tcp.read_input_registers(illegal - 1, count=1, device_id=1)
+        self.assertEqual(result.exception_code, 2)
+        result = self.tcp.read_input_registers(illegal, count=1, device_id=1)
+        self.assertEqual(result.registers, [(illegal + 1) % 100])
+
+    def test_writes_forwarded(self):
+        self.tcp.write_registers(47, [25], device_id=1)
+        self.assertEqual(self.client.writes, [([25], 48, 1)])
+        result = self.tcp.read_holding_registers(47, count=1, device_id=1)
+        self.assertEqual(result.registers, [25])
+
+
+if __name__ == "__main__":
+    unittest.main()
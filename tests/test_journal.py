@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from src.journal import Journal, read_entries
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "journal.jnl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        journal = Journal(self.path)
+        journal.append("a/state", "1.5", qos=1, retain=True)
+        journal.append("b/state", '{"active": ["G1D0"]}')
+        self.assertGreater(len(journal), 0)
+
+        entries = Journal(self.path).take()  # e.g. after a restart
+        self.assertEqual([entry[1:] for entry in entries], [
+            ("a/state", "1.5", 1, True), ("b/state", '{"active": ["G1D0"]}', 0, False),
+        ])
+        self.assertEqual(len(journal), 0)
+        self.assertEqual(journal.take(), [])
+
+    def test_capped_oldest_dropped(self):
+        journal = Journal(self.path, max_bytes=1000)
+        for i in range(100):
+            journal.append("topic", str(i))
+        self.assertLessEqual(len(journal), 1000)
+        payloads = [int(entry.payload) for entry in journal.take()]
+        self.assertEqual(payloads, list(range(payloads[0], 100)))
+        self.assertGreater(payloads[0], 0)
+
+    def test_put_back_and_truncated_frame(self):
+        journal = Journal(self.path)
+        journal.append("topic", "1")
+        journal.append("topic", "2")
+        taken = journal.take()
+        journal.append("topic", "3")
+        journal.put_back(taken[1:])
+        self.assertEqual([entry.payload for entry in read_entries(self.path)], ["2", "3"])
+
+        with open(self.path, "ab") as f:
+            f.write(b"\x00\x01")
+        self.assertEqual([entry.payload for entry in journal.take()], ["2", "3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
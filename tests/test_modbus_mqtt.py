@@ -0,0 +1,393 @@
+import json
+import logging
+import tempfile
+import unittest
+from time import time
+from types import SimpleNamespace
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+import src.persistence as persistence
+from src.atess_inverter import AtessInverter
+from src.client import SpoofClient
+from src.helpers import slugify
+from src.loader import load_validate_options
+from src.modbus_mqtt import DISCOVERY_CHECK_SECONDS, MqttClient
+from src.topics import is_measurement
+
+logging.disable(logging.CRITICAL)
+
+
+class PublishRecordingMqttClient(MqttClient):
+    """Records publish calls instead of sending them."""
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.published: list[tuple[str, str]] = []
+        self.flags: dict[str, tuple[int, bool]] = {}  # topic: (qos, retain) of its last message
+        self.subscribed: list = []
+        self.unsubscribed: list = []
+        self.properties: list = []  # of each published message
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published.append((topic, payload))
+        self.properties.append(properties)
+        self.flags[topic] = (qos, retain)
+
+    def subscribe(self, topic, *args, **kwargs):
+        self.subscribed.append(topic)
+
+    def unsubscribe(self, topic, *args, **kwargs):
+        self.unsubscribed.append(topic)
+
+    def is_connected(self):
+        return True
+
+
+def make_server() -> AtessInverter:
+    inv = AtessInverter("inv", "SERIAL", 1, SpoofClient())
+    inv.model = "PCS500"
+    inv.setup_valid_registers_for_model()
+    return inv
+
+
+class TestTopics(unittest.TestCase):
+    def setUp(self):
+        self.mqtt = PublishRecordingMqttClient(load_validate_options("config.yaml"))
+        self.mqtt.servers = [make_server()]
+        self.server = self.mqtt.servers[0]
+
+    def test_command_dispatch(self):
+        self.mqtt.publish_discovery_topics(self.server)
+        topics = self.mqtt.topics(self.server).parameters["Discharge Cutoff SOC"]
+        self.assertEqual(topics.command_topic, f"{self.mqtt.base_topic}/inv/discharge_cutoff_soc/set")
+
+        self.mqtt.message_handler(type("Message", (), {"topic": topics.command_topic, "payload": b"25"}))
+        self.assertEqual(self.mqtt.published[-1][0], topics.state_topic)
+
+        with self.assertRaises(ValueError):
+            self.mqtt.message_handler(type("Message", (), {"topic": "unknown/set", "payload": b"25"}))
+
+    def test_invalid_command_rejected(self):
+        self.mqtt.publish_discovery_topics(self.server)
+        topics = self.mqtt.topics(self.server).parameters["Discharge Cutoff SOC"]
+        for payload in (b"70000", b"abc"):  # out of U16 range, not a number
+            self.mqtt.published.clear()
+            self.mqtt.message_handler(type("Message", (), {"topic": topics.command_topic, "payload": payload}))
+            self.assertEqual(self.mqtt.published[-1][0], topics.state_topic)  # current setting published again
+
+        self.mqtt.servers = []
+        self.mqtt.published.clear()
+        self.mqtt.message_handler(type("Message", (), {"topic": topics.command_topic, "payload": b"25"}))
+        self.assertEqual(self.mqtt.published, [])
+
+    def test_table_rebuilt_with_parameter_map(self):
+        table = self.mqtt.topics(self.server)
+        self.assertIs(self.mqtt.topics(self.server), table)
+        self.server.find_register_extent()
+        self.assertIsNot(self.mqtt.topics(self.server), table)
+        self.assertEqual(len(self.mqtt.command_index), len(self.server.write_parameters))
+
+
+class TestPublishPolicy(unittest.TestCase):
+    def setUp(self):
+        self.options = load_validate_options("config.yaml")
+        self.server = make_server()
+
+    def test_defaults_by_kind(self):
+        mqtt = PublishRecordingMqttClient(self.options)
+        measurement = next(
+            name for name, p in self.server.parameters.items() if name not in self.server.write_parameters and is_measurement(p)
+        )
+        setting = next(iter(self.server.write_parameters))
+        mqtt.publish_to_ha(measurement, 1, self.server)
+        mqtt.publish_to_ha(setting, 1, self.server)
+        mqtt.publish_to_ha("Serial Number", "A1", self.server)  # STATIC, published once after connecting
+        mqtt.publish_faults([], [], self.server)
+
+        table = mqtt.topics(self.server)
+        self.assertEqual(mqtt.flags[table.parameters[measurement].state_topic], (0, False))
+        self.assertEqual(mqtt.flags[table.parameters[setting].state_topic], (1, True))
+        self.assertEqual(mqtt.flags[table.parameters["Serial Number"].state_topic], (0, True))
+        self.assertEqual(mqtt.flags[f"{mqtt.base_topic}/inv/fault_alarms/state"], (1, True))
+
+    def test_options_and_parameter_overrides(self):
+        self.options.mqtt_measurement_qos = 1
+        self.options.mqtt_setting_retain = False
+        measurement = next(name for name in self.server.parameters if name not in self.server.write_parameters)
+        self.server.parameters[measurement]["retain"] = True
+        mqtt = PublishRecordingMqttClient(self.options)
+
+        table = mqtt.topics(self.server)
+        self.assertEqual((table.parameters[measurement].qos, table.parameters[measurement].retain), (1, True))
+        setting = table.parameters[next(iter(self.server.write_parameters))]
+        self.assertEqual((setting.qos, setting.retain), (1, False))
+
+
+class TestReconnect(unittest.TestCase):
+    def test_session_restored(self):
+        options = load_validate_options("config.yaml")
+        options.mqtt_journal_enabled = False
+        mqtt = PublishRecordingMqttClient(options)
+        server = make_server()
+        mqtt.servers = [server]
+        mqtt.on_connect(mqtt, None, None, 0, None)
+        mqtt.publish_discovery_topics(server)
+        mqtt.subscribed, mqtt.published = [], []
+
+        mqtt.is_connected = lambda: False
+        mqtt.on_disconnect(mqtt, None, None, 7, None)  # the process keeps running
+        self.assertIsNotNone(mqtt.disconnected_at)
+        self.assertFalse(mqtt.ensure_connected(max_attempts=0))
+        mqtt.is_connected = lambda: True
+        mqtt.on_connect(mqtt, None, None, 0, None)
+
+        self.assertEqual(mqtt.subscribed, [
+            "homeassistant/status", [(topic, 0) for topic in mqtt.topics(server).commands],
+        ])
+        self.assertEqual(mqtt.published, [(f"{mqtt.base_topic}_inv/availability", "online")])
+        self.assertIsNone(mqtt.disconnected_at)
+
+
+class TestMqttV5(unittest.TestCase):
+    def test_aliases_expiry_and_timestamps(self):
+        options = load_validate_options("config.yaml")
+        options.mqtt_v5 = True
+        mqtt = PublishRecordingMqttClient(options)
+        server = make_server()
+        connack = Properties(PacketTypes.CONNACK)
+        connack.TopicAliasMaximum = 1
+        mqtt.on_connect(mqtt, None, None, 0, connack)
+
+        measurement = next(
+            name for name, p in server.parameters.items() if name not in server.write_parameters and is_measurement(p)
+        )
+        setting = next(iter(server.write_parameters))
+        for value in range(3):
+            mqtt.publish_to_ha(measurement, value, server)
+            mqtt.publish_to_ha(setting, value, server)
+
+        table = mqtt.topics(server)
+        measurements = [i for i in range(6) if i % 2 == 0]
+        self.assertEqual([mqtt.published[i][0] for i in measurements], [table.parameters[measurement].state_topic] * 2 + [""])
+        self.assertEqual([getattr(mqtt.properties[i], "TopicAlias", None) for i in measurements], [None, 1, 1])
+        self.assertEqual(mqtt.properties[0].MessageExpiryInterval, options.mqtt_message_expiry_seconds)
+
+        settings = [i for i in range(6) if i % 2 == 1]
+        self.assertEqual({mqtt.published[i][0] for i in settings}, {table.parameters[setting].state_topic})
+        self.assertFalse(any(hasattr(mqtt.properties[i], "TopicAlias") for i in settings))  # QoS 1
+        self.assertFalse(hasattr(mqtt.properties[1], "MessageExpiryInterval"))
+        self.assertEqual([name for name, _ in mqtt.properties[1].UserProperty], ["ts"])
+
+        mqtt.on_disconnect(mqtt, None, None, 7, None)
+        self.assertEqual(mqtt.topic_aliases.alias(table.parameters[measurement].state_topic), (0, False))
+
+    def test_timestamp_and_expiry_from_read_time(self):
+        options = load_validate_options("config.yaml")
+        options.mqtt_v5 = True
+        options.mqtt_message_expiry_seconds = 60
+        mqtt = PublishRecordingMqttClient(options)
+        connected = False
+        mqtt.is_connected = lambda: connected
+        server = make_server()
+        measurements = [
+            name for name, p in server.parameters.items() if name not in server.write_parameters and is_measurement(p)
+        ]
+
+        # queued in the outbox while disconnected
+        now = time()
+        mqtt.publish_to_ha(measurements[0], 1, server, sampled_at=now - 20)
+        mqtt.publish_to_ha(measurements[1], 1, server, sampled_at=now - 61)
+        connected = True
+        mqtt.flush_outbox()
+
+        self.assertEqual(len(mqtt.published), 1)
+        properties = mqtt.properties[0]
+        self.assertEqual(properties.UserProperty, [("ts", str(round((now - 20) * 1000)))])
+        self.assertIn(properties.MessageExpiryInterval, (39, 40))
+        self.assertEqual(mqtt.outbox.metrics.dropped_expired, 1)
+
+
+class TestOutbox(unittest.TestCase):
+    def test_backpressure(self):
+        options = load_validate_options("config.yaml")
+        options.mqtt_journal_enabled = False
+        mqtt = PublishRecordingMqttClient(options)
+        server = make_server()
+        name = next(iter(server.parameters))
+        connected = False
+        mqtt.is_connected = lambda: connected
+
+        for value in range(3):
+            mqtt.publish_to_ha(name, value, server)
+        mqtt.publish_faults([], [], server)
+        self.assertEqual(mqtt.published, [])
+        self.assertEqual(len(mqtt.outbox), 2)
+
+        connected = True
+        mqtt.flush_outbox()
+        self.assertEqual(mqtt.published[0], (mqtt.topics(server).parameters[name].state_topic, "2"))
+        self.assertEqual(len(mqtt.published), 2)
+        self.assertEqual(mqtt.outbox.metrics.as_dict()["published"], 2)
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = persistence.DATA_DIR
+        persistence.DATA_DIR = self.tmp.name
+        options = load_validate_options("config.yaml")
+        options.mqtt_journal_replay_rate = 0
+        self.mqtt = PublishRecordingMqttClient(options)
+        self.connected = False
+        self.mqtt.is_connected = lambda: self.connected
+        self.server = make_server()
+
+    def tearDown(self):
+        persistence.DATA_DIR = self.data_dir
+        self.tmp.cleanup()
+
+    def test_outage_replayed_in_order(self):
+        counter = next(name for name, p in self.server.parameters.items() if p.get("state_class") == "total_increasing")
+        measurement = next(name for name, p in self.server.parameters.items() if p.get("state_class") == "measurement")
+        for value in (1, 2, 3):
+            self.mqtt.publish_to_ha(counter, value, self.server)
+            self.mqtt.publish_to_ha(measurement, value, self.server)
+        self.mqtt.publish_fault_states({"G1D0": True}, self.server)
+        self.assertEqual(self.mqtt.published, [])
+
+        self.connected = True
+        self.mqtt.replaying = True
+        self.mqtt.flush_outbox()  # live messages wait for the replay
+        self.assertEqual(self.mqtt.published, [])
+        self.mqtt.replay_journal()
+
+        counter_topic = self.mqtt.topics(self.server).parameters[counter].state_topic
+        measurement_topic = self.mqtt.topics(self.server).parameters[measurement].state_topic
+        fault_topic = f"{self.mqtt.base_topic}/inv/fault_g1d0/state"
+        self.assertEqual(self.mqtt.published, [
+            (counter_topic, "1"), (counter_topic, "2"), (counter_topic, "3"), (fault_topic, "ON"),  # journal
+            (counter_topic, "3"), (measurement_topic, "3"), (fault_topic, "ON"),  # outbox
+        ])
+        self.assertEqual(len(self.mqtt.journal), 0)
+
+    def test_disconnect_during_replay(self):
+        counter = next(name for name, p in self.server.parameters.items() if p.get("state_class") == "total_increasing")
+        for value in (1, 2):
+            self.mqtt.publish_to_ha(counter, value, self.server)
+        self.mqtt.publish = lambda *args, **kwargs: setattr(self, "connected", False)
+
+        self.connected = True
+        self.mqtt.replay_journal()
+        self.assertEqual([entry.payload for entry in self.mqtt.journal.take()], ["2"])
+
+
+class TestAggregatedState(unittest.TestCase):
+    def setUp(self):
+        options = load_validate_options("config.yaml")
+        options.mqtt_aggregate_state = True
+        self.mqtt = PublishRecordingMqttClient(options)
+        self.server = make_server()
+
+    def test_discovery_selects_from_state_document(self):
+        self.mqtt.publish_discovery_topics(self.server)
+        configs = [json.loads(payload) for topic, payload in self.mqtt.published if topic.endswith("/config")]
+        self.assertEqual(len(configs), len(self.server.parameters) + len(self.server.write_parameters))
+        for config in configs:
+            self.assertEqual(config["state_topic"], f"{self.mqtt.base_topic}/inv/state")
+            self.assertIn("value_json[", config["value_template"])
+
+        enum_name = next(name for name, p in self.server.parameters.items() if "value_template" in p)
+        enum_config = next(c for c in configs if c["name"] == enum_name)
+        self.assertTrue(enum_config["value_template"].startswith(
+            f"{{% set value = value_json['{slugify(enum_name)}'] | string %}}"))
+
+    def test_document_keeps_last_values(self):
+        first, second = list(self.server.parameters)[:2]
+        self.mqtt.publish_state_document([(first, 1.5), (second, 1)], self.server)
+        self.mqtt.publish_to_ha(first, 2.0, self.server)
+
+        self.assertEqual([topic for topic, _ in self.mqtt.published], [f"{self.mqtt.base_topic}/inv/state"] * 2)
+        self.assertEqual(json.loads(self.mqtt.published[-1][1]), {slugify(first): 2.0, slugify(second): 1})
+
+
+class TestDiscoveryManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = persistence.DATA_DIR
+        persistence.DATA_DIR = self.tmp.name
+        self.options = load_validate_options("config.yaml")
+
+    def tearDown(self):
+        persistence.DATA_DIR = self.data_dir
+        self.tmp.cleanup()
+
+    def restart(self, server, server_names=("inv",), publish_all=False) -> list[tuple[str, str]]:
+        """Discovery of a new process, returns the configs it published."""
+        mqtt = PublishRecordingMqttClient(self.options)
+        if publish_all:
+            mqtt.discovery_manifest = {}
+        if server is not None:
+            mqtt.publish_discovery_topics(server)
+        mqtt.finish_discovery(list(server_names))
+        return [(topic, payload) for topic, payload in mqtt.published if topic.endswith("/config")]
+
+    def test_unchanged_configs_skipped(self):
+        server = make_server()
+        first = self.restart(server)
+        self.assertEqual(len(first), len(server.parameters) + len(server.write_parameters))
+        self.assertEqual(self.restart(server), [])
+
+        removed = next(iter(server.parameters))
+        del server.parameters[removed]
+        server.find_register_extent()
+        self.assertEqual(self.restart(server), [(f"homeassistant/sensor/inv/{slugify(removed)}/config", "")])
+
+    def test_missing_configs_republished_when_home_assistant_comes_online(self):
+        server = make_server()
+        self.restart(server)
+        mqtt = PublishRecordingMqttClient(self.options)
+        mqtt.publish_discovery_topics(server)
+        mqtt.finish_discovery(["inv"])
+        self.assertEqual(mqtt.published[1:], [])  # only availability
+        retained = dict(self.restart(server, publish_all=True))
+
+        def message(topic, payload, retain=False):
+            return SimpleNamespace(topic=topic, payload=payload, retain=retain)
+
+        subscribed = len(mqtt.subscribed)
+        mqtt.message_handler(message("homeassistant/status", b"offline"))
+        self.assertEqual((len(mqtt.subscribed), mqtt.discovery_check_started), (subscribed, None))
+        mqtt.message_handler(message("homeassistant/status", b"online"))
+        self.assertEqual(mqtt.subscribed[-1], [("homeassistant/+/inv/+/config", 0)])
+
+        # the broker sends back all retained configs but one, and a stale one
+        lost, stale = list(retained)[:2]
+        for topic, payload in retained.items():
+            if topic == stale:
+                payload = payload.replace('"name"', '"old_name"')
+            if topic != lost:
+                mqtt.message_handler(message(topic, payload.encode(), retain=True))
+        self.assertFalse(mqtt.discovery_check_due())
+
+        mqtt.discovery_check_started -= DISCOVERY_CHECK_SECONDS
+        self.assertTrue(mqtt.discovery_check_due())
+        self.assertEqual(mqtt.forget_missing_discovery(), 2)
+        self.assertEqual(mqtt.unsubscribed, [["homeassistant/+/inv/+/config"]])
+        mqtt.publish_discovery_topics(server)
+        mqtt.finish_discovery(["inv"])
+        self.assertEqual({topic for topic, _ in mqtt.published if topic.endswith("/config")}, {lost, stale})
+        self.assertFalse(mqtt.discovery_check_due())
+        self.assertEqual(self.restart(server), [])  # manifest saved again
+
+    def test_servers(self):
+        self.restart(make_server())
+        self.assertEqual(self.restart(None), [])  # configured, not connected yet
+        cleared = self.restart(None, server_names=())
+        self.assertTrue(cleared)
+        self.assertEqual({payload for _, payload in cleared}, {""})
+
+
+if __name__ == "__main__":
+    unittest.main()
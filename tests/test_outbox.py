@@ -0,0 +1,51 @@
+import unittest
+
+from src.outbox import Outbox
+
+
+class TestOutbox(unittest.TestCase):
+    def test_coalesces_by_topic(self):
+        outbox = Outbox()
+        outbox.put("a", "1", now=0)
+        outbox.put("b", "1", now=1)
+        outbox.put("a", "2", qos=1, retain=True, now=2)
+
+        self.assertEqual(len(outbox), 2)
+        self.assertEqual(outbox.metrics.coalesced, 1)
+        self.assertEqual(outbox.pop(now=3)[:4], ("b", "1", 0, False))
+        self.assertEqual(outbox.pop(now=3)[:4], ("a", "2", 1, True))
+        self.assertIsNone(outbox.pop(now=3))
+        self.assertEqual((outbox.metrics.depth, outbox.metrics.bytes), (0, 0))
+
+    def test_caps(self):
+        outbox = Outbox(max_messages=2)
+        for topic in "abc":
+            self.assertTrue(outbox.put(topic, "1", now=0))
+        self.assertEqual([outbox.pop(now=0).topic, outbox.pop(now=0).topic], ["b", "c"])
+
+        outbox = Outbox(max_bytes=6, drop="newest")
+        self.assertTrue(outbox.put("a", "12", now=0))
+        self.assertTrue(outbox.put("b", "12", now=0))
+        self.assertFalse(outbox.put("c", "12", now=0))
+        self.assertTrue(outbox.put("a", "34", now=0))  # replaces, fits
+        self.assertEqual(outbox.metrics.dropped_full, 1)
+        self.assertEqual(outbox.metrics.bytes, 6)
+
+    def test_age_and_restore(self):
+        outbox = Outbox(max_age_seconds=10)
+        outbox.put("a", "1", now=0)
+        outbox.put("b", "1", now=5)
+        message = outbox.pop(now=12)
+        self.assertEqual(message.topic, "b")
+        self.assertEqual(outbox.metrics.dropped_expired, 1)
+
+        outbox.put("c", "1", now=12)
+        outbox.restore(message)
+        self.assertEqual(outbox.pop(now=13).topic, "b")
+        outbox.put("b", "2", now=13)
+        outbox.restore(message)  # older than the queued value
+        self.assertEqual([outbox.pop(now=13).payload, outbox.pop(now=13).payload], ["1", "2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from src.enums import DeviceClass
+from src.publish_filter import PublishFilter
+
+
+class StubServer:
+    name = "inv"
+    all_parameters = {
+        "Power": {"device_class": DeviceClass.POWER},
+        "Setpoint": {"device_class": DeviceClass.POWER, "deadband": 0},
+        "Mode": {"device_class": DeviceClass.ENUM},
+    }
+
+
+class TestPublishFilter(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.filter = PublishFilter(heartbeat_seconds=300)
+
+    def test_deadbands(self):
+        values = [("Power", 12), ("Setpoint", 5.0), ("Mode", "on")]
+        self.assertEqual(self.filter.filter(self.server, values, now=0), values)
+        self.assertEqual(self.filter.filter(self.server, values, now=1), [])
+
+        # one rounding step (kW) is within the deadband of the last published value, drifting beyond it is not
+        self.assertEqual(self.filter.filter(self.server, [("Power", 13)], now=2), [])
+        self.assertEqual(self.filter.filter(self.server, [("Power", 14)], now=3), [("Power", 14)])
+        self.assertEqual(self.filter.filter(self.server, [("Setpoint", 5.01)], now=4), [("Setpoint", 5.01)])
+        self.assertEqual(self.filter.filter(self.server, [("Mode", "off")], now=5), [("Mode", "off")])
+
+    def test_heartbeat_and_reset(self):
+        values = [("Power", 12), ("Mode", "on")]
+        self.filter.filter(self.server, values, now=0)
+        self.assertEqual(self.filter.filter(self.server, values, now=299), [])
+        self.assertEqual(self.filter.filter(self.server, values, now=300), values)
+
+        self.filter.reset(self.server)
+        self.assertEqual(self.filter.filter(self.server, values, now=301), values)
+
+    def test_disabled(self):
+        self.filter.enabled = False
+        values = [("Power", 12)]
+        self.filter.filter(self.server, values, now=0)
+        self.assertEqual(self.filter.filter(self.server, values, now=1), values)
+
+
+if __name__ == "__main__":
+    unittest.main()
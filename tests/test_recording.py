@@ -0,0 +1,91 @@
+import logging
+import os
+import tempfile
+import unittest
+from time import monotonic
+
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse
+
+import src.persistence as persistence
+from src.atess_inverter import AtessInverter
+from src.client import Client, SpoofClient
+from src.enums import RegisterTypes
+from src.recording import OK, READ, Frame, RecordingClient, ReplayClient, read_frames, write_frame, MAGIC
+
+logging.disable(logging.CRITICAL)
+
+
+class CountingClient(SpoofClient):
+    """Answers address % 100, and Illegal Data Address at input register 52."""
+
+    _handle_error_response = Client._handle_error_response
+
+    def read(self, address, count, slave_id, register_type):
+        if register_type == RegisterTypes.INPUT_REGISTER and address <= 52 < address + count:
+            return ExceptionResponse(0x04, 2)
+        return SpoofClient.SpoofResponse([a % 100 for a in range(address, address + count)])
+
+
+def make_server(client) -> AtessInverter:
+    inv = AtessInverter("test", "", 1, client)
+    inv.model = "PBD250"
+    inv.setup_valid_registers_for_model()
+    inv.find_register_extent()
+    inv.create_batches()
+    return inv
+
+
+class TestRecording(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "client1.mbrec")
+        self.data_dir = persistence.DATA_DIR
+        persistence.DATA_DIR = self.tmp.name
+
+    def tearDown(self):
+        persistence.DATA_DIR = self.data_dir
+        self.tmp.cleanup()
+
+    def test_replay_reproduces_state(self):
+        recorder = RecordingClient(CountingClient(), self.path)
+        recorded = make_server(recorder)
+        recorded.read_batches()
+        recorder.close()
+
+        frames = list(read_frames(self.path))
+        self.assertTrue(any(f.status == 2 for f in frames))
+
+        replayed = make_server(ReplayClient(self.path, speed=0))
+        replayed.read_batches()
+        self.assertEqual(replayed.illegal_addresses, recorded.illegal_addresses)
+        self.assertEqual(replayed.input_state, recorded.input_state)
+        self.assertEqual(replayed.holding_state, recorded.holding_state)
+        self.assertTrue(replayed.connected_client.exhausted)
+        with self.assertRaises(ModbusIOException):
+            replayed.read_batches()
+
+    def test_truncated_frame_ignored(self):
+        with open(self.path, "wb") as f:
+            f.write(MAGIC)
+            write_frame(f, Frame(0.0, READ, RegisterTypes.INPUT_REGISTER, 1, 1, 2, OK, (1, 2)))
+            write_frame(f, Frame(1.0, READ, RegisterTypes.INPUT_REGISTER, 1, 1, 2, OK, (3, 4)))
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertEqual([f.values for f in read_frames(self.path)], [(1, 2)])
+
+    def test_speed(self):
+        with open(self.path, "wb") as f:
+            f.write(MAGIC)
+            for t in (100.0, 101.0, 102.0):
+                write_frame(f, Frame(t, READ, RegisterTypes.INPUT_REGISTER, 1, 1, 1, OK, (int(t),)))
+
+        client = ReplayClient(self.path, speed=10)
+        start = monotonic()
+        values = [client.read(1, 1, 1, RegisterTypes.INPUT_REGISTER).registers[0] for _ in range(3)]
+        self.assertEqual(values, [100, 101, 102])
+        self.assertAlmostEqual(monotonic() - start, 0.2, delta=0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
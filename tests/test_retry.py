@@ -0,0 +1,98 @@
+import unittest
+import logging
+from types import SimpleNamespace
+from unittest import mock
+
+from pymodbus.exceptions import ModbusIOException
+
+from src.client import Client, SpoofClient
+from src.enums import RegisterTypes
+from src.options import ModbusTCPOptions
+from src.retry import RetryPolicy
+
+logging.disable(logging.CRITICAL)
+
+
+class FlakyModbusClient:
+    """Raises ModbusIOException for the first _failures_ reads. Records the response timeout of every read."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+        self.comm_params = SimpleNamespace(timeout_connect=3.0)
+        self.timeouts: list[float] = []
+
+    def read_input_registers(self, address, count, device_id):
+        self.calls += 1
+        self.timeouts.append(self.comm_params.timeout_connect)
+        if self.calls <= self.failures:
+            raise ModbusIOException("no response")
+        return SpoofClient.SpoofResponse([1] * count)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_exponential_backoff_capped(self):
+        policy = RetryPolicy(backoff_seconds=1, max_backoff_seconds=5, jitter=0)
+        self.assertEqual([policy.delay(a) for a in range(1, 6)], [1, 2, 4, 5, 5])
+
+    def test_jitter_bounds(self):
+        policy = RetryPolicy(backoff_seconds=1, jitter=0.2)
+        for _ in range(100):
+            self.assertTrue(0.8 <= policy.delay(1) <= 1.2)
+
+    def test_attempts_and_budget(self):
+        policy = RetryPolicy(max_attempts=3, backoff_seconds=1, jitter=0, timeout_seconds=10)
+        self.assertEqual(policy.next_delay(1, 0), 1)
+        self.assertIsNone(policy.next_delay(3, 0))
+        self.assertIsNone(policy.next_delay(1, 9.5))
+
+    def test_attempt_timeout_within_budget(self):
+        policy = RetryPolicy(timeout_seconds=10)
+        self.assertEqual(policy.attempt_timeout(3, 0), 3)
+        self.assertEqual(policy.attempt_timeout(3, 8.5), 1.5)
+        self.assertGreater(policy.attempt_timeout(3, 12), 0)
+
+
+class TestClientRetry(unittest.TestCase):
+    def make_client(self, failures: int, policy: RetryPolicy) -> Client:
+        client = Client(ModbusTCPOptions(name="tcp", type="TCP", host="localhost", port=502), policy)
+        client.client = FlakyModbusClient(failures)
+        client.request_timeout = client.client.comm_params.timeout_connect
+        return client
+
+    @mock.patch("src.client.sleep")
+    def test_recovers_within_policy(self, sleep):
+        client = self.make_client(2, RetryPolicy(max_attempts=3, backoff_seconds=1, jitter=0))
+        result = client.read(1, 2, 1, RegisterTypes.INPUT_REGISTER)
+        self.assertEqual(result.registers, [1, 1])
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2])
+        self.assertEqual(client.retry_metrics.retries, 2)
+        self.assertEqual(client.retry_metrics.wait_seconds, 3)
+        self.assertEqual(client.retry_metrics.exhausted, 0)
+
+    @mock.patch("src.client.sleep")
+    def test_raises_when_exhausted(self, sleep):
+        client = self.make_client(5, RetryPolicy(max_attempts=3, backoff_seconds=1, jitter=0))
+        with self.assertRaises(ModbusIOException):
+            client.read(1, 2, 1, RegisterTypes.INPUT_REGISTER)
+        self.assertEqual(client.client.calls, 3)
+        self.assertEqual(client.retry_metrics.io_errors, 3)
+        self.assertEqual(client.retry_metrics.exhausted, 1)
+
+    @mock.patch("src.client.sleep")
+    @mock.patch("src.client.monotonic", side_effect=[0, 0, 3, 8.5, 8.6])
+    def test_request_timeout_cut_to_budget(self, monotonic, sleep):
+        client = self.make_client(5, RetryPolicy(max_attempts=3, backoff_seconds=1, jitter=0, timeout_seconds=10))
+        with self.assertRaises(ModbusIOException):
+            client.read(1, 2, 1, RegisterTypes.INPUT_REGISTER)
+        self.assertEqual(client.client.timeouts, [3, 1.5])
+        self.assertEqual(client.client.comm_params.timeout_connect, 3)  # restored for writes and connecting
+
+    def test_single_request_per_attempt(self):
+        client = Client(ModbusTCPOptions(name="tcp", type="TCP", host="localhost", port=502), RetryPolicy())
+        self.assertEqual(client.client.retries, 0)
+        self.assertEqual(client.request_timeout, client.client.comm_params.timeout_connect)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,351 @@
+import asyncio
+import unittest
+import logging
+import tempfile
+from dataclasses import replace
+from unittest.mock import patch
+
+from pymodbus.pdu import ExceptionResponse
+
+import src.persistence as persistence
+from src.atess_inverter import AtessInverter
+from src.client import Client, SpoofClient
+from src.atess_registers_v2 import PCS_FAULT_ALARM_BITS, atess_param_registry
+from src.enums import PollClass, RegisterTypes
+from src.fault_key_validator import coerce_fault_name_key
+from src.illegal_addresses import load_batch_breaks, load_illegal_addresses
+from src.plan_cache import MAX_PLANS_PER_MODEL, load_plan, registry_hash, save_plan
+
+logging.disable(logging.CRITICAL)
+
+
+class IllegalAddressClient(SpoofClient):
+    """Answers Illegal Data Address for any read touching one of _illegal_ input addresses."""
+
+    _handle_error_response = Client._handle_error_response
+
+    def __init__(self, illegal: set[int]):
+        super().__init__()
+        self.illegal = illegal
+        self.reads: list[tuple[int, int, RegisterTypes]] = []
+
+    def read(self, address, count, slave_id, register_type):
+        self.reads.append((address, count, register_type))
+        if register_type == RegisterTypes.INPUT_REGISTER and any(
+            a in self.illegal for a in range(address, address + count)
+        ):
+            return ExceptionResponse(0x04, 2)
+        return SpoofClient.SpoofResponse([a % 100 for a in range(address, address + count)])
+
+
+class TestIllegalAddresses(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = persistence.DATA_DIR
+        persistence.DATA_DIR = self.tmp.name
+
+    def tearDown(self):
+        persistence.DATA_DIR = self.data_dir
+        self.tmp.cleanup()
+
+    def make_server(self, client) -> AtessInverter:
+        inv = AtessInverter("test", "", 1, client)
+        inv.model = "PBD250"
+        inv.setup_valid_registers_for_model()
+        inv.illegal_addresses = load_illegal_addresses(inv.model)
+        inv.batch_breaks = load_batch_breaks(inv.model)
+        inv.exclude_illegal_parameters()
+        inv.find_register_extent()
+        inv.create_batches()
+        return inv
+
+    def test_bisect_learns_and_persists(self):
+        # 52: PV1 Power (read parameter), 55: a gap register inside a batch
+        client = IllegalAddressClient({52, 55})
+        inv = self.make_server(client)
+        self.assertIn("PV1 Power", inv.parameters)
+
+        inv.read_batches()
+
+        self.assertEqual(inv.illegal_addresses[RegisterTypes.INPUT_REGISTER], {52, 55})
+        self.assertNotIn("PV1 Power", inv.parameters)
+        for batch in inv.input_batches:
+            self.assertNotIn(52, batch)
+            self.assertNotIn(55, batch)
+        self.assertEqual(inv.read_from_state("Battery SOC"), 48)
+
+        # a new server of the same model starts with a clean plan
+        client = IllegalAddressClient({52, 55})
+        inv = self.make_server(client)
+        inv.read_batches()
+        self.assertEqual(len(client.reads), len(inv.holding_batches) + len(inv.input_batches))
+
+    def test_split_batch_is_learned_and_persisted(self):
+        class SpanLimitedClient(IllegalAddressClient):
+            """Answers Illegal Data Address for input reads across address 60, which is readable itself."""
+
+            def read(self, address, count, slave_id, register_type):
+                if register_type == RegisterTypes.INPUT_REGISTER and address < 60 < address + count:
+                    self.reads.append((address, count, register_type))
+                    return ExceptionResponse(0x04, 2)
+                return super().read(address, count, slave_id, register_type)
+
+        client = SpanLimitedClient(set())
+        inv = self.make_server(client)
+        self.assertTrue(any(59 in batch and 60 in batch for batch in inv.input_batches))
+
+        inv.read_batches()
+
+        self.assertEqual(inv.illegal_addresses[RegisterTypes.INPUT_REGISTER], set())
+        self.assertEqual(inv.batch_breaks[RegisterTypes.INPUT_REGISTER], {60})
+        for batch in inv.input_batches:
+            self.assertFalse(batch[0] < 60 <= batch[-1])
+        self.assertEqual(inv.read_from_state("Battery SOC"), 48)
+
+        # the next cycle reads the new plan without bisecting
+        client.reads.clear()
+        inv.read_batches()
+        self.assertEqual(len(client.reads), len(inv.holding_batches) + len(inv.input_batches))
+
+        # and so does a new server of the same model
+        client = SpanLimitedClient(set())
+        inv = self.make_server(client)
+        inv.read_batches()
+        self.assertEqual(len(client.reads), len(inv.holding_batches) + len(inv.input_batches))
+
+    def test_servers_of_a_model_merge_learned_addresses(self):
+        first = self.make_server(IllegalAddressClient({52}))
+        second = self.make_server(IllegalAddressClient({55}))  # started before the first learned anything
+        first.read_batches()
+        second.read_batches()
+
+        self.assertEqual(load_illegal_addresses("PBD250")[RegisterTypes.INPUT_REGISTER], {52, 55})
+
+    def test_other_exceptions_raise(self):
+        class BusyClient(IllegalAddressClient):
+            def read(self, address, count, slave_id, register_type):
+                return ExceptionResponse(0x03, 6)
+
+        inv = self.make_server(BusyClient(set()))
+        with self.assertRaises(Exception):
+            inv.read_batches()
+
+
+class TestPollClasses(unittest.TestCase):
+    def setUp(self):
+        self.client = IllegalAddressClient(set())
+        self.inv = AtessInverter("test", "", 1, self.client)
+        self.inv.model = "PCS500"
+        self.inv.setup_valid_registers_for_model()
+        self.inv.find_register_extent()
+        self.inv.create_batches()
+
+    def test_registry_poll_classes(self):
+        self.assertEqual(self.inv.poll_classes["Serial Number"], PollClass.STATIC)
+        self.assertEqual(self.inv.poll_classes["Battery Power"], PollClass.REALTIME)
+        self.assertEqual(self.inv.poll_classes["Mode selection"], PollClass.SLOW)
+
+    def test_tier_plans_cover_tier_parameters(self):
+        for name, poll_class in self.inv.poll_classes.items():
+            param = self.inv.all_parameters[name]
+            covered = {
+                a for b in self.inv.batch_plan[poll_class][param["register_type"]] for a in b
+            }
+            self.assertTrue(set(range(param["addr"], param["addr"] + param["count"])) <= covered, name)
+
+    def test_poll_due(self):
+        periods = {PollClass.REALTIME: 0, PollClass.SLOW: 3600, PollClass.STATIC: None}
+        self.assertEqual(self.inv.poll_due(periods), list(PollClass))
+        self.assertEqual(self.inv.poll_due(periods), [PollClass.REALTIME])
+
+    def test_static_state_kept(self):
+        self.inv.read_batches()
+        serial = self.inv.read_from_state("Serial Number")
+        self.client.reads.clear()
+        self.inv.read_batches([PollClass.REALTIME])
+        self.assertEqual(self.inv.read_from_state("Serial Number"), serial)
+        self.assertNotIn(181, [a for a, _, rt in self.client.reads if rt == RegisterTypes.HOLDING_REGISTER])
+
+
+class PCS500Client(IllegalAddressClient):
+    """Reports Device Type Code 21025 (PCS500)."""
+
+    def read(self, address, count, slave_id, register_type):
+        if register_type == RegisterTypes.HOLDING_REGISTER and address == 44 and count == 1:
+            self.reads.append((address, count, register_type))
+            return SpoofClient.SpoofResponse([21025])
+        return super().read(address, count, slave_id, register_type)
+
+
+class TestPlanCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = persistence.DATA_DIR
+        persistence.DATA_DIR = self.tmp.name
+
+    def tearDown(self):
+        persistence.DATA_DIR = self.data_dir
+        self.tmp.cleanup()
+
+    def test_cold_start_uses_cached_plan(self):
+        first = AtessInverter("test", "", 1, PCS500Client(set()))
+        first.connect()
+
+        second = AtessInverter("test", "", 1, PCS500Client(set()))
+        second.setup_valid_registers_for_model = None  # must not be needed
+        second.connect()
+
+        self.assertEqual(second.model, "PCS500")
+        self.assertEqual(second.plan_state(), first.plan_state())
+        second.read_batches()
+        self.assertEqual(second.read_from_state("Battery SOC"), 48)
+
+    def test_reconnect_is_single_probe(self):
+        client = PCS500Client(set())
+        inv = AtessInverter("test", "", 1, client)
+        inv.connect()
+        client.reads.clear()
+        inv.connect()
+        self.assertEqual(len(client.reads), 1)
+
+    def test_registry_fields_in_key(self):
+        registry = atess_param_registry.registry
+        key = registry_hash(registry)
+        self.assertEqual(registry_hash(list(registry)), key)
+        for change in ({"qos": 2}, {"retain": True}, {"poll_class": PollClass.STATIC}):
+            self.assertNotEqual(registry_hash([replace(registry[0], **change)] + registry[1:]), key, change)
+
+    def test_code_inputs_in_key(self):
+        inv = AtessInverter("test", "", 1, PCS500Client(set()))
+        inv.model = "PCS500"
+        key = inv.plan_cache_key()
+        with patch.dict(PCS_FAULT_ALARM_BITS[1], {15: "G1D15_Test_Fault"}):
+            self.assertNotEqual(inv.plan_cache_key(), key)
+        with patch("src.server.default_poll_class", lambda is_write_param: PollClass.SLOW):
+            self.assertNotEqual(inv.plan_cache_key(), key)
+        self.assertEqual(inv.plan_cache_key(), key)
+
+    def test_plans_kept_per_key(self):
+        save_plan("PCS500", "9600 baud", {"extent": 1})
+        save_plan("PCS500", "tcp", {"extent": 2})
+        self.assertEqual(load_plan("PCS500", "9600 baud"), {"extent": 1})
+        self.assertEqual(load_plan("PCS500", "tcp"), {"extent": 2})
+
+        save_plan("PCS500", "9600 baud", {"extent": 3})  # most recent, kept
+        for i in range(MAX_PLANS_PER_MODEL - 1):
+            save_plan("PCS500", f"key {i}", {"extent": i})
+        self.assertIsNone(load_plan("PCS500", "tcp"))
+        self.assertEqual(load_plan("PCS500", "9600 baud"), {"extent": 3})
+
+    def test_learned_illegal_address_invalidates_plan(self):
+        inv = AtessInverter("test", "", 1, PCS500Client({48}))
+        inv.connect()
+        inv.read_batches()
+
+        second = AtessInverter("test", "", 1, PCS500Client({48}))
+        second.connect()
+        self.assertNotIn("Battery SOC", second.parameters)
+
+
+
+class AsyncAddressClient(IllegalAddressClient):
+    async def read_async(self, address, count, slave_id, register_type):
+        await asyncio.sleep(0)
+        return self.read(address, count, slave_id, register_type)
+
+
+class TestReadBatchesAsync(unittest.TestCase):
+    def test_async_matches_sync(self):
+        servers = []
+        for client in (IllegalAddressClient(set()), AsyncAddressClient(set())):
+            inv = AtessInverter("test", "", 1, client)
+            inv.model = "PCS500"
+            inv.setup_valid_registers_for_model()
+            inv.find_register_extent()
+            inv.create_batches()
+            servers.append(inv)
+
+        servers[0].read_batches()
+        asyncio.run(servers[1].read_batches_async())
+        self.assertEqual(servers[0].holding_state, servers[1].holding_state)
+        self.assertEqual(servers[0].input_state, servers[1].input_state)
+        self.assertEqual(servers[0].connected_client.reads, servers[1].connected_client.reads)
+
+
+class ScrambledClient(IllegalAddressClient):
+    """Answers pseudo-random register values covering sign bits and both bytes, and "AB" for the strings."""
+
+    strings = {RegisterTypes.HOLDING_REGISTER: range(181, 186), RegisterTypes.INPUT_REGISTER: range(271, 281)}
+
+    def read(self, address, count, slave_id, register_type):
+        self.reads.append((address, count, register_type))
+        return SpoofClient.SpoofResponse([
+            0x4142 if a in self.strings[register_type] else (a * 40503 + register_type.value) & 0xFFFF
+            for a in range(address, address + count)
+        ])
+
+
+class TestDecodePlan(unittest.TestCase):
+    def test_decode_all_matches_read_from_state(self):
+        for model in ("PCS500", "PBD250", "HPS150"):
+            inv = AtessInverter("test", "", 1, ScrambledClient(set()))
+            inv.model = model
+            inv.setup_valid_registers_for_model()
+            inv.find_register_extent()
+            inv.create_batches()
+            inv.read_batches()
+
+            decoded = inv.decode_all()
+            self.assertEqual(
+                decoded, {name: inv.read_from_state(name) for name in inv.all_parameters}, model)
+            self.assertIn("Serial Number", inv.decode_plan.fallback)
+
+    def test_state_written_in_place(self):
+        inv = AtessInverter("test", "", 1, ScrambledClient(set()))
+        inv.model = "PBD250"
+        inv.setup_valid_registers_for_model()
+        inv.find_register_extent()
+        inv.create_batches()
+        holding_state, input_state = inv.holding_state, inv.input_state
+        inv.read_batches()
+        first = inv.decode_all()
+        inv.read_batches()
+
+        self.assertIs(inv.holding_state, holding_state)
+        self.assertIs(inv.input_state, input_state)
+        self.assertEqual(inv.decode_all(), first)
+
+
+class TestFaults(unittest.TestCase):
+    def setUp(self):
+        self.inv = AtessInverter("test", "", 1, ScrambledClient(set()))
+        self.inv.model = "PCS500"
+        self.inv.setup_valid_registers_for_model()
+        self.inv.find_register_extent()
+        self.inv.create_batches()
+        self.inv.read_batches()
+
+    def test_masks_match_bitwise_decoding(self):
+        active = []
+        for group_num, bit_map in PCS_FAULT_ALARM_BITS.items():
+            raw = self.inv.input_state[181 + group_num - self.inv.input_addr_extent[0]]
+            swapped = ((raw & 0xFF) << 8) | (raw >> 8)
+            active += [coerce_fault_name_key(name) for bit, name in sorted(bit_map.items()) if name and swapped >> bit & 1]
+        self.assertTrue(active)
+        self.assertEqual(self.inv.decode_faults()[0], active)
+
+    def test_changes_only(self):
+        first = self.inv.decode_fault_changes()
+        self.assertEqual(first, self.inv.decode_faults())
+        self.assertIsNone(self.inv.decode_fault_changes())
+
+        self.inv.input_state[182 - self.inv.input_addr_extent[0]] = 0
+        self.assertNotEqual(self.inv.decode_fault_changes(), first)
+        self.assertIsNone(self.inv.decode_fault_changes())
+
+        self.inv._fault_words = None  # as after connecting
+        self.assertIsNotNone(self.inv.decode_fault_changes())
+
+
+if __name__ == "__main__":
+    unittest.main()
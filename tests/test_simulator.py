@@ -0,0 +1,98 @@
+import asyncio
+import contextlib
+import io
+import logging
+import socket
+import tempfile
+import threading
+import unittest
+
+import src.persistence as persistence
+from src.atess_inverter import AtessInverter
+from src.client import Client
+from src.enums import RegisterTypes
+from src.options import ModbusTCPOptions
+from src.simulator import SimulatorOptions, build_context, build_device, parse_args, serve_tcp
+
+logging.disable(logging.CRITICAL)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestSimulator(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = persistence.DATA_DIR
+        persistence.DATA_DIR = self.tmp.name
+
+        self.event_loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.event_loop.run_forever, daemon=True)
+        self.loop_thread.start()
+
+        self.devices = {
+            1: build_device("PCS500", "USD0B4502B", options=SimulatorOptions(seed=1)),
+            2: build_device(
+                "PBD250",
+                "UMD0C37086",
+                options=SimulatorOptions(seed=2),
+                illegal_addresses={RegisterTypes.INPUT_REGISTER: {52}, RegisterTypes.HOLDING_REGISTER: set()},
+            ),
+        }
+        self.port = free_port()
+        self.server = asyncio.run_coroutine_threadsafe(
+            serve_tcp(build_context(self.devices), port=self.port), self.event_loop).result()
+        self.client = Client(ModbusTCPOptions("sim", "TCP", "127.0.0.1", self.port))
+
+    def tearDown(self):
+        self.client.close()
+        asyncio.run_coroutine_threadsafe(self.server.shutdown(), self.event_loop).result()
+        self.event_loop.call_soon_threadsafe(self.event_loop.stop)
+        self.loop_thread.join()
+        persistence.DATA_DIR = self.data_dir
+        self.tmp.cleanup()
+
+    def test_model_detection_and_decoding(self):
+        pcs = AtessInverter("AtessPCS", "USD0B4502B", 1, self.client)
+        pcs.connect()
+        self.assertEqual(pcs.model, "PCS500")
+
+        pcs.read_batches()
+        self.assertEqual(pcs.read_from_state("Serial Number"), "USD0B4502B")
+        self.assertAlmostEqual(pcs.read_from_state("Battery SOC"), 60, delta=60 * 0.06)
+        self.assertAlmostEqual(pcs.read_from_state("Battery Voltage"), 400, delta=400 * 0.06)
+        self.assertEqual(pcs.decode_faults()[0], [])
+
+    def test_illegal_address_is_learned(self):
+        pbd = AtessInverter("AtessPBD1", "UMD0C37086", 2, self.client)
+        pbd.connect()
+        self.assertEqual(pbd.model, "PBD250")
+
+        pbd.read_batches()
+        self.assertEqual(pbd.illegal_addresses[RegisterTypes.INPUT_REGISTER], {52})
+        self.assertNotIn("PV1 Power", pbd.parameters)
+
+    def test_writes_are_kept(self):
+        pcs = AtessInverter("AtessPCS", "USD0B4502B", 1, self.client)
+        pcs.connect()
+        pcs.write_registers("discharge_cutoff_soc", "25")
+        self.assertEqual(pcs.read_registers("Discharge Cutoff SOC"), 25)
+
+    def test_exception_injection(self):
+        device = build_device("PCS500", options=SimulatorOptions(exception_rate=1.0))
+        self.assertEqual(device.getValues(4, 0, 10), 6)
+
+    def test_invalid_exception_code(self):
+        with self.assertRaises(ValueError):
+            SimulatorOptions(exception_code=9)
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()) as stderr:
+            parse_args(["PCS500", "--exception-code", "9"])
+        self.assertIn("invalid exception code '9'", stderr.getvalue())
+        self.assertEqual(parse_args(["PCS500", "--exception-code", "2"]).exception_code, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()